@@ -0,0 +1,318 @@
+"""
+build_lite_subset.py
+====================
+Rank-preserving core-set ("lite") benchmark builder.
+
+Reads the existing results_{Attack}_{model}.jsonl of many models and picks a
+few hundred base ids per dataset whose metrics match the full benchmark. The
+metrics are WLA, median error and TBS per (model, attack), plus the WLA drop
+of each attack against Original. The ordering of the models on every metric
+must also match. The subset is then written as a subset manifest (see
+evaluation/subset.py), for quick regression checks of new checkpoints:
+
+    python evaluate.py ... --subset .../metadata/im2gps3k_lite.json
+    python run_pipeline.py --dataset im2gps3k --stage evaluate --model new-ckpt --subset lite
+
+Selection:
+  1. The candidates are the base ids with an Original row from every model
+     (minus invalid_ids.json).
+  2. They are stratified by taxonomy tier (taxonomy_labels.jsonl from
+     classify_taxonomy.py; "untiered" without a label) × GEO_DEG-degree
+     lat/lon bin of the ground truth. Each stratum gets its proportional share
+     of the size (largest remainder).
+  3. `--candidates` seeded stratified draws are scored, and the best one is
+     refined by random swaps within a stratum that lower the score.
+
+The score is the mean deviation of the metrics from the full set, in units of
+TOLERANCES, plus RANK_WEIGHT × the share of model pairs the subset orders
+differently. Model pairs that tie on the full set don't count. The manifest
+records the strata, the seed, the rank agreement (Kendall tau) and both sets
+of metrics, so the fidelity can be checked.
+
+Usage:
+    python build_lite_subset.py --datasets im2gps3k yfcc4k googlesv --size 300
+    python build_lite_subset.py --datasets im2gps3k --size 200 --models qwen3-30b,gpt-4o,qwen3-8b --name lite200
+"""
+
+import argparse
+import json
+import os
+import warnings
+from collections import defaultdict
+
+import numpy as np
+
+from compute_results import entry_base_id
+from evaluate import load_invalid_ids
+from evaluation.adaptive import stratum_of
+from evaluation.manifest import SampleManifest, default_manifest_path
+from evaluation.metric_calculator import MetricCalculator
+from evaluation.subset import DEFAULT_SUBSET, save_subset, subset_path
+
+ATTACKS = ['Original', 'Similar', 'Random', 'Adversarial']
+METRICS = ['WLA', 'MedErr', 'TBS', 'dWLA']
+
+# Size (degrees) of the lat/lon bins of the geographic strata
+GEO_DEG = 60
+# Deviation that counts as 1 in the score: WLA points, log median error, TBS km, WLA drop points
+TOLERANCES = {'WLA': 1.0, 'MedErr': 0.1, 'TBS': 100.0, 'dWLA': 1.0}
+# Weight of the share of discordant model pairs
+RANK_WEIGHT = 5.0
+
+
+def discover_models(results_dir):
+    """Models with Original results in a dataset's results dir."""
+    if not os.path.isdir(results_dir):
+        return []
+    return sorted(f[len("results_Original_"):-len(".jsonl")] for f in os.listdir(results_dir)
+                  if f.startswith("results_Original_") and f.endswith(".jsonl"))
+
+
+def _read_rows(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def load_errors(results_dir, models, manifest=None, invalid_ids=()):
+    """
+    Errors of every model on every attack, per candidate base id.
+    Returns (base_ids, gt [N, 2], errors [models, attacks, N]); NaN = failed or not evaluated.
+    """
+    per_model = []
+    for model in models:
+        by_attack = []
+        for attack in ATTACKS:
+            errors = {}
+            for entry in _read_rows(os.path.join(results_dir, f"results_{attack}_{model}.jsonl")):
+                base_id = entry_base_id(entry, manifest)
+                errors[base_id] = (entry.get('error_km'), entry.get('gt_lat'), entry.get('gt_lon'))
+            by_attack.append(errors)
+        per_model.append(by_attack)
+
+    candidates = set.intersection(*(set(m[0]) for m in per_model)) - set(invalid_ids)
+    base_ids = sorted(b for b in candidates if per_model[0][0][b][1] is not None)
+    gt = np.array([per_model[0][0][b][1:] for b in base_ids], dtype=float).reshape(-1, 2)
+    errors = np.full((len(models), len(ATTACKS), len(base_ids)), np.nan)
+    for m, by_attack in enumerate(per_model):
+        for a, rows in enumerate(by_attack):
+            for i, base_id in enumerate(base_ids):
+                row = rows.get(base_id)
+                if row is not None and row[0] is not None:
+                    errors[m, a, i] = row[0]
+    return base_ids, gt, errors
+
+
+def load_tiers(dataset_dir):
+    """base_id -> taxonomy tier (T1/T2/T3) from classify_taxonomy.py's labels."""
+    tiers = {}
+    for entry in _read_rows(os.path.join(dataset_dir, 'taxonomy_labels.jsonl')):
+        if entry.get('base_id'):
+            tiers[entry['base_id']] = entry.get('tier') or "untiered"
+    return tiers
+
+
+def stratify(base_ids, gt, tiers, deg=GEO_DEG):
+    """Stratum label of every base id: tier / lat bin / lon bin."""
+    labels = []
+    for base_id, (lat, lon) in zip(base_ids, gt):
+        lat_bin, lon_bin = stratum_of(lat, lon, deg)
+        labels.append(f"{tiers.get(base_id, 'untiered')}/lat{lat_bin * deg - 90:+d}/lon{lon_bin * deg - 180:+d}")
+    return labels
+
+
+def allocate(sizes, size):
+    """Proportional share of `size` per stratum (largest remainder), never above the stratum size."""
+    total = sum(sizes.values())
+    quotas = {s: size * n / total for s, n in sizes.items()}
+    alloc = {s: min(sizes[s], int(q)) for s, q in quotas.items()}
+    for s in sorted(quotas, key=lambda s: quotas[s] - int(quotas[s]), reverse=True):
+        if sum(alloc.values()) >= size:
+            break
+        if alloc[s] < sizes[s]:
+            alloc[s] += 1
+    return alloc
+
+
+def metrics_of(errors):
+    """{metric: [models, attacks]} of errors [models, attacks, n], as compute_results.py reports them."""
+    with np.errstate(invalid='ignore'):
+        wla = np.where(np.isnan(errors), np.nan, MetricCalculator.wla_batch(errors))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # all-NaN cells
+        out = {
+            'WLA': np.nanmean(wla, axis=-1) * 100,
+            'MedErr': np.nanmedian(errors, axis=-1),
+            'TBS': np.nanmean(MetricCalculator.tbs_batch(errors[:, :1], errors), axis=-1),
+        }
+    out['TBS'][:, 0] = np.nan
+    out['dWLA'] = out['WLA'] - out['WLA'][:, :1]
+    out['dWLA'][:, 0] = np.nan
+    return out
+
+
+def discordance(full, sub):
+    """Share of model pairs ordered differently, over the pairs that differ on the full set (NaN: none)."""
+    i, j = np.triu_indices(len(full), k=1)
+    full_sign = np.sign(full[i] - full[j])
+    sub_sign = np.sign(sub[i] - sub[j])
+    counted = (full_sign != 0) & ~np.isnan(full_sign) & ~np.isnan(sub_sign)
+    if not counted.any():
+        return np.nan
+    return float(np.mean(full_sign[counted] != sub_sign[counted]))
+
+
+def score(full, sub):
+    """Mean metric deviation in TOLERANCES units + RANK_WEIGHT × mean discordance."""
+    deviations, discordant = [], []
+    for metric in METRICS:
+        f, s = full[metric], sub[metric]
+        if metric == 'MedErr':
+            f, s = np.log(np.maximum(f, 1e-3)), np.log(np.maximum(s, 1e-3))
+        dev = np.abs(f - s) / TOLERANCES[metric]
+        deviations.append(np.where(np.isnan(f), np.nan, np.nan_to_num(dev, nan=10.0)))
+        for a in range(len(ATTACKS)):
+            discordant.append(discordance(f[:, a], s[:, a]))
+    deviation = np.nanmean(np.concatenate([d.ravel() for d in deviations]))
+    rank = np.nanmean(discordant) if not np.all(np.isnan(discordant)) else 0.0
+    return float(deviation + RANK_WEIGHT * rank)
+
+
+def select_core_set(errors, labels, size, candidates=64, swaps=3000, seed=0):
+    """Indices of the selected base ids and their score (see the module docstring)."""
+    rng = np.random.default_rng(seed)
+    members = defaultdict(list)
+    for i, label in enumerate(labels):
+        members[label].append(i)
+    alloc = allocate({s: len(m) for s, m in members.items()}, size)
+    full = metrics_of(errors)
+
+    def draw():
+        return np.concatenate([rng.choice(members[s], k, replace=False) for s, k in alloc.items() if k])
+
+    best, best_score = None, np.inf
+    for _ in range(candidates):
+        picked = draw()
+        s = score(full, metrics_of(errors[..., picked]))
+        if s < best_score:
+            best, best_score = picked, s
+
+    selected = np.zeros(len(labels), dtype=bool)
+    selected[best] = True
+    for _ in range(swaps):
+        pos = rng.integers(len(best))
+        pool = [i for i in members[labels[best[pos]]] if not selected[i]]
+        if not pool:
+            continue
+        trial = best.copy()
+        trial[pos] = pool[rng.integers(len(pool))]
+        s = score(full, metrics_of(errors[..., trial]))
+        if s < best_score:
+            selected[best[pos]], selected[trial[pos]] = False, True
+            best, best_score = trial, s
+    return np.sort(best), best_score
+
+
+def _round(x, digits=2):
+    return None if np.isnan(x) else round(float(x), digits)
+
+
+def build_subset(dataset, dataset_dir, models, size, candidates, swaps, seed, name):
+    """Select the core-set of one dataset and write its subset manifest. Returns the path, or None."""
+    results_dir = os.path.join(dataset_dir, 'results')
+    manifest_path = default_manifest_path(dataset_dir, dataset)
+    manifest = SampleManifest(manifest_path) if manifest_path else None
+    models = models or discover_models(results_dir)
+    if len(models) < 2:
+        print(f"[{dataset}] Need results of at least 2 models in {results_dir}, found {len(models)}; skipping")
+        return None
+    base_ids, gt, errors = load_errors(results_dir, models, manifest, load_invalid_ids())
+    if manifest is not None:
+        manifest.close()
+    print(f"[{dataset}] {len(base_ids)} base ids evaluated by all of {len(models)} models: {', '.join(models)}")
+    if not base_ids:
+        print(f"[{dataset}] No base id has an Original row from every model; skipping")
+        return None
+    if len(base_ids) <= size:
+        print(f"[{dataset}] Not more than {size} base ids; the subset is the full set")
+
+    labels = stratify(base_ids, gt, load_tiers(dataset_dir))
+    picked, fit = select_core_set(errors, labels, min(size, len(base_ids)), candidates, swaps, seed)
+    full, lite = metrics_of(errors), metrics_of(errors[..., picked])
+
+    rank_agreement = {}
+    for a, attack in enumerate(ATTACKS):
+        taus = {m: _round(1 - 2 * discordance(full[m][:, a], lite[m][:, a]), 3) for m in METRICS
+                if not np.all(np.isnan(full[m][:, a]))}
+        rank_agreement[attack] = {m: t for m, t in taus.items() if t is not None}
+    strata = defaultdict(lambda: {"selected": 0, "total": 0})
+    for label in labels:
+        strata[label]["total"] += 1
+    for i in picked:
+        strata[labels[i]]["selected"] += 1
+
+    subset = {
+        "dataset": dataset,
+        "name": name,
+        "size": len(picked),
+        "candidates": len(base_ids),
+        "seed": seed,
+        "geo_deg": GEO_DEG,
+        "models": models,
+        "score": round(fit, 4),
+        "rank_agreement": rank_agreement,
+        "metrics": {model: {attack: {"full": {m: _round(full[m][i, a]) for m in METRICS},
+                                     "lite": {m: _round(lite[m][i, a]) for m in METRICS}}
+                            for a, attack in enumerate(ATTACKS) if not np.isnan(full['MedErr'][i, a])}
+                    for i, model in enumerate(models)},
+        "strata": dict(sorted(strata.items())),
+        "base_ids": [base_ids[i] for i in picked],
+    }
+    path = subset_path(dataset_dir, dataset, name)
+    save_subset(path, subset)
+
+    print(f"[{dataset}] Selected {len(picked)} base ids from {len(strata)} strata (score {fit:.3f})")
+    print(f"{'Attack':<13} " + " ".join(f"{'tau ' + m:>11}" for m in METRICS))
+    for attack, taus in rank_agreement.items():
+        print(f"{attack:<13} " + " ".join(f"{taus[m]:>11.3f}" if m in taus else f"{'-':>11}" for m in METRICS))
+    for m in METRICS:
+        with np.errstate(invalid='ignore'):
+            dev = np.nanmax(np.abs(full[m] - lite[m])) if not np.all(np.isnan(full[m])) else np.nan
+        if not np.isnan(dev):
+            print(f"  max |{m} full - lite|: {dev:.2f}")
+    print(f"[{dataset}] Subset manifest saved to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a rank-preserving core-set (lite) subset of SIGNPOST-Bench")
+    parser.add_argument("--base-dir", type=str, default="/home/nas/lsr/Data/SIGNPOST-Bench",
+                        help="Base directory containing dataset result folders (default: %(default)s)")
+    parser.add_argument("--datasets", nargs='+', default=['im2gps3k', 'yfcc4k', 'googlesv'],
+                        help="Datasets to build subsets for (default: im2gps3k yfcc4k googlesv)")
+    parser.add_argument("--models", type=str, default=None,
+                        help="Comma-separated models whose results guide the selection (default: every model "
+                             "with results_Original_*.jsonl)")
+    parser.add_argument("--size", type=int, default=300, help="Base ids per dataset (default: %(default)s)")
+    parser.add_argument("--name", type=str, default=DEFAULT_SUBSET,
+                        help="Subset name: written to metadata/<dataset>_<name>.json (default: %(default)s)")
+    parser.add_argument("--candidates", type=int, default=64,
+                        help="Stratified random draws scored before refinement (default: %(default)s)")
+    parser.add_argument("--swaps", type=int, default=3000,
+                        help="Within-stratum swaps tried to refine the best draw (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: %(default)s)")
+    args = parser.parse_args()
+
+    models = [m.strip() for m in args.models.split(',') if m.strip()] if args.models else None
+    for dataset in args.datasets:
+        build_subset(dataset, os.path.join(args.base_dir, dataset), models, args.size,
+                     args.candidates, args.swaps, args.seed, args.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,11 @@ import os
 import sys
 import argparse
 import numpy as np
+from evaluation.coord_parser import reparse_row
+from evaluation.manifest import SampleManifest, default_manifest_path, result_base_id
 from evaluation.metric_calculator import MetricCalculator
 
 
-def calculate_wla(error_km):
-    return MetricCalculator.calculate_wla(error_km)
-
-
 def get_base_id(filename):
     # e.g. "1114595220_similar_HunTed.png" -> "1114595220"
     # e.g. "482249918.jpg" -> "482249918"
@@ -18,7 +16,15 @@ def get_base_id(filename):
     return base.split('_')[0]
 
 
-def analyze_results(res_dir):
+def entry_base_id(entry, manifest=None):
+    base_id = result_base_id(entry, manifest)
+    if base_id is None:
+        original_source = entry.get('original_source')
+        base_id = get_base_id(original_source) if original_source else get_base_id(entry['filename'])
+    return base_id
+
+
+def analyze_results(res_dir, manifest=None, reparse=False):
     attacks = ['Original', 'Similar', 'Random', 'Adversarial']
     out_data = {}
     
@@ -60,13 +66,11 @@ def analyze_results(res_dir):
                 for line in f:
                     try:
                         entry = json.loads(line)
+                        if reparse:
+                            entry = reparse_row(entry)
                         err = entry.get('error_km')
                         if err is not None:
-                            original_source = entry.get('original_source')
-                            if original_source:
-                                base_id = get_base_id(original_source)
-                            else:
-                                base_id = get_base_id(entry['filename'])
+                            base_id = entry_base_id(entry, manifest)
                             if base_id not in invalid_ids:
                                 original_errors[base_id] = err
                     except: pass
@@ -77,34 +81,33 @@ def analyze_results(res_dir):
             if not os.path.exists(fpath): continue
             
             errors = []
-            tbs_list = []
+            # Paired (clean error, attacked error) per base id, for TBS
+            tbs_clean, tbs_adv = [], []
             
             with open(fpath, 'r', encoding='utf-8') as f:
                 for line in f:
                     try:
                         entry = json.loads(line)
+                        if reparse:
+                            entry = reparse_row(entry)
                         err = entry.get('error_km')
                         if err is not None:
                             errors.append(err)
                             
                             # Calculate TBS
-                            original_source = entry.get('original_source')
-                            if original_source:
-                                base_id = get_base_id(original_source)
-                            else:
-                                base_id = get_base_id(entry['filename'])
-                                
+                            base_id = entry_base_id(entry, manifest)
                             if base_id in invalid_ids: continue
                                 
                             orig_err = original_errors.get(base_id)
                             if orig_err is not None:
-                                tbs_list.append(err - orig_err)
+                                tbs_clean.append(orig_err)
+                                tbs_adv.append(err)
                     except: pass
             
             if errors:
-                wla = sum([calculate_wla(e) for e in errors]) / len(errors) * 100
+                wla = float(MetricCalculator.wla_batch(errors).mean()) * 100
                 med_err = np.median(errors)
-                mean_tbs = np.mean(tbs_list) if tbs_list else 0.0
+                mean_tbs = MetricCalculator.tbs_batch(tbs_clean, tbs_adv).mean() if tbs_adv else 0.0
                 out_data[m][a] = {
                     'WLA': round(wla, 2), 
                     'MedErr': round(float(med_err), 2), 
@@ -122,6 +125,8 @@ def main():
                         help="Datasets to compute results for (default: im2gps3k yfcc4k googlesv)")
     parser.add_argument("--output", type=str, default=None,
                         help="Output JSON file path (default: parsed_results.json in script directory)")
+    parser.add_argument("--reparse", action="store_true",
+                        help="Re-extract coordinates from prediction_text with the current parser before scoring")
     args = parser.parse_args()
 
     final_out = {}
@@ -133,7 +138,12 @@ def main():
         elif 'google' in ds.lower(): ds_display = 'GoogleSV'
         else: ds_display = ds.upper()
         
-        final_out[ds_display] = analyze_results(os.path.join(args.base_dir, ds, 'results'))
+        # Exact base-id joins through the dataset's sample manifest when it exists
+        manifest_path = default_manifest_path(os.path.join(args.base_dir, ds), ds)
+        manifest = SampleManifest(manifest_path) if manifest_path else None
+        final_out[ds_display] = analyze_results(os.path.join(args.base_dir, ds, 'results'), manifest, args.reparse)
+        if manifest is not None:
+            manifest.close()
 
     # Save the output file
     out_path = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parsed_results.json')
@@ -2,10 +2,7 @@
 compute_table.py - 从 paper/ 目录下的结果文件计算 Table 1 数据
 """
 import json, os, numpy as np
-
-def wla(d):
-    if d is None: return 0
-    return sum(0.2 for t in [1, 25, 200, 750, 2500] if d < t)
+from evaluation.metric_calculator import MetricCalculator
 
 all_results = {}
 for ds_name, ds_dir in [('IM2GPS3K', 'paper/im2gps3kresults'), ('YFCC4K', 'paper/yfcc4kresults')]:
@@ -20,14 +17,14 @@ for ds_name, ds_dir in [('IM2GPS3K', 'paper/im2gps3kresults'), ('YFCC4K', 'paper
                     try:
                         e = json.loads(line)
                         if e.get('error_km') is not None:
-                            base = os.path.splitext(e['filename'])[0]
+                            base = e.get('base_id') or os.path.splitext(e['filename'])[0]
                             orig_errors[base] = e['error_km']
                     except: pass
 
         for attack in ['Original', 'Similar', 'Random', 'Adversarial']:
             fpath = f'{ds_dir}/results_{attack}_{model}.jsonl'
             if not os.path.exists(fpath): continue
-            errors, tbs_list = [], []
+            errors, tbs_clean, tbs_adv = [], [], []
             with open(fpath, encoding='utf-8') as f:
                 for line in f:
                     try:
@@ -36,18 +33,20 @@ for ds_name, ds_dir in [('IM2GPS3K', 'paper/im2gps3kresults'), ('YFCC4K', 'paper
                         if err is not None:
                             errors.append(err)
                             orig_src = str(e.get('original_source', ''))
-                            orig_err = orig_errors.get(orig_src) or orig_errors.get(os.path.splitext(orig_src)[0])
+                            orig_err = (orig_errors.get(e.get('base_id')) or orig_errors.get(orig_src)
+                                        or orig_errors.get(os.path.splitext(orig_src)[0]))
                             if orig_err is not None:
-                                tbs_list.append(err - orig_err)
+                                tbs_clean.append(orig_err)
+                                tbs_adv.append(err)
                     except: pass
             if errors:
-                w = sum(wla(e) for e in errors) / len(errors) * 100
+                w = float(MetricCalculator.wla_batch(errors).mean()) * 100
                 med = float(np.median(errors))
-                tbs = float(np.mean(tbs_list)) if tbs_list else None
+                tbs = float(MetricCalculator.tbs_batch(tbs_clean, tbs_adv).mean()) if tbs_adv else None
                 all_results[ds_name][model][attack] = {
                     'WLA': round(w, 1), 'MedErr': round(med, 1),
                     'TBS': round(tbs, 1) if tbs else None,
-                    'N': len(errors), 'tbs_pairs': len(tbs_list)
+                    'N': len(errors), 'tbs_pairs': len(tbs_adv)
                 }
 
 # Print table
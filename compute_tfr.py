@@ -19,12 +19,17 @@ import json
 import os
 import re
 import time
-import math
 import argparse
 from collections import defaultdict
+
+import numpy as np
 from urllib.request import urlopen, Request
 from urllib.parse import quote
 
+from evaluation.coord_parser import parse_coordinates
+from evaluation.manifest import SampleManifest, default_manifest_path, result_base_id
+from evaluation.metric_calculator import MetricCalculator
+
 # ==================== Configuration ====================
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
 TRAP_RADIUS_KM = 50
@@ -33,19 +38,6 @@ USER_AGENT = "SIGNPOST-Bench/1.0 (research benchmark)"
 RATE_LIMIT_SECONDS = 1.1  # Nominatim requires max 1 req/sec
 
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate the great circle distance (km) between two points."""
-    try:
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        return 6371 * c
-    except Exception:
-        return None
-
-
 def load_geocode_cache(base_dir):
     """Load previously geocoded results to avoid re-querying."""
     cache_path = os.path.join(base_dir, GEOCODE_CACHE_FILE)
@@ -110,7 +102,7 @@ def get_base_id(filename):
     return base.split('_')[0]
 
 
-def compute_tfr(dataset_name, dataset_dir, model_short, base_dir, tier_filter=None):
+def compute_tfr(dataset_name, dataset_dir, model_short, base_dir, tier_filter=None, manifest=None, reparse=False):
     """Compute TFR for a specific dataset and model."""
     
     # 1. Load taxonomy labels
@@ -162,23 +154,25 @@ def compute_tfr(dataset_name, dataset_dir, model_short, base_dir, tier_filter=No
         print(f"  Error: {results_file} not found.")
         return None
     
-    # 5. Compute TFR
-    total_geocodable = 0
-    total_trapped = 0
-    tfr_details = []
+    # 5. Collect (prediction, trap) pairs, then score them in one vectorized pass
+    pairs = []  # (base_id, adv_text, pred_lat, pred_lon, trap_lat, trap_lon)
     
     with open(results_file, 'r', encoding='utf-8') as f:
         for line in f:
             entry = json.loads(line)
-            pred_lat = entry.get('pred_lat')
-            pred_lon = entry.get('pred_lon')
+            if reparse:
+                pred_lat, pred_lon = parse_coordinates(entry.get('prediction_text'))
+            else:
+                pred_lat, pred_lon = entry.get('pred_lat'), entry.get('pred_lon')
             
             if pred_lat is None or pred_lon is None:
                 continue
             
-            # Get base_id
-            orig_source = entry.get('original_source')
-            base_id = get_base_id(orig_source) if orig_source else get_base_id(entry['filename'])
+            # Get base_id (exact from the manifest when available)
+            base_id = result_base_id(entry, manifest)
+            if base_id is None:
+                orig_source = entry.get('original_source')
+                base_id = get_base_id(orig_source) if orig_source else get_base_id(entry['filename'])
             
             # Check if this ID is in our target set
             if base_id not in target_ids:
@@ -194,22 +188,26 @@ def compute_tfr(dataset_name, dataset_dir, model_short, base_dir, tier_filter=No
             if cached is None or not isinstance(cached, dict):
                 continue
             
-            trap_lat, trap_lon = cached['lat'], cached['lon']
-            total_geocodable += 1
-            
-            # Check if prediction falls within trap radius
-            dist_to_trap = haversine_distance(pred_lat, pred_lon, trap_lat, trap_lon)
-            if dist_to_trap is not None and dist_to_trap < TRAP_RADIUS_KM:
-                total_trapped += 1
-                tfr_details.append({
-                    'base_id': base_id,
-                    'adv_text': adv_text,
-                    'trap_lat': trap_lat,
-                    'trap_lon': trap_lon,
-                    'pred_lat': pred_lat,
-                    'pred_lon': pred_lon,
-                    'dist_to_trap_km': round(dist_to_trap, 2)
-                })
+            pairs.append((base_id, adv_text, pred_lat, pred_lon, cached['lat'], cached['lon']))
+    
+    total_geocodable = len(pairs)
+    tfr_details = []
+    if pairs:
+        _, _, pred_lat, pred_lon, trap_lat, trap_lon = zip(*pairs)
+        dist_to_trap = MetricCalculator.haversine_batch(pred_lat, pred_lon, trap_lat, trap_lon)
+        # Check if predictions fall within trap radius
+        for i in np.flatnonzero(dist_to_trap < TRAP_RADIUS_KM):
+            base_id, adv_text, p_lat, p_lon, t_lat, t_lon = pairs[i]
+            tfr_details.append({
+                'base_id': base_id,
+                'adv_text': adv_text,
+                'trap_lat': t_lat,
+                'trap_lon': t_lon,
+                'pred_lat': p_lat,
+                'pred_lon': p_lon,
+                'dist_to_trap_km': round(float(dist_to_trap[i]), 2)
+            })
+    total_trapped = len(tfr_details)
     
     if total_geocodable == 0:
         print("  No geocodable adversarial texts found.")
@@ -251,6 +249,8 @@ def main():
                         help='Base directory')
     parser.add_argument('--all-tiers', action='store_true',
                         help='Compute TFR for all tiers (default: T3 only)')
+    parser.add_argument('--reparse', action='store_true',
+                        help='Re-extract predictions from prediction_text with the current coordinate parser')
     args = parser.parse_args()
     
     print("=" * 50)
@@ -258,14 +258,16 @@ def main():
     print("=" * 50)
     
     dataset_dir = os.path.join(args.base_dir, args.dataset)
+    manifest_path = default_manifest_path(dataset_dir, args.dataset)
+    manifest = SampleManifest(manifest_path) if manifest_path else None
     
     if args.all_tiers:
         for tier in ['T1', 'T2', 'T3']:
             print(f"\n--- Tier: {tier} ---")
-            compute_tfr(args.dataset, dataset_dir, args.model, args.base_dir, tier_filter=tier)
+            compute_tfr(args.dataset, dataset_dir, args.model, args.base_dir, tier_filter=tier, manifest=manifest, reparse=args.reparse)
     else:
         # Default: T3 only (most meaningful for TFR)
-        compute_tfr(args.dataset, dataset_dir, args.model, args.base_dir, tier_filter='T3')
+        compute_tfr(args.dataset, dataset_dir, args.model, args.base_dir, tier_filter='T3', manifest=manifest, reparse=args.reparse)
 
 
 if __name__ == '__main__':
@@ -2,12 +2,15 @@ import csv
 import json
 import argparse
 import os
+from evaluation.manifest import SampleManifest, original_record
 
 def main():
     parser = argparse.ArgumentParser(description="Convert User CSV Metadata to SIGNPOST-Bench Formats")
     parser.add_argument("--csv", type=str, required=True, help="Input CSV path (e.g. yfcc4k_metadata_address.csv)")
     parser.add_argument("--out-dir", type=str, required=True, help="Output directory for converted metadata")
     parser.add_argument("--dataset-name", type=str, default="yfcc4k", help="Dataset name prefix")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Sample manifest to write clean samples into (default: <out-dir>/<dataset>_manifest.sqlite)")
     args = parser.parse_args()
 
     os.makedirs(args.out_dir, exist_ok=True)
@@ -22,9 +25,12 @@ def main():
     #      Index 10: Longitude
     #      Index 11: Latitude
     #      Index 14: URL (path ending with filename)
+    # 3. <dataset>_manifest.sqlite (typed filename -> base id / GT map, see evaluation/manifest.py)
     
     jsonl_path = os.path.join(args.out_dir, f"{args.dataset_name}_clean_meta.jsonl")
     tsv_path = os.path.join(args.out_dir, f"{args.dataset_name}_gt.tsv")
+    manifest_path = args.manifest or os.path.join(args.out_dir, f"{args.dataset_name}_manifest.sqlite")
+    manifest_records = []
     
     print(f"Converting {args.csv}...")
     
@@ -75,10 +81,17 @@ def main():
                 dummy[14] = f"http://dummy/{filename}"
                 
                 f_tsv.write("\t".join(dummy) + "\n")
+
+                # 3. Manifest record
+                manifest_records.append(original_record(filename, float(lat), float(lon)))
                 count += 1
 
+    manifest = SampleManifest(manifest_path)
+    manifest.upsert(manifest_records)
+    manifest.close()
+
     print(f"Converted {count} entries.")
-    print(f"Saved to:\n  - {jsonl_path}\n  - {tsv_path}")
+    print(f"Saved to:\n  - {jsonl_path}\n  - {tsv_path}\n  - {manifest_path}")
     print("NOTE: Please check the CSV column names in the script if 0 entries were converted.")
 
 if __name__ == "__main__":
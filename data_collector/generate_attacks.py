@@ -10,6 +10,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from tqdm.asyncio import tqdm
 from data_collector.llm_provider import OpenAICompatibleProvider
+from evaluation.image_store import ImageDerivativeStore
+from evaluation.structured_output import ATTACK_SCHEMA
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Generate Adversarial Attacks using VLMs")
@@ -20,6 +22,13 @@ def parse_args():
     parser.add_argument("--api-base", type=str, default="http://localhost:8001/v1", help="API Base URL")
     parser.add_argument("--api-key", type=str, default="EMPTY", help="API Key for vLLM")
     parser.add_argument("--limit", type=int, default=0, help="Limit number of images processed")
+    parser.add_argument("--image-store", type=str, default=None,
+                        help="Shared derivative store (reuses JPEG/base64 transcodes across runs)")
+    parser.add_argument("--image-max-side", type=int, default=0,
+                        help="Longer-side size of the derivative to send, 0 = full resolution")
+    parser.add_argument("--structured", type=str, choices=["guided", "json_schema"], default=None,
+                        help="Constrain the output to the attack schema: vLLM guided_json (thinking models need "
+                             "--reasoning-parser) or an OpenAI json_schema response_format (default: off)")
     return parser.parse_args()
 
 
@@ -98,7 +107,8 @@ async def process_single_image(provider, image_path, original_filename, clean_im
     result = await provider.analyze_image_async(
         image_path=Path(image_path),
         prompt=prompt,
-        json_mode=True # Provider handles Thinking models automatically
+        json_mode=True, # Provider handles Thinking models automatically
+        json_schema=ATTACK_SCHEMA,  # Only used when the provider has a structured mode
     )
     
     if result.success and result.content:
@@ -107,7 +117,8 @@ async def process_single_image(provider, image_path, original_filename, clean_im
             attacks = attack_data.get("attacks", {})
             
             # Filter out if no text found / no attacks generated
-            if not attacks:
+            # (a schema-constrained answer always fills attacks, with a null original_text)
+            if not attacks or not attack_data.get("original_text"):
                 return None
                 
             return {
@@ -133,7 +144,10 @@ async def main_async():
         base_url=args.api_base,
         api_key=args.api_key,
         max_tokens=2048,
-        temperature=0.7
+        temperature=0.7,
+        image_store=ImageDerivativeStore(args.image_store) if args.image_store else None,
+        image_max_side=args.image_max_side,
+        structured=args.structured,
     )
     
     if not provider.is_available():
@@ -227,6 +241,11 @@ async def main_async():
     print(f"Files not found (skipped): {skipped_count}")
     print(f"LLM returned empty: {len(clean_entries) - skipped_count - len(completed_tasks)}")
     print(f"Successful attacks: {len(completed_tasks)}")
+    if args.structured:
+        print(f"Structured output ({args.structured}): {provider.stats['structured_requests']} constrained requests, "
+              f"{provider.stats['parse_retries']} parse retries")
+    else:
+        print(f"Parse retries: {provider.stats['parse_retries']}")
     print(f"Saved {len(completed_tasks)} attack configurations to {args.output}")
             
     print("Done.")
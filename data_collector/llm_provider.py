@@ -11,6 +11,7 @@ import base64
 import logging
 import json
 import asyncio
+import threading
 from pathlib import Path
 from typing import Optional, Any, List, Dict, Union
 from dataclasses import dataclass
@@ -88,6 +89,10 @@ class OpenAICompatibleProvider(ModelProvider):
     
     name = "openai_compatible"
     supports_json_mode = True
+    # 服务端累计拒绝约束参数达到该次数后，才对整个 provider 关闭结构化输出
+    STRUCTURED_REJECTIONS_TO_DISABLE = 3
+    # 错误信息中出现这些词时，才认为拒绝针对的是约束参数本身
+    _CONSTRAINT_ERROR_HINTS = ("guided", "response_format", "json_schema", "structured", "grammar")
     
     def __init__(
         self,
@@ -97,6 +102,9 @@ class OpenAICompatibleProvider(ModelProvider):
         max_tokens: int = 2048,
         temperature: float = 0.0,
         use_base64: bool = True,  # 是否使用 base64 编码图像
+        image_store: Any = None,  # 可选：共享的图像派生缓存 (evaluation.image_store.ImageDerivativeStore)
+        image_max_side: int = 0,  # 使用派生缓存时的最长边尺寸，0 = 原分辨率
+        structured: Optional[str] = None,  # 结构化输出: "guided" (vLLM guided_json) / "json_schema" (OpenAI response_format)
         **kwargs
     ):
         super().__init__(
@@ -108,6 +116,14 @@ class OpenAICompatibleProvider(ModelProvider):
             **kwargs
         )
         self.use_base64 = use_base64
+        self.image_store = image_store
+        self.image_max_side = image_max_side
+        self.structured = structured
+        # 统计：受约束的请求数、解析失败触发的重试数
+        self.stats = {"structured_requests": 0, "parse_retries": 0}
+        # provider 可能被多个线程共享，关闭结构化输出需加锁
+        self._structured_rejections = 0
+        self._structured_lock = threading.Lock()
         self._async_client: Optional[AsyncOpenAI] = None
         self._initialize_client()
     
@@ -143,12 +159,16 @@ class OpenAICompatibleProvider(ModelProvider):
             return False
     
     def _encode_image_base64(self, image_path: Path) -> str:
-        """将图像编码为 base64"""
+        """将图像编码为 base64（若配置了派生缓存，则直接复用已转码的 JPEG base64）"""
+        if self.image_store is not None:
+            return self.image_store.get_base64(str(image_path), self.image_max_side)
         with open(image_path, "rb") as f:
             return base64.b64encode(f.read()).decode("utf-8")
     
     def _get_image_mime_type(self, image_path: Path) -> str:
         """根据文件扩展名获取 MIME 类型"""
+        if self.image_store is not None:
+            return "image/jpeg"  # 派生缓存统一存储为 JPEG
         suffix = image_path.suffix.lower()
         mime_types = {
             ".jpg": "image/jpeg",
@@ -160,14 +180,39 @@ class OpenAICompatibleProvider(ModelProvider):
         }
         return mime_types.get(suffix, "image/jpeg")
     
+    def _schema_kwargs(self, json_schema: Optional[dict]) -> Dict[str, Any]:
+        """按 self.structured 生成约束输出到 json_schema 的请求参数"""
+        if not json_schema or not self.structured:
+            return {}
+        if self.structured == "guided":
+            # vLLM 扩展参数；Thinking 模型需以 --reasoning-parser 启动，约束只作用于思考之后的回答
+            return {"extra_body": {"guided_json": json_schema}}
+        if self.structured == "json_schema":
+            return {"response_format": {"type": "json_schema",
+                                        "json_schema": {"name": "output", "strict": True, "schema": json_schema}}}
+        return {}
+
+    def _reject_structured(self, error: Exception) -> None:
+        """记录一次针对约束参数的拒绝；累计达到阈值后对所有请求关闭结构化输出"""
+        message = str(error).lower()
+        if not any(hint in message for hint in self._CONSTRAINT_ERROR_HINTS):
+            return
+        with self._structured_lock:
+            self._structured_rejections += 1
+            if self._structured_rejections == self.STRUCTURED_REJECTIONS_TO_DISABLE and self.structured:
+                logger.warning(f"⚠️ 服务端多次拒绝结构化输出 ({self.structured})，后续请求改用普通解码")
+                self.structured = None
+
     async def analyze_image_async(
         self,
         image_path: Path,
         prompt: str,
         json_mode: bool = False,
+        json_schema: Optional[dict] = None,
     ) -> AnalysisResult:
         """
         异步分析图像
+        json_schema: 配置了 structured 时，直接在解码阶段约束输出，省去解析失败后的重试
         """
         if not self._async_client:
             return AnalysisResult.fail("OpenAI 兼容客户端未初始化")
@@ -191,6 +236,13 @@ class OpenAICompatibleProvider(ModelProvider):
                 if "response_format" in extra_kwargs:
                     del extra_kwargs["response_format"]
             
+            # 结构化输出（覆盖 json_object 模式；服务端拒绝时恢复原参数）
+            base_kwargs = dict(extra_kwargs)
+            schema_kwargs = self._schema_kwargs(json_schema)
+            if schema_kwargs:
+                extra_kwargs.pop("response_format", None)
+                extra_kwargs.update(schema_kwargs)
+            
             # 构建消息
             if self.use_base64:
                 image_data = self._encode_image_base64(image_path)
@@ -219,8 +271,12 @@ class OpenAICompatibleProvider(ModelProvider):
             max_runaway_retries = 3
             current_temperature = self.temperature  # 局部副本，不修改对象状态
 
-            for attempt in range(max_runaway_retries + 1):
+            attempt = -1
+            while attempt < max_runaway_retries:
+                attempt += 1
                 try:
+                    if schema_kwargs:
+                        self.stats["structured_requests"] += 1
                     # 异步调用 API
                     response = await self._async_client.chat.completions.create(
                         model=self.model_name,
@@ -285,6 +341,7 @@ class OpenAICompatibleProvider(ModelProvider):
                         if validation_errors:
                             if attempt < max_runaway_retries:
                                 logger.warning(f"⚠️ 输出校验失败 ({', '.join(validation_errors)}), 触发重试 ({attempt+1}/{max_runaway_retries})...")
+                                self.stats["parse_retries"] += 1
                                 current_temperature = min(current_temperature + 0.1, 1.0)
                                 continue
                             else:
@@ -296,6 +353,16 @@ class OpenAICompatibleProvider(ModelProvider):
                     continue
 
                 except Exception as e:
+                    if schema_kwargs and getattr(e, "status_code", None) in (400, 422):
+                        # 服务端可能不支持该约束参数：本次请求改用普通解码重发
+                        logger.warning(f"⚠️ 服务端拒绝结构化输出，本次请求回退为普通解码: {e}")
+                        self._reject_structured(e)
+                        for key in schema_kwargs:
+                            extra_kwargs.pop(key, None)
+                        extra_kwargs.update(base_kwargs)  # 恢复被覆盖的 json_object 模式
+                        schema_kwargs = {}
+                        attempt -= 1  # 回退后的重发不计入重试次数
+                        continue
                     if attempt == max_runaway_retries:
                         raise e
                     logger.warning(f"API Error during attempt {attempt}: {e}")
@@ -2,31 +2,147 @@ import argparse
 import os
 import json
 import base64
+import random
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from functools import partial
+from typing import NamedTuple, Optional
 from urllib.parse import urlparse
-from evaluation.api_client import build_client, GeoLocalizationClient
+from evaluation.adaptive import (CONFIDENCE, MIN_ROWS, AdaptiveStop, AdaptiveTargets, adaptive_path,
+                                 stratified_order)
+from evaluation.api_client import build_client, PROVIDER_CONFIGS
+from evaluation.batch_client import BatchRunner, build_backend, make_batch_line
+from evaluation.coord_parser import parse_coordinates
+from evaluation.failover import FailoverClient, with_fallbacks
+from evaluation.hedging import HedgePolicy
+from evaluation.image_policy import resize_for_policy
+from evaluation.image_store import ImageDerivativeStore
+from evaluation.manifest import SampleManifest
+from evaluation.media_server import MediaServer
 from evaluation.metric_calculator import MetricCalculator
+from evaluation.response_cache import ResponseCache
+from evaluation.retry_queue import MAX_DEFERRALS, Deferred, RetryQueue, backoff_delay, write_stragglers
+from evaluation.running_metrics import RunningMetrics, summary_path
+from evaluation.subset import load_subset
+from evaluation.token_profile import MIN_SAMPLES, TokenProfileStore, apply_limits
+from evaluation.telemetry import (PRICE_CSV, RunTelemetry, format_report, load_prices, parse_retry_counts,
+                                 prom_path, row_telemetry, telemetry_path)
 
 # 默认配置
 DEFAULT_API_BASE = "http://localhost:8001/v1"
 DEFAULT_API_KEY = "local-key"
 DEFAULT_MODEL = "qwen3-30b"
 
+# Number of threads reading + base64-encoding images ahead of the requests
+ENCODE_WORKERS = 4
+# Print a live summary line every N results per model
+LIVE_SUMMARY_EVERY = 50
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Evaluate Geolocation Robustness")
     parser.add_argument("--img-dir", type=str, required=True, help="Directory containing images to evaluate")
-    parser.add_argument("--metadata-file", type=str, required=True, help="Path to metadata TSV file")
+    parser.add_argument("--metadata-file", type=str, required=False, help="Path to metadata TSV file")
     parser.add_argument("--bench-meta", type=str, required=False, help="Path to benchmark_meta.jsonl (for TFR/TBS pairing)")
     parser.add_argument("--baseline", type=str, required=False, help="Path to original image results JSONL (for TBS computation)")
+    parser.add_argument("--manifest", type=str, required=False,
+                        help="Sample manifest (from convert_metadata.py): exact GT / base-id lookup instead of "
+                             "--metadata-file and --bench-meta filename matching")
+    parser.add_argument("--subset", type=str, default=None,
+                        help="Subset manifest (from build_lite_subset.py): only evaluate images of its base ids")
     parser.add_argument("--output", type=str, required=True, help="Output JSONL file for results")
     parser.add_argument("--model", type=str, default=DEFAULT_MODEL,
                         help="Model short name (e.g., qwen3-30b, gpt-4o) or full path for local vLLM")
+    parser.add_argument("--models", type=str, default=None,
+                        help="Comma-separated model names evaluated in one pass, sharing image encoding "
+                             "(overrides --model; --output/--baseline take a {model} placeholder)")
     parser.add_argument("--api-base", type=str, default=None,
-                        help="Override API base URL (optional, auto-detected from model registry)")
+                        help="Override API base URL (optional, auto-detected from model registry); "
+                             "a comma-separated list load-balances replicas of the model")
     parser.add_argument("--api-key", type=str, default=None,
                         help="API key (optional, can also use env vars: OPENROUTER_API_KEY, SILICONFLOW_API_KEY, etc.)")
     parser.add_argument("--provider", type=str, default=None,
                         help="Override provider (local/relay/siliconflow/openrouter/openai)")
     parser.add_argument("--limit", type=int, default=0, help="Limit number of images (0 = no limit)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of in-flight inference requests (default: 1 = sequential)")
+    parser.add_argument("--cache-db", type=str, default=None,
+                        help="SQLite response cache shared across runs (default: disabled)")
+    parser.add_argument("--cache-max-mb", type=float, default=512,
+                        help="Evict least recently used cache entries beyond this size (default: 512)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit all pending images as an offline batch job instead of interactive calls")
+    parser.add_argument("--batch-backend", type=str, choices=["openai", "local"], default="openai",
+                        help="Batch backend: provider /batches API, or a local file-based stand-in (default: openai)")
+    parser.add_argument("--batch-dir", type=str, default=None,
+                        help="Directory for batch request/output files and job state (default: <output>.batch)")
+    parser.add_argument("--batch-poll-interval", type=float, default=60,
+                        help="Seconds between batch job status polls (default: 60)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Fire a duplicate request when a call exceeds the model's online latency percentile")
+    parser.add_argument("--hedge-percentile", type=float, default=0.95,
+                        help="Latency percentile after which a request is hedged (default: 0.95)")
+    parser.add_argument("--hedge-min-samples", type=int, default=20,
+                        help="Responses to observe before hedging starts (default: 20)")
+    parser.add_argument("--hedge-model", type=str, default=None,
+                        help="Send duplicates to this registry model/endpoint instead of the same one")
+    parser.add_argument("--hedge-provider", type=str, default=None, help="Provider of the hedge endpoint")
+    parser.add_argument("--hedge-api-base", type=str, default=None, help="API base of the hedge endpoint")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses and close each stream as soon as the answer holds coordinates")
+    parser.add_argument("--reasoning-budget", type=int, default=None,
+                        help="With --stream: cut a thinking model's reasoning after about this many tokens "
+                             "and retry it like a runaway (default: no budget)")
+    parser.add_argument("--structured", action="store_true",
+                        help="Constrain answers to the coordinate format (guided decoding / JSON schema / stop "
+                             "sequence, per the model's registry capability) instead of retrying unparsable ones")
+    parser.add_argument("--token-profile", type=str, default=None,
+                        help="Per-model token profile (SQLite): record completion/reasoning tokens and set "
+                             "max_tokens / reasoning budget from their p99 (default: disabled)")
+    parser.add_argument("--calibrate", type=int, default=0,
+                        help="With --token-profile: for a model without a profile, run this many sampled images "
+                             f"with the default limits first, then switch to calibrated ones (>= {MIN_SAMPLES})")
+    parser.add_argument("--image-token-budget", type=int, default=None,
+                        help="Downscale images to this many image tokens under each provider's token rule "
+                             "(overrides the registry; 0 = full size; default: registry/provider setting)")
+    parser.add_argument("--image-transport", type=str, choices=["base64", "file", "http"], default="base64",
+                        help="How a self-hosted (local) server gets the image: inline base64, file:// path on a "
+                             "shared filesystem, or URL from a built-in media server (default: base64)")
+    parser.add_argument("--media-host", type=str, default=None,
+                        help="With --image-transport http: host name the model server reaches us by (default: FQDN)")
+    parser.add_argument("--media-port", type=int, default=0,
+                        help="With --image-transport http: media server port (default: any free port)")
+    parser.add_argument("--failover", action="store_true",
+                        help="Fail over to the registry's fallback backends (another provider, billed there) "
+                             "when a provider is down; each row records the backend that served it")
+    parser.add_argument("--inline-retries", action="store_true",
+                        help="Retry 5xx/429/timeouts inside the call (sleeping in the request slot) instead of "
+                             "deferring the image to a retry queue while fresh images go on")
+    parser.add_argument("--max-deferrals", type=int, default=MAX_DEFERRALS,
+                        help="Deferred retries of an image before it is reported as a straggler and left "
+                             "for a rerun (default: %(default)s)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Run images in a stratified random order and stop each model once the confidence "
+                             "intervals of WLA, median error and TBS are within the targets below")
+    parser.add_argument("--ci-wla", type=float, default=AdaptiveTargets().wla,
+                        help="With --adaptive: WLA half-width target (default: %(default)s = ±2 points)")
+    parser.add_argument("--ci-median", type=float, default=AdaptiveTargets().median_rel,
+                        help="With --adaptive: median-error half-width target, relative (default: %(default)s)")
+    parser.add_argument("--ci-tbs", type=float, default=AdaptiveTargets().tbs_km,
+                        help="With --adaptive: TBS half-width target in km (default: %(default)s)")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE,
+                        help="With --adaptive: confidence level of the intervals (default: %(default)s)")
+    parser.add_argument("--adaptive-min-rows", type=int, default=MIN_ROWS,
+                        help="With --adaptive: rows before a model may stop (default: %(default)s)")
+    parser.add_argument("--adaptive-seed", type=int, default=0,
+                        help="With --adaptive: seed of the stratified order (default: %(default)s)")
+    parser.add_argument("--price-csv", type=str, default=PRICE_CSV,
+                        help="Price sheet used for the cost in the telemetry report (default: %(default)s)")
+    parser.add_argument("--image-store", type=str, default=None,
+                        help="Shared derivative store: send cached JPEG transcodes instead of raw files")
+    parser.add_argument("--image-max-side", type=int, default=0,
+                        help="Longer-side size of the derivative to send, 0 = full resolution (needs --image-store)")
     return parser.parse_args()
 
 def load_ground_truth(metadata_path):
@@ -62,14 +178,39 @@ def load_benchmark_meta(meta_path):
             except: pass
     return meta_map
 
-def encode_image(image_path):
+def encode_image(image_path, image_store=None, max_side=0):
     try:
+        if image_store is not None:
+            return image_store.get_base64(image_path, max_side)
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
     except PermissionError:
         print(f"  [SKIP] Permission denied: {image_path}")
         return None
 
+class EncodedImage(NamedTuple):
+    """One image prepared for a model: payload, file for the file/http transports, resize factor."""
+    base64: str                  # Also the cache key and the inline fallback of the file/http transports
+    path: Optional[str] = None   # File holding exactly this payload (None = send inline only)
+    scale: float = 1.0           # Downscale applied for the model's image-token budget
+
+
+def encode_for_request(image_path, policy=None, encode_fn=encode_image, image_store=None, max_side=0,
+                       by_path=False):
+    """EncodedImage of an image for one resizing policy (None when it can't be read)."""
+    try:
+        if policy is None:
+            base64_img = encode_fn(image_path)
+            if base64_img is None:
+                return None
+            path = (image_store.jpeg_path(image_path, max_side) if image_store else image_path) if by_path else None
+            return EncodedImage(base64_img, path)
+        base64_img, scale, path = resize_for_policy(image_path, policy, image_store, max_side)
+        return EncodedImage(base64_img, path if by_path else None, scale)
+    except PermissionError:
+        print(f"  [SKIP] Permission denied: {image_path}")
+        return None
+
 def load_invalid_ids(script_dir=None):
     if script_dir is None:
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -84,202 +225,712 @@ def load_invalid_ids(script_dir=None):
     return invalid_ids
 
 
-def main():
-    args = parse_args()
-
-    gt_map = load_ground_truth(args.metadata_file)
-    bench_meta = load_benchmark_meta(args.bench_meta)
-    invalid_ids = load_invalid_ids()
-
-    if not gt_map:
-        print(f"[ERROR] Ground truth map is empty. Please check --metadata-file: {args.metadata_file}")
-        return
-
-    # Build unified client
-    try:
-        client = build_client(
-            model_short_name=args.model,
-            provider=args.provider,
-            api_key=args.api_key,
-            api_base=args.api_base,
-        )
-        print(f"[Client] Model: {client.model_name}")
-        print(f"[Client] Provider: {client.provider}")
-        print(f"[Client] API Base: {client.api_base}")
-        print(f"[Client] Thinking: {client.is_thinking_model}")
-    except ValueError as e:
-        print(f"[ERROR] Failed to build client: {e}")
-        return
-
-    # Scan images
-    valid_exts = ('.png', '.jpg', '.jpeg', '.webp')
-    image_files = [f for f in os.listdir(args.img_dir) if f.lower().endswith(valid_exts)]
-    print(f"Found {len(image_files)} images in {args.img_dir}")
-
-    processed_count = 0
-    results_buffer = []
+def resolve_ground_truth(filename, gt_map, meta_info):
+    """Find the GT (lat, lon) for an image filename, trying the known naming schemes in turn."""
+    original_source = meta_info.get('original_source') if meta_info else None
 
-    # Store clean results for TBS calculation
-    clean_results_map = {}
-
-    # Load baseline (original image results) if provided
-    if args.baseline and os.path.exists(args.baseline):
-        print(f"Loading baseline from {args.baseline}...")
-        with open(args.baseline, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    entry = json.loads(line)
-                    if entry.get('error_km') is not None:
-                        clean_results_map[entry['filename']] = entry['error_km']
-                except: pass
-        print(f"Loaded {len(clean_results_map)} baseline entries.")
-
-    final_output_path = args.output
-
-    # Load already-processed filenames to support resume
-    already_done = set()
-    if os.path.exists(final_output_path):
-        with open(final_output_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    entry = json.loads(line)
-                    already_done.add(entry['filename'])
-                    if entry.get('attack_type') in ('original', 'clean') and entry.get('error_km') is not None:
-                        clean_results_map[entry['filename']] = entry['error_km']
-                except: pass
-        if already_done:
-            print(f"Resuming: {len(already_done)} images already processed, skipping.")
-
-    # First Pass: Inference
+    gt = gt_map.get(filename)
+    if not gt and original_source:
+        gt = gt_map.get(original_source)
+    if not gt:
+        name_no_ext = os.path.splitext(filename)[0]
+        gt = gt_map.get(name_no_ext)
+    if not gt:
+        base_id = filename.split('_')[0]
+        gt = gt_map.get(base_id)
+        if not gt:
+            gt = gt_map.get(os.path.splitext(base_id)[0])
+    return gt
+
+
+def build_work_items(image_files, gt_map, bench_meta, invalid_ids, already_done, limit=0, manifest=None,
+                     subset=None, log_skips=True):
+    """
+    Select the images to run, in directory order.
+    Skips resumed files, images without ground truth and invalid sample IDs.
+    With a manifest, GT, base id and attack metadata come from its record for each file.
+    With a subset (set of base ids), only images of those base ids are run.
+    """
+    items = []
     for filename in image_files:
-        if args.limit > 0 and processed_count >= args.limit: break
+        if limit > 0 and len(items) >= limit: break
 
         # Resume: skip already-processed files
         if filename in already_done:
             continue
 
-        gt = gt_map.get(filename)
-        meta_info = bench_meta.get(filename)
-        original_source = meta_info.get('original_source') if meta_info else None
-
-        if not gt and original_source:
-            gt = gt_map.get(original_source)
-        if not gt:
-            name_no_ext = os.path.splitext(filename)[0]
-            gt = gt_map.get(name_no_ext)
-        if not gt:
-            base_id = filename.split('_')[0]
-            gt = gt_map.get(base_id)
-            if not gt:
-                gt = gt_map.get(os.path.splitext(base_id)[0])
-        if not gt: continue
+        if manifest is not None:
+            rec = manifest.get(filename)
+            if rec is None or rec.gt is None: continue
+            gt, base_id = rec.gt, rec.base_id
+            meta_info = None if rec.is_original else {
+                "original_source": rec.original_source,
+                "attack_type": rec.attack_type,
+                "injected_text": rec.injected_text,
+            }
+        else:
+            meta_info = bench_meta.get(filename)
+            gt = resolve_ground_truth(filename, gt_map, meta_info)
+            if not gt: continue
+            base_id = None
 
         # Skip invalid samples
-        base_id = os.path.splitext(filename.split('_')[0])[0]
-        if base_id in invalid_ids:
-            print(f"  [SKIP] {filename} (invalid sample ID: {base_id})")
+        invalid_key = base_id or os.path.splitext(filename.split('_')[0])[0]
+        if invalid_key in invalid_ids:
+            if log_skips: print(f"  [SKIP] {filename} (invalid sample ID: {invalid_key})")
+            continue
+        if subset is not None and invalid_key not in subset:
             continue
 
-        processed_count += 1
-        image_path = os.path.join(args.img_dir, filename)
+        items.append({"filename": filename, "gt": gt, "meta_info": meta_info, "base_id": base_id})
+    return items
+
+
+def evaluate_item(client, item, encoded):
+    """
+    Run inference for one prepared work item (an EncodedImage) and build its result row,
+    or a Deferred when a deferring client hit a transient failure.
+    """
+    pred_text, info = client.predict_location_detailed(encoded.base64, encoded.path)
+    if info["status"] == "deferred":
+        return Deferred(info["retry_reasons"][-1], info.get("retry_after_s"), info["attempts"],
+                        info["retry_reasons"])
+    # Total downscale: the encode pool's budget resize times anything the client still applied
+    info["image_scale"] = round(encoded.scale * info.get("image_scale", 1.0), 4)
+    return make_result_row(item, pred_text, info)
+
+
+def make_result_row(item, pred_text, info=None):
+    """Parse a model answer for a work item and score it against the ground truth."""
+    filename, gt, meta_info = item['filename'], item['gt'], item['meta_info']
+
+    pred_lat, pred_lon = parse_coordinates(pred_text)
+
+    # Metrics
+    error_km = None
+    if pred_lat is not None:
+        error_km = MetricCalculator.haversine_distance(gt[0], gt[1], pred_lat, pred_lon)
+    wla_score = MetricCalculator.calculate_wla(error_km)
+
+    return {
+        "filename": filename,
+        "base_id": item.get('base_id'),
+        "original_source": meta_info.get('original_source') if meta_info else None,
+        "attack_type": meta_info.get('attack_type', 'unknown') if meta_info else 'original',
+        "injected_text": meta_info.get('injected_text') if meta_info else None,
+        "prediction_text": pred_text,
+        "pred_lat": pred_lat,
+        "pred_lon": pred_lon,
+        "gt_lat": gt[0],
+        "gt_lon": gt[1],
+        "error_km": error_km,
+        "wla_score": wla_score,
+        "hedged": bool(info and info.get("hedged")),
+        **row_telemetry(info),
+    }
+
+
+def _encode_then_evaluate(client, item, encode_future):
+    encoded = encode_future.result()
+    if encoded is None:
+        return None
+    return evaluate_item(client, item, encoded)
+
+
+class _Pending(NamedTuple):
+    """An item a run has submitted: its request future, encoded image and deferral history."""
+    item: dict
+    future: object
+    encoded: object              # Future of the EncodedImage, kept for resubmission
+    tries: int = 0               # Deferrals so far
+    attempts: int = 0            # Requests made by the deferred calls
+    retry_reasons: tuple = ()
+
+
+class ModelRun:
+    """Per-model state of one evaluation pass: client, output file, resume set and TBS baseline."""
+
+    def __init__(self, name, client, output_path, baseline_path=None, manifest=None, prices=None,
+                 token_profile=None, adaptive=None):
+        self.name = name
+        self.client = client
+        self.output_path = output_path
+        self.manifest = manifest
+        self.metrics = RunningMetrics()
+        # Request telemetry of the rows evaluated in this session (resumed rows are not re-timed)
+        self.telemetry = RunTelemetry(client.model_name, prices)
+        # Token counts of new rows feed the model's profile (None = not recorded)
+        self.token_profile = token_profile
+        # Leading images run with the default limits before the calibrated ones apply (0 = none)
+        self.calibration_items = 0
+        # Stopping rule of --adaptive (None = run every image); stopped runs get no new images
+        self.adaptive = adaptive
+        self.stopped = False
+        # Store clean results for TBS calculation (keyed by base id with a manifest, else by filename)
+        self.clean_results_map = {}
+        self.already_done = set()
+
+        # Load baseline (original image results) if provided
+        if baseline_path and os.path.exists(baseline_path):
+            print(f"[{name}] Loading baseline from {baseline_path}...")
+            with open(baseline_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if entry.get('error_km') is not None:
+                            self.clean_results_map[self.clean_key(entry)] = entry['error_km']
+                    except: pass
+            print(f"[{name}] Loaded {len(self.clean_results_map)} baseline entries.")
+            if client.structured:
+                # Its free-text parse retry rate is the reference for the retries avoided
+                self.telemetry.set_reference(*parse_retry_counts(baseline_path))
+
+        # Load already-processed filenames to support resume
+        if os.path.exists(output_path):
+            with open(output_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.already_done.add(entry['filename'])
+                        if entry.get('attack_type') in ('original', 'clean') and entry.get('error_km') is not None:
+                            self.clean_results_map[self.clean_key(entry)] = entry['error_km']
+                        # Fold resumed rows into the running summary (older rows carry no tbs field)
+                        if 'tbs' not in entry:
+                            entry['tbs'] = self.tbs_for(entry)
+                        self.metrics.add(entry)
+                        if adaptive is not None:
+                            adaptive.add(entry)
+                    except: pass
+            if self.already_done:
+                print(f"[{name}] Resuming: {len(self.already_done)} images already processed, skipping.")
+
+    def clean_key(self, entry):
+        if self.manifest is None:
+            return entry['filename']
+        return entry.get('base_id') or self.manifest.base_id_of(entry['filename'])
+
+    def clean_error_for(self, res):
+        """Clean-image error paired with an attacked result row, or None."""
+        if self.manifest is not None:
+            return self.clean_results_map.get(res.get('base_id'))
+        orig_src = res.get('original_source', '') or ''
+        clean_err = self.clean_results_map.get(orig_src)
+        if clean_err is None:
+            base_id = orig_src.split('.')[0] if orig_src else ''
+            for key in self.clean_results_map:
+                if key.startswith(base_id):
+                    clean_err = self.clean_results_map[key]
+                    break
+        return clean_err
+
+    def tbs_for(self, res):
+        """TBS of an attacked result row against its clean baseline, or None."""
+        if res.get('attack_type') in ('original', 'clean', 'unknown'):
+            return None
+        return MetricCalculator.calculate_tbs(self.clean_error_for(res), res.get('error_km'))
+
+    def record(self, res):
+        """Fold a new result row (adding its tbs) into the running summary, before it is written."""
+        if res['attack_type'] == 'original' and res['error_km'] is not None:
+            self.clean_results_map[self.clean_key(res)] = res['error_km']
+        res['tbs'] = self.tbs_for(res)
+        self.metrics.add(res)
+        if self.adaptive is not None:
+            self.adaptive.add(res)
+        self.telemetry.add(res)
+        if self.token_profile is not None:
+            self.token_profile.record_row(res)
+
+    def save_metrics(self):
+        """Write the running summary sidecar (every LIVE_SUMMARY_EVERY rows and at the end, not per row)."""
+        self.metrics.save(summary_path(self.output_path))
+
+    def save_telemetry(self):
+        """Write the telemetry report and its Prometheus file next to the results. Returns the report."""
+        return self.telemetry.save(self.output_path,
+                                   labels={"model": self.name, "run": os.path.basename(self.output_path)})
+
+
+def iter_ordered_results(runs, items, img_dir, concurrency=1, encode_fn=encode_for_request,
+                         max_deferrals=MAX_DEFERRALS):
+    """
+    Yield (run, item, result_row) for every run that still needs each item,
+    in the order of `items` within each run.
+
+    Each image is read/encoded once per distinct resizing policy on a shared pool,
+    as soon as the item enters the window, and the same EncodedImage
+    (encode_fn(path, policy)) is dispatched to every run with that policy. Each run has its
+    own pool of `concurrency` request threads, so a slow model does not take
+    slots from a fast one (provider quotas are still enforced by the client's
+    rate limiter). result_row is None when the image could not be read.
+    A run whose `stopped` flag is set gets no new items (its submitted ones
+    still finish); once every run is stopped, no more items are read.
+
+    An item whose call comes back Deferred (a client with defer_retries) leaves
+    the order: it waits in a RetryQueue until its backoff deadline (at least the
+    server's Retry-After) while fresh items keep the slots busy, then goes back
+    to the end of its run's queue; its row carries the attempts and retry
+    reasons of every deferred call. After max_deferrals, the Deferred itself is
+    yielded as the result (a straggler that failed permanently).
+    """
+    concurrency = max(1, concurrency)
+    # Reorder window: how many items a run may have submitted but not yet yielded.
+    # Wider than `concurrency` so one slow response does not idle the other slots.
+    window = concurrency * 4
+    pending = {run.name: deque() for run in runs}
+    retry_queue = RetryQueue()
+    item_iter = iter(items)
+    fresh_left = True
+
+    with ThreadPoolExecutor(max_workers=ENCODE_WORKERS) as encoders, ExitStack() as stack:
+        workers = {run.name: stack.enter_context(ThreadPoolExecutor(max_workers=concurrency)) for run in runs}
+
+        def submit_next():
+            nonlocal fresh_left
+            item = next(item_iter, None) if not all(run.stopped for run in runs) else None
+            if item is None:
+                fresh_left = False
+                return False
+            targets = [run for run in runs if not run.stopped and item['filename'] not in run.already_done]
+            if not targets:
+                return True
+            encoded = {}
+            for run in targets:
+                policy = run.client.image_policy
+                if policy not in encoded:
+                    encoded[policy] = encoders.submit(encode_fn, os.path.join(img_dir, item['filename']), policy)
+                future = workers[run.name].submit(_encode_then_evaluate, run.client, item, encoded[policy])
+                pending[run.name].append(_Pending(item, future, encoded[policy]))
+            return True
+
+        def fill_window():
+            # Encoded images stay in memory until every run has yielded them,
+            # so the slowest run bounds how far ahead we read.
+            while all(len(queue) < window for queue in pending.values()) and submit_next():
+                pass
+
+        def resubmit_due():
+            for run, entry in retry_queue.pop_due():
+                future = workers[run.name].submit(_encode_then_evaluate, run.client, entry.item, entry.encoded)
+                pending[run.name].append(entry._replace(future=future))
+
+        fill_window()
+        stragglers_announced = False
+        while any(pending.values()) or retry_queue:
+            heads = [queue[0].future for queue in pending.values() if queue]
+            if heads:
+                wait(heads, timeout=retry_queue.wait_time(), return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(retry_queue.wait_time())
+            for run in runs:
+                queue = pending[run.name]
+                while queue and queue[0].future.done():
+                    entry = queue.popleft()
+                    res = entry.future.result()
+                    if isinstance(res, Deferred):
+                        entry = entry._replace(tries=entry.tries + 1, attempts=entry.attempts + res.attempts,
+                                               retry_reasons=entry.retry_reasons + tuple(res.retry_reasons))
+                        if entry.tries <= max_deferrals:
+                            delay = backoff_delay(entry.tries, res.retry_after_s)
+                            print(f"  [Retry] {entry.item['filename']} deferred ({res.status}), "
+                                  f"retry {entry.tries}/{max_deferrals} in {delay:.1f}s")
+                            retry_queue.push((run, entry), delay)
+                            continue
+                        res = res._replace(attempts=entry.attempts, retry_reasons=list(entry.retry_reasons))
+                    elif res is not None and entry.tries:
+                        res['attempts'] = (res.get('attempts') or 0) + entry.attempts
+                        res['retry_reasons'] = list(entry.retry_reasons) + (res.get('retry_reasons') or [])
+                    yield run, entry.item, res
+            resubmit_due()
+            fill_window()
+            if not fresh_left and retry_queue and not stragglers_announced and not any(pending.values()):
+                print(f"[Retry] Stragglers phase: {len(retry_queue)} deferred item(s) left")
+                stragglers_announced = True
+
+
+def iter_encoded(items, img_dir, window=64, encode_fn=encode_image):
+    """Yield (item, base64_img) in order, encoding up to `window` images ahead on a thread pool."""
+    pending = deque()
+    item_iter = iter(items)
+    with ThreadPoolExecutor(max_workers=ENCODE_WORKERS) as encoders:
+        def submit_next():
+            item = next(item_iter, None)
+            if item is None:
+                return False
+            pending.append((item, encoders.submit(encode_fn, os.path.join(img_dir, item['filename']))))
+            return True
+
+        while len(pending) < window and submit_next():
+            pass
+        while pending:
+            item, future = pending.popleft()
+            base64_img = future.result()
+            submit_next()
+            yield item, base64_img
+
+
+def run_batch(run, work_items, args, state_dir, encode_fn=encode_image):
+    """
+    Evaluate work_items through an offline batch job and append the merged rows.
+    Requests that fail or return no coordinates are not written, so a normal
+    (interactive) rerun picks them up through the resume logic.
+    """
+    client = run.client
+    runner = BatchRunner(build_backend(args.batch_backend, client, state_dir), state_dir,
+                         poll_interval=args.batch_poll_interval)
+    work_items = [item for item in work_items if item['filename'] not in run.already_done]
+    items_by_id = {item['filename']: item for item in work_items}
+
+    if runner.has_open_jobs:
+        print(f"[Batch] Resuming {len(runner.state['jobs'])} submitted job(s) from {state_dir}")
+    elif work_items:
+        lines = (make_batch_line(item['filename'], client.build_request_payload(base64_img))
+                 for item, base64_img in iter_encoded(work_items, args.img_dir, encode_fn=encode_fn)
+                 if base64_img is not None)
+        print(f"[Batch] Submitted {runner.prepare(lines)} requests via '{args.batch_backend}' backend")
+
+    merged = 0
+    left_over = 0
+    with open(run.output_path, 'a', encoding='utf-8') as out_f:
+        for custom_id, body in runner.wait_and_collect():
+            item = items_by_id.pop(custom_id, None)
+            if item is None:
+                continue  # Merged before a restart
+            pred_text = client.content_from_result(body) if body else None
+            res = make_result_row(item, pred_text) if pred_text else None
+            if res is None or res['pred_lat'] is None:
+                left_over += 1
+                continue
+            run.record(res)
+            append_result(out_f, res)
+            merged += 1
+    runner.reset()
+
+    print(f"[Batch] Merged {merged} results; {left_over} failed/unparsed left for an interactive rerun")
+
+
+def plan_calibration(runs, work_items, token_profile, sample_size, seed=0):
+    """
+    Warm-up for models without a token profile: move a seeded random sample of
+    `sample_size` items to the front, to be run with the default limits before
+    the calibrated ones are applied (see ModelRun.calibration_items).
+    """
+    cold = [run for run in runs if any(token_profile.limits(c.backend, c.is_thinking_model) is None
+                                       for c in getattr(run.client, "clients", [run.client]))]
+    if not cold:
+        return work_items
+    if sample_size < MIN_SAMPLES:
+        print(f"[Profile] [WARN] --calibrate {sample_size} is below the {MIN_SAMPLES} samples a profile needs")
+    picked = set(random.Random(seed).sample(range(len(work_items)), min(sample_size, len(work_items))))
+    for run in cold:
+        run.calibration_items = sum(work_items[i]['filename'] not in run.already_done for i in picked)
+        print(f"[{run.name}] Calibrating token limits on {run.calibration_items} sampled images")
+    return [work_items[i] for i in sorted(picked)] + [item for i, item in enumerate(work_items) if i not in picked]
+
+
+def append_result(out_f, res):
+    """Append one result line and push it to disk so a crash loses at most in-flight images."""
+    out_f.write(json.dumps(res) + "\n")
+    out_f.flush()
+    os.fsync(out_f.fileno())
 
-        print(f"[{processed_count}] Evaluating {filename}...")
 
-        # Encode image
-        base64_img = encode_image(image_path)
-        if base64_img is None:
-            continue
+def main():
+    args = parse_args()
 
-        # Inference
-        pred_text = client.predict_location(base64_img)
-        pred_lat, pred_lon = GeoLocalizationClient.parse_coordinates(pred_text) if pred_text else (None, None)
-
-        # Metrics
-        error_km = None
-        if pred_lat is not None:
-            error_km = MetricCalculator.haversine_distance(gt[0], gt[1], pred_lat, pred_lon)
-        wla_score = MetricCalculator.calculate_wla(error_km)
-
-        attack_type = meta_info.get('attack_type', 'unknown') if meta_info else 'original'
-        if attack_type == 'original' and error_km is not None:
-            clean_results_map[filename] = error_km
-
-        res = {
-            "filename": filename,
-            "original_source": original_source,
-            "attack_type": attack_type,
-            "injected_text": meta_info.get('injected_text') if meta_info else None,
-            "prediction_text": pred_text,
-            "pred_lat": pred_lat,
-            "pred_lon": pred_lon,
-            "gt_lat": gt[0],
-            "gt_lon": gt[1],
-            "error_km": error_km,
-            "wla_score": wla_score,
-        }
-        results_buffer.append(res)
-
-        # Write result immediately (real-time, supports resume)
-        with open(final_output_path, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(res) + "\n")
-
-        if error_km is not None:
-            print(f"  -> Error: {error_km:.2f} km | WLA: {wla_score:.1f}")
+    manifest = None
+    if args.manifest:
+        # GT and attack metadata are queried per file from the manifest
+        manifest = SampleManifest(args.manifest)
+        print(f"[Manifest] Using {args.manifest} ({len(manifest)} samples)")
+        gt_map, bench_meta = {}, {}
+    elif not args.metadata_file:
+        print("[ERROR] Either --metadata-file or --manifest is required")
+        return
+    else:
+        gt_map = load_ground_truth(args.metadata_file)
+        bench_meta = load_benchmark_meta(args.bench_meta)
+        if not gt_map:
+            print(f"[ERROR] Ground truth map is empty. Please check --metadata-file: {args.metadata_file}")
+            return
+    invalid_ids = load_invalid_ids()
+    subset = None
+    if args.subset:
+        try:
+            subset = load_subset(args.subset)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ERROR] Cannot read subset manifest {args.subset}: {e}")
+            return
+        print(f"[Subset] Evaluating the {len(subset)} base ids of {args.subset}")
+
+    encode_fn = encode_image
+    image_store = None
+    if args.image_store:
+        image_store = ImageDerivativeStore(args.image_store)
+        encode_fn = partial(encode_image, image_store=image_store, max_side=args.image_max_side)
+        print(f"[Store] Using image derivatives from {args.image_store} (max side: {args.image_max_side or 'full'})")
+
+    # Interactive requests may reference the image by path/URL instead of inlining it
+    image_transport = "base64" if args.batch else args.image_transport
+    request_encode_fn = partial(encode_for_request, encode_fn=encode_fn, image_store=image_store,
+                                max_side=args.image_max_side, by_path=image_transport != "base64")
+    media_server = None
+    if image_transport != "base64":
+        if image_transport == "http":
+            roots = [args.img_dir] + ([args.image_store] if args.image_store else [])
+            media_server = MediaServer(roots, port=args.media_port, public_host=args.media_host).start()
+            print(f"[Media] Serving {', '.join(roots)} at {media_server.base_url}")
+
+    cache = None
+    if args.cache_db:
+        cache = ResponseCache(args.cache_db, max_size_mb=args.cache_max_mb)
+        print(f"[Cache] Using response cache: {args.cache_db}")
+    token_profile = None
+    if args.token_profile:
+        token_profile = TokenProfileStore(args.token_profile)
+        print(f"[Profile] Using token profile: {args.token_profile}")
+
+    model_names = [m.strip() for m in args.models.split(',') if m.strip()] if args.models else [args.model]
+    if len(model_names) > 1 and "{model}" not in args.output:
+        print("[ERROR] --output must contain a {model} placeholder when evaluating several models")
+        return
+
+    # Build one client (and output file) per model
+    prices = load_prices(args.price_csv)
+    runs = []
+    for model_name in model_names:
+        try:
+            hedge_kwargs = {}
+            if args.hedge:
+                hedge_kwargs["hedge"] = HedgePolicy(args.hedge_percentile, min_samples=args.hedge_min_samples)
+                if args.hedge_model or args.hedge_provider or args.hedge_api_base:
+                    # Duplicates carry the primary's request: same key, streaming and reasoning budget
+                    hedge_kwargs["hedge_client"] = build_client(
+                        model_short_name=args.hedge_model or model_name,
+                        provider=args.hedge_provider,
+                        api_key=args.api_key,
+                        api_base=args.hedge_api_base,
+                        pool_size=args.concurrency,
+                        stream=args.stream,
+                        reasoning_budget=args.reasoning_budget,
+                    )
+            client = build_client(
+                model_short_name=model_name,
+                provider=args.provider,
+                api_key=args.api_key,
+                api_base=args.api_base,
+                pool_size=args.concurrency,
+                cache=cache,
+                stream=args.stream,
+                reasoning_budget=args.reasoning_budget,
+                image_transport=image_transport,
+                media_server=media_server,
+                image_token_budget=args.image_token_budget,
+                structured=args.structured,
+                defer_retries=not args.inline_retries,
+                token_profile=token_profile,
+                **hedge_kwargs,
+            )
+            if args.failover:
+                client = with_fallbacks(client, model_name, pool_size=args.concurrency, cache=cache,
+                                        image_token_budget=args.image_token_budget, token_profile=token_profile)
+            print(f"[Client] Model: {client.model_name}")
+            print(f"[Client] Provider: {client.provider}")
+            print(f"[Client] API Base: {client.api_base}")
+            if client.endpoints is not None:
+                print(f"[Client] Load-balancing {len(client.endpoints.api_bases)} replicas: "
+                      f"{', '.join(client.endpoints.api_bases)}")
+            print(f"[Client] Thinking: {client.is_thinking_model}")
+            if client.image_policy is not None:
+                print(f"[Client] Image budget: {client.image_policy.describe()}")
+            if token_profile is not None:
+                limits = token_profile.limits(client.backend, client.is_thinking_model)
+                print(f"[Client] Token limits: " + (limits.describe() if limits else
+                      f"default max_tokens {client.max_tokens} "
+                      f"({token_profile.count(client.backend)}/{MIN_SAMPLES} profile samples)"))
+            if args.structured:
+                print(f"[Client] Structured output: {client.structured or 'none (free text)'}")
+            if client.image_transport != "base64":
+                print(f"[Client] Image transport: {client.image_transport} (base64 fallback)")
+            if isinstance(client, FailoverClient):
+                print(f"[Client] Failover chain: {' -> '.join(client.backends)}")
+            if client.stream:
+                budget = f", reasoning budget {client.reasoning_budget} tokens" if client.reasoning_budget else ""
+                print(f"[Client] Streaming with early stop{budget}")
+            if client.hedge is not None:
+                target = client.hedge_client or client
+                print(f"[Client] Hedging after p{client.hedge.percentile*100:g} latency -> "
+                      f"{target.provider} ({target.api_base})")
+        except ValueError as e:
+            print(f"[ERROR] Failed to build client for '{model_name}': {e}")
+            return
+        # Local vLLM models may be given as a path; name their files after its last component
+        label = os.path.basename(model_name.rstrip('/'))
+        baseline = args.baseline.replace("{model}", label) if args.baseline else None
+        adaptive = None
+        if args.adaptive and not args.batch:
+            adaptive = AdaptiveStop(AdaptiveTargets(args.ci_wla, args.ci_median, args.ci_tbs), args.confidence,
+                                    args.adaptive_min_rows)
+        runs.append(ModelRun(label, client, args.output.replace("{model}", label), baseline, manifest, prices,
+                             token_profile, adaptive))
+        if adaptive is not None and adaptive.check(force=True):
+            runs[-1].stopped = True
+            print(f"[{label}] [Adaptive] Already converged on {adaptive.rows} resumed rows: {adaptive.describe()}")
+
+    # Scan images
+    valid_exts = ('.png', '.jpg', '.jpeg', '.webp')
+    image_files = [f for f in os.listdir(args.img_dir) if f.lower().endswith(valid_exts)]
+    print(f"Found {len(image_files)} images in {args.img_dir}")
+
+    # First Pass: Inference (an image is skipped only once every model has it)
+    done_by_all = set.intersection(*(run.already_done for run in runs))
+    # --adaptive limits a sample of its stratified order, not the first files of the directory
+    adaptive_order = args.adaptive and not args.batch
+    work_items = build_work_items(image_files, gt_map, bench_meta, invalid_ids, done_by_all,
+                                  0 if adaptive_order else args.limit, manifest=manifest, subset=subset)
+    if args.adaptive:
+        if args.batch:
+            print("[Adaptive] [WARN] --adaptive has no effect with --batch (all images go into the job)")
         else:
-            print(f"  -> Failed to parse: {pred_text}")
-
-    # Second Pass: Calculate TBS & Summary
-    total_wla = 0
-    valid_count = 0
-    tbs_sum = 0
-    tbs_count = 0
-
-    for res in results_buffer:
-        tbs = None
-        if res['attack_type'] not in ('original', 'clean', 'unknown'):
-            orig_src = res.get('original_source', '') or ''
-            clean_err = clean_results_map.get(orig_src)
-            if clean_err is None:
-                base_id = orig_src.split('.')[0] if orig_src else ''
-                for key in clean_results_map:
-                    if key.startswith(base_id):
-                        clean_err = clean_results_map[key]
-                        break
-            if clean_err is not None and res['error_km'] is not None:
-                tbs = MetricCalculator.calculate_tbs(clean_err, res['error_km'])
-                tbs_sum += tbs
-                tbs_count += 1
-        res['tbs'] = tbs
-
-        if res['error_km'] is not None:
-            total_wla += res['wla_score']
-            valid_count += 1
-
-    # Include resumed results in summary
-    if already_done:
-        with open(final_output_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    entry = json.loads(line)
-                    if entry['filename'] in already_done:
-                        if entry.get('error_km') is not None:
-                            total_wla += entry.get('wla_score', 0)
-                            valid_count += 1
-                        if entry.get('tbs') is not None:
-                            tbs_sum += entry['tbs']
-                            tbs_count += 1
-                except: pass
+            work_items = stratified_order(work_items, seed=args.adaptive_seed)
+            if args.limit > 0:
+                work_items = work_items[:args.limit]
+            print(f"[Adaptive] Stratified order (seed {args.adaptive_seed}); stopping at WLA ±{args.ci_wla*100:g} pts, "
+                  f"median ±{args.ci_median*100:g}%, TBS ±{args.ci_tbs:g} km ({args.confidence*100:g}% CI)")
+    if token_profile is not None and args.calibrate and not args.batch:
+        work_items = plan_calibration(runs, work_items, token_profile, args.calibrate)
+
+    if args.batch:
+        for run in runs:
+            if args.batch_backend == "openai" and not PROVIDER_CONFIGS.get(run.client.provider, {}).get("supports_batch"):
+                print(f"[ERROR] Provider '{run.client.provider}' has no batch API. Use --batch-backend local or drop --batch.")
+                return
+        for run in runs:
+            print(f"[{run.name}] Queued {len(work_items)} images (batch mode)")
+            if args.batch_dir:
+                state_dir = os.path.join(args.batch_dir, run.name) if len(runs) > 1 else args.batch_dir
+            else:
+                state_dir = run.output_path + ".batch"
+            run_batch(run, work_items, args, state_dir, encode_fn=encode_fn)
+    else:
+        print(f"Queued {len(work_items)} images x {len(runs)} model(s) (concurrency: {args.concurrency} per model)")
+        progress = {run.name: 0 for run in runs}
+        stragglers = {run.name: [] for run in runs}
+        totals = {run.name: sum(item['filename'] not in run.already_done for item in work_items) for run in runs}
+
+        # Results are appended in input order, one flushed line per image (real-time, supports resume)
+        with ExitStack() as stack:
+            out_files = {run.name: stack.enter_context(open(run.output_path, 'a', encoding='utf-8'))
+                         for run in runs}
+            for run, item, res in iter_ordered_results(runs, work_items, args.img_dir,
+                                                       args.concurrency, request_encode_fn, args.max_deferrals):
+                tag = f"[{run.name}] " if len(runs) > 1 else ""
+                if run.calibration_items and progress[run.name] >= run.calibration_items:
+                    # Every warm-up row is recorded; later requests get the calibrated limits
+                    applied = apply_limits(run.client, token_profile)
+                    print(f"{tag}[Profile] Calibration done: "
+                          + ("; ".join(applied) or "too few usable samples, keeping the default limits"))
+                    run.calibration_items = 0
+                progress[run.name] += 1
+                if res is None:
+                    continue
+                if isinstance(res, Deferred):
+                    # Not written: the next run retries it through resume
+                    print(f"{tag}[{progress[run.name]}/{totals[run.name]}] Gave up on {item['filename']} "
+                          f"after {res.attempts} attempts ({res.status})")
+                    stragglers[run.name].append({"filename": item['filename'], "status": res.status,
+                                                 "attempts": res.attempts, "retry_reasons": res.retry_reasons})
+                    continue
+                print(f"{tag}[{progress[run.name]}/{totals[run.name]}] Evaluated {item['filename']}")
+
+                run.record(res)
+                append_result(out_files[run.name], res)
+                if run.adaptive is not None and not run.stopped and run.adaptive.check():
+                    run.stopped = True
+                    print(f"{tag}[Adaptive] Converged after {run.adaptive.rows} rows, stopping: "
+                          f"{run.adaptive.describe()}")
+
+                if res['error_km'] is not None:
+                    print(f"  -> Error: {res['error_km']:.2f} km | WLA: {res['wla_score']:.1f}")
+                else:
+                    print(f"  -> Failed to parse: {res['prediction_text']}")
+                if progress[run.name] % LIVE_SUMMARY_EVERY == 0:
+                    print(f"{tag}[Live] {format_summary(run.metrics.summary())}")
+                    run.save_metrics()
+                    run.save_telemetry()
+
+        for run in runs:
+            if run.adaptive is not None:
+                run.adaptive.save(adaptive_path(run.output_path), len(run.already_done) + totals[run.name])
+            path = write_stragglers(run.output_path, stragglers[run.name])
+            if path:
+                print(f"[{run.name}] Stragglers: {len(stragglers[run.name])} images failed permanently, "
+                      f"listed in {path}; rerun to retry them")
+
+    for run in runs:
+        print_report(run)
+    if token_profile is not None:
+        token_profile.close()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Response Cache: {stats['hits']} hits / {stats['misses']} misses "
+              f"({stats['hit_rate']*100:.1f}% hit rate)")
+        cache.close()
+    if manifest is not None:
+        manifest.close()
+    if media_server is not None:
+        media_server.close()
+
+
+def format_summary(summary):
+    parts = [f"{summary['rows']} rows"]
+    if summary['mean_wla'] is not None:
+        parts.append(f"WLA {summary['mean_wla']*100:.2f}%")
+        parts.append(f"median {summary['median_error_km']:.1f} km")
+    if summary['failure_rate'] is not None:
+        parts.append(f"failed {summary['failure_rate']*100:.1f}%")
+    if summary['mean_tbs_km'] is not None:
+        parts.append(f"TBS {summary['mean_tbs_km']:.2f} km")
+    return " | ".join(parts)
+
+
+def print_report(run):
+    """Summary report for one model, read from its running accumulators (new and resumed rows)."""
+    summary = run.metrics.summary()
 
     print("\n" + "="*30)
     print("  SIGNPOST-Bench Evaluation Report")
     print("="*30)
-    if valid_count > 0:
-        print(f"Mean WLA Score: {total_wla/valid_count*100:.2f}%")
-    if tbs_count > 0:
-        print(f"Mean TBS Score: {tbs_sum/tbs_count:.2f} km")
+    print(f"Model: {run.name}")
+    if summary['mean_wla'] is not None:
+        print(f"Mean WLA Score: {summary['mean_wla']*100:.2f}%")
+        print(f"Median Error: {summary['median_error_km']:.2f} km")
+    if summary['failure_rate'] is not None:
+        print(f"Failure Rate: {summary['failure_rate']*100:.2f}% ({summary['rows'] - summary['valid']}/{summary['rows']})")
+    if summary['mean_tbs_km'] is not None:
+        print(f"Mean TBS Score: {summary['mean_tbs_km']:.2f} km")
     else:
         print("Mean TBS Score: N/A (No paired clean/adv samples found)")
-    print(f"Detailed results saved to {final_output_path}")
+    if run.adaptive is not None:
+        decision = (f"converged after {run.adaptive.stopped_at} rows" if run.adaptive.stopped_at is not None
+                    else "not converged, every image run")
+        print(f"Adaptive Stop: {decision} ({run.adaptive.rows} rows); {run.adaptive.describe()}")
+        print(f"Stopping decision saved to {adaptive_path(run.output_path)}")
+    if run.client.hedge is not None:
+        hedge = run.client.hedge.snapshot()
+        latency = f"{hedge['latency_s']:.1f}s" if hedge['latency_s'] is not None else "n/a"
+        print(f"Hedged Requests: {hedge['hedges']} ({hedge['hedge_wins']} won by the duplicate), "
+              f"p{hedge['percentile']*100:g} latency {latency}; {summary['hedged']} rows hedged in total")
+    limiter = run.client.rate_limiter.snapshot()
+    print(f"Rate Limiter ({limiter['provider']}): in-flight limit {limiter['limit']}, "
+          f"throttled {limiter['throttled']} times")
+    if run.telemetry.rows:
+        for line in format_report(run.save_telemetry()):
+            print(line)
+        print(f"Telemetry saved to {telemetry_path(run.output_path)} and {prom_path(run.output_path)}")
+    run.save_metrics()
+    print(f"Summary saved to {summary_path(run.output_path)}")
+
 
 if __name__ == "__main__":
     main()
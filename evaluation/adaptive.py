@@ -0,0 +1,219 @@
+"""
+evaluation/adaptive.py
+======================
+Adaptive sequential evaluation: stop a (model, attack) run once its metrics have converged.
+
+With `evaluate.py --adaptive`, images are run in a stratified random order
+instead of directory order, so every prefix of the run is a representative
+sample. The strata are geographic bins of the ground truth (STRATUM_DEG
+degrees), and the strata are interleaved in proportion to their size. The
+order within a stratum is a seeded hash of the image's base id. That puts the
+same base images first in the Original run and in every attack run, so the
+TBS pairs of an early-stopped attack run find their clean rows.
+
+AdaptiveStop tracks confidence intervals for the run's WLA (mean over parsed
+rows, normal approximation), median error (distribution-free, from order
+statistics) and TBS (mean, normal approximation). Every CHECK_EVERY rows past
+`min_rows`, the run stops once each half-width is within its target. The
+median target is relative to the median. A metric without samples, such as TBS
+of the Original run, does not block. The intervals are re-checked after every
+look, so their nominal coverage is optimistic. Checking only every CHECK_EVERY
+rows, with a minimum sample, keeps that small.
+
+The decision, the targets and the achieved precision are written to
+`<output>.adaptive.json`. Resumed rows count, so a rerun of a converged run
+stops at once.
+
+Usage:
+    items = stratified_order(work_items, seed=0)
+    stop = AdaptiveStop(AdaptiveTargets(wla=0.02, median_rel=0.10, tbs_km=100))
+    stop.add(row)
+    if stop.check(): ...                      # converged
+    stop.save(adaptive_path("results_Adversarial_qwen3-30b.jsonl"))
+"""
+
+import bisect
+import hashlib
+import json
+import math
+import os
+from collections import defaultdict
+from statistics import NormalDist
+from typing import List, NamedTuple, Optional
+
+# Size (degrees) of the lat/lon bins the order is stratified by
+STRATUM_DEG = 30
+# Rows between two convergence checks
+CHECK_EVERY = 25
+MIN_ROWS = 200
+CONFIDENCE = 0.95
+
+
+class AdaptiveTargets(NamedTuple):
+    wla: float = 0.02          # WLA half-width (0.02 = ±2 percentage points)
+    median_rel: float = 0.10   # median error half-width, relative to the median
+    tbs_km: float = 100.0      # TBS half-width (km)
+
+
+def _unit_hash(seed: int, key: str) -> float:
+    """Deterministic uniform [0, 1) draw for a key."""
+    digest = hashlib.sha1(f"{seed}:{key}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def _base_key(item: dict) -> str:
+    """Key shared by a clean image and its attacked versions."""
+    if item.get("base_id"):
+        return item["base_id"]
+    source = (item.get("meta_info") or {}).get("original_source") or item["filename"]
+    return os.path.splitext(source.split('_')[0])[0]
+
+
+def stratum_of(lat: float, lon: float, deg: float = STRATUM_DEG) -> tuple:
+    return int((lat + 90) // deg), int((lon + 180) // deg)
+
+
+def stratified_order(items: List[dict], seed: int = 0, deg: float = STRATUM_DEG) -> List[dict]:
+    """
+    Work items in a seeded order whose every prefix holds each geographic
+    stratum in proportion to its size (systematic interleaving).
+    """
+    strata = defaultdict(list)
+    for item in items:
+        strata[stratum_of(*item["gt"], deg)].append(item)
+    keyed = []
+    for stratum, members in strata.items():
+        members.sort(key=lambda it: (_unit_hash(seed, _base_key(it)), it["filename"]))
+        offset = _unit_hash(seed, f"stratum{stratum}")
+        keyed.extend(((rank + offset) / len(members), item) for rank, item in enumerate(members))
+    keyed.sort(key=lambda pair: (pair[0], _unit_hash(seed, _base_key(pair[1]))))
+    return [item for _, item in keyed]
+
+
+class _Moments:
+    """Welford running mean / variance."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def half_width(self, z: float) -> Optional[float]:
+        if self.n < 2:
+            return None
+        return z * math.sqrt(self.m2 / (self.n - 1) / self.n)
+
+
+class AdaptiveStop:
+    """Running confidence intervals of one run and its stopping decision."""
+
+    def __init__(self, targets: AdaptiveTargets = AdaptiveTargets(), confidence: float = CONFIDENCE,
+                 min_rows: int = MIN_ROWS, check_every: int = CHECK_EVERY):
+        self.targets = targets
+        self.confidence = confidence
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.min_rows = min_rows
+        self.check_every = check_every
+        self.rows = 0
+        self.wla = _Moments()
+        self.tbs = _Moments()
+        self.errors = []          # sorted, for the median's order-statistic interval
+        self.stopped_at = None    # rows when the run converged
+        self._last_check = 0
+
+    def add(self, row: dict) -> None:
+        self.rows += 1
+        if row.get("error_km") is not None:
+            self.wla.add(row.get("wla_score") or 0.0)
+            bisect.insort(self.errors, row["error_km"])
+        if row.get("tbs") is not None:
+            self.tbs.add(row["tbs"])
+
+    def median_interval(self) -> Optional[tuple]:
+        """(median, lower, upper) error; the bounds are order statistics n/2 ∓ z·√n/2."""
+        n = len(self.errors)
+        if n == 0:
+            return None
+        median = (self.errors[(n - 1) // 2] + self.errors[n // 2]) / 2
+        spread = self.z * math.sqrt(n) / 2
+        lo = max(0, math.floor(n / 2 - spread) - 1)
+        hi = min(n - 1, math.ceil(n / 2 + spread))
+        return median, self.errors[lo], self.errors[hi]
+
+    def precision(self) -> dict:
+        """Estimate, interval half-width, samples and whether the target is met, per metric."""
+        out = {}
+        hw = self.wla.half_width(self.z)
+        out["wla"] = {"estimate": self.wla.mean if self.wla.n else None, "half_width": hw, "n": self.wla.n,
+                      "target": self.targets.wla, "met": hw is not None and hw <= self.targets.wla}
+        median = self.median_interval()
+        entry = {"estimate": None, "half_width": None, "relative_half_width": None, "n": len(self.errors),
+                 "target": self.targets.median_rel, "met": False}
+        if median is not None:
+            value, lo, hi = median
+            rel = (hi - lo) / 2 / value if value > 0 else None
+            entry.update(estimate=value, lower=lo, upper=hi, half_width=(hi - lo) / 2, relative_half_width=rel,
+                         met=rel is not None and rel <= self.targets.median_rel)
+        out["median_error_km"] = entry
+        hw = self.tbs.half_width(self.z)
+        out["tbs_km"] = {"estimate": self.tbs.mean if self.tbs.n else None, "half_width": hw, "n": self.tbs.n,
+                         "target": self.targets.tbs_km,
+                         "met": None if self.tbs.n == 0 else hw is not None and hw <= self.targets.tbs_km}
+        return out
+
+    def converged(self) -> bool:
+        if self.rows < self.min_rows:
+            return False
+        return all(m["met"] is not False for m in self.precision().values())
+
+    def check(self, force: bool = False) -> bool:
+        """Convergence check, made every check_every rows (or now with force). True once stopped."""
+        if self.stopped_at is not None:
+            return True
+        if not force and self.rows - self._last_check < self.check_every:
+            return False
+        self._last_check = self.rows
+        if self.converged():
+            self.stopped_at = self.rows
+        return self.stopped_at is not None
+
+    def describe(self) -> str:
+        p = self.precision()
+        parts = []
+        if p["wla"]["half_width"] is not None:
+            parts.append(f"WLA {p['wla']['estimate']*100:.2f}% ±{p['wla']['half_width']*100:.2f}")
+        if p["median_error_km"]["relative_half_width"] is not None:
+            m = p["median_error_km"]
+            parts.append(f"median {m['estimate']:.1f} km ±{m['relative_half_width']*100:.0f}%")
+        if p["tbs_km"]["half_width"] is not None:
+            parts.append(f"TBS {p['tbs_km']['estimate']:.1f} ±{p['tbs_km']['half_width']:.1f} km")
+        return " | ".join(parts) or "no parsed rows yet"
+
+    def to_dict(self, total: Optional[int] = None) -> dict:
+        return {
+            "decision": "converged" if self.stopped_at is not None else "exhausted",
+            "stopped_at_rows": self.stopped_at,
+            "rows": self.rows,
+            "total_images": total,
+            "confidence": self.confidence,
+            "min_rows": self.min_rows,
+            "targets": self.targets._asdict(),
+            "precision": self.precision(),
+        }
+
+    def save(self, path: str, total: Optional[int] = None) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(total), f, indent=2)
+        os.replace(tmp, path)
+
+
+def adaptive_path(output_path: str) -> str:
+    """Sidecar file holding the stopping decision of a results file."""
+    return output_path + ".adaptive.json"
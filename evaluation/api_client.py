@@ -25,7 +25,24 @@ import re
 import time
 import base64
 import io
+import math
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from collections import Counter
 from typing import Optional, Tuple
+from urllib.parse import quote
+
+from requests.adapters import HTTPAdapter
+
+from evaluation.coord_parser import has_complete_coordinates, parse_coordinates
+from evaluation.endpoint_pool import get_pool, split_api_bases
+from evaluation.hedging import Cancellation, Cancelled, HedgePolicy, once, run_async
+from evaluation.image_policy import ImagePolicy, policy_for
+from evaluation.image_tokens import OUTPUT_TOKENS_EST, budget_scale, estimate_request_tokens, image_size_from_base64
+from evaluation.rate_limiter import get_limiter, parse_retry_after
+from evaluation.response_cache import ResponseCache
+from evaluation.structured_output import complete_answer, coordinate_constraint, rejects_constraint, structured_mode
 
 
 # ===========================================================================
@@ -36,10 +53,23 @@ PROVIDER_CONFIGS = {
     # Local vLLM (self-hosted, no API key required)
     "local": {
         "api_base": "http://0.0.0.0:8001/v1",
+        # Replicas of the same model, load-balanced by the client (overrides api_base), e.g.
+        # ["http://gpu1:8001/v1", "http://gpu2:8001/v1"]; --api-base also takes a comma-separated list
+        "api_bases": None,
         "requires_api_key": False,
         "default_api_key": "local-key",
         "supports_frequency_penalty": True,
         "max_image_size_mb": None,  # No limit
+        "pool_size": 64,  # vLLM batches many concurrent requests
+        "keep_alive": True,
+        "requests_per_min": None,  # Server-side batching; only cap in-flight requests
+        "tokens_per_min": None,
+        "max_in_flight": 64,
+        "token_rule": "pixels_750",
+        "image_token_budget": None,  # Resize images to this many tokens (None = full size)
+        "structured": "guided",  # --structured: vLLM guided decoding (see evaluation/structured_output.py)
+        # Usage in every streamed chunk (vLLM continuous_usage_stats), so an early-closed stream still has it
+        "continuous_stream_usage": True,
         "notes": "Self-hosted vLLM. Start with: vllm serve <model> --port 8001",
     },
     # School relay station (LCPU)
@@ -49,6 +79,14 @@ PROVIDER_CONFIGS = {
         "default_api_key": None,
         "supports_frequency_penalty": False,
         "max_image_size_mb": 20,
+        "pool_size": 16,
+        "keep_alive": True,
+        "requests_per_min": 60,
+        "tokens_per_min": 200_000,
+        "max_in_flight": 8,
+        "token_rule": "pixels_750",
+        "image_token_budget": None,
+        "structured": None,
         "notes": "LCPU school relay. Supports GPT, Claude, Gemini, Qwen, etc.",
     },
     # SiliconFlow (open-source models)
@@ -58,6 +96,15 @@ PROVIDER_CONFIGS = {
         "default_api_key": None,
         "supports_frequency_penalty": False,
         "max_image_size_mb": 10,
+        "pool_size": 16,
+        "keep_alive": True,
+        "requests_per_min": 1000,  # Default account tier; raise for higher tiers
+        "tokens_per_min": 400_000,
+        "max_in_flight": 32,
+        "token_rule": "pixels_750",
+        "image_token_budget": None,
+        "structured": None,
+        "supports_batch": True,  # OpenAI-compatible /files + /batches
         "notes": "SiliconFlow cloud. Good for large open-source models (Qwen2.5-VL-72B, InternVL, etc.)",
     },
     # OpenRouter (multi-provider gateway)
@@ -67,6 +114,15 @@ PROVIDER_CONFIGS = {
         "default_api_key": None,
         "supports_frequency_penalty": False,
         "max_image_size_mb": 20,
+        "pool_size": 16,
+        "keep_alive": True,
+        "requests_per_min": None,  # No fixed quota for paid models; rely on 429 feedback
+        "tokens_per_min": None,
+        "max_in_flight": 32,
+        "token_rule": "pixels_750",
+        "token_rule_by_prefix": {"openai/": "openai_tiles"},
+        "image_token_budget": None,
+        "structured": None,
         "notes": "OpenRouter gateway. Supports GPT-4o, Claude, Gemini, Llama, etc.",
         "extra_headers": {
             "HTTP-Referer": "https://github.com/inorganicwriter/SIGNPOST-Bench",
@@ -80,6 +136,15 @@ PROVIDER_CONFIGS = {
         "default_api_key": None,
         "supports_frequency_penalty": True,
         "max_image_size_mb": 20,
+        "pool_size": 16,
+        "keep_alive": True,
+        "requests_per_min": 500,  # Tier-2 limits; adjust to your account
+        "tokens_per_min": 800_000,
+        "max_in_flight": 32,
+        "token_rule": "openai_tiles",
+        "image_token_budget": None,
+        "structured": "json_schema",
+        "supports_batch": True,
         "notes": "OpenAI direct API.",
     },
 }
@@ -87,6 +152,11 @@ PROVIDER_CONFIGS = {
 # ===========================================================================
 #  Model Registry: short_name -> {model_id, provider}
 # ===========================================================================
+# Optional "fallbacks": equivalent entries (same weights) tried in order when the
+# model's own backend is down; see evaluation/failover.py.
+# Optional "structured": output constraint used with --structured ("guided",
+# "json_schema", "stop" or None), overriding the provider's; see
+# evaluation/structured_output.py.
 
 MODEL_REGISTRY = {
     # =========================================================
@@ -113,11 +183,13 @@ MODEL_REGISTRY = {
         "model": "Qwen/Qwen3-VL-235B-A22B-Thinking",
         "provider": "siliconflow",
         "thinking": True,
+        "fallbacks": ["qwen3-vl-235b-thinking-or"],
     },
     "qwen3-vl-235b-sf": {
         "model": "Qwen/Qwen3-VL-235B-A22B-Instruct",
         "provider": "siliconflow",
         "thinking": False,
+        "fallbacks": ["qwen3-vl-235b-or"],
     },
     "qwen3-vl-32b-thinking-sf": {
         "model": "Qwen/Qwen3-VL-32B-Thinking",
@@ -128,26 +200,31 @@ MODEL_REGISTRY = {
         "model": "Qwen/Qwen3-VL-32B-Instruct",
         "provider": "siliconflow",
         "thinking": False,
+        "fallbacks": ["qwen3-vl-32b-or"],
     },
     "qwen3-vl-30b-thinking-sf": {
         "model": "Qwen/Qwen3-VL-30B-A3B-Thinking",
         "provider": "siliconflow",
         "thinking": True,
+        "fallbacks": ["qwen3-vl-30b-thinking-or"],
     },
     "qwen3-vl-30b-sf": {
         "model": "Qwen/Qwen3-VL-30B-A3B-Instruct",
         "provider": "siliconflow",
         "thinking": False,
+        "fallbacks": ["qwen3-vl-30b-or"],
     },
     "qwen3-vl-8b-thinking-sf": {
         "model": "Qwen/Qwen3-VL-8B-Thinking",
         "provider": "siliconflow",
         "thinking": True,
+        "fallbacks": ["qwen3-vl-8b-thinking-or"],
     },
     "qwen3-vl-8b-sf": {
         "model": "Qwen/Qwen3-VL-8B-Instruct",
         "provider": "siliconflow",
         "thinking": False,
+        "fallbacks": ["qwen3-vl-8b-or"],
     },
     # Qwen2.5-VL series
     "qwen2.5-vl-72b-sf": {
@@ -184,41 +261,49 @@ MODEL_REGISTRY = {
         "model": "openai/gpt-5",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gpt-5.4": {
         "model": "openai/gpt-5.4",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gpt-5.4-mini": {
         "model": "openai/gpt-5.4-mini",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gpt-4.1": {
         "model": "openai/gpt-4.1",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gpt-4.1-mini": {
         "model": "openai/gpt-4.1-mini",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gpt-4o": {
         "model": "openai/gpt-4o",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "o3": {
         "model": "openai/o3",
         "provider": "openrouter",
         "thinking": True,
+        "structured": "json_schema",
     },
     "o4-mini": {
         "model": "openai/o4-mini",
         "provider": "openrouter",
         "thinking": True,
+        "structured": "json_schema",
     },
 
     # --- Anthropic Claude ---
@@ -253,26 +338,31 @@ MODEL_REGISTRY = {
         "model": "google/gemini-3.1-pro-preview",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gemini-3.1-flash": {
         "model": "google/gemini-3.1-flash-image-preview",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gemini-3-pro": {
         "model": "google/gemini-3-pro-preview",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gemini-2.5-pro": {
         "model": "google/gemini-2.5-pro",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
     "gemini-2.5-flash": {
         "model": "google/gemini-2.5-flash",
         "provider": "openrouter",
         "thinking": False,
+        "structured": "json_schema",
     },
 
     # --- xAI Grok ---
@@ -292,36 +382,43 @@ MODEL_REGISTRY = {
         "model": "qwen/qwen3-vl-235b-a22b-instruct",
         "provider": "openrouter",
         "thinking": False,
+        "fallbacks": ["qwen3-vl-235b-sf"],
     },
     "qwen3-vl-235b-thinking-or": {
         "model": "qwen/qwen3-vl-235b-a22b-thinking",
         "provider": "openrouter",
         "thinking": True,
+        "fallbacks": ["qwen3-vl-235b-thinking-sf"],
     },
     "qwen3-vl-32b-or": {
         "model": "qwen/qwen3-vl-32b-instruct",
         "provider": "openrouter",
         "thinking": False,
+        "fallbacks": ["qwen3-vl-32b-sf"],
     },
     "qwen3-vl-30b-or": {
         "model": "qwen/qwen3-vl-30b-a3b-instruct",
         "provider": "openrouter",
         "thinking": False,
+        "fallbacks": ["qwen3-vl-30b-sf"],
     },
     "qwen3-vl-30b-thinking-or": {
         "model": "qwen/qwen3-vl-30b-a3b-thinking",
         "provider": "openrouter",
         "thinking": True,
+        "fallbacks": ["qwen3-vl-30b-thinking-sf"],
     },
     "qwen3-vl-8b-or": {
         "model": "qwen/qwen3-vl-8b-instruct",
         "provider": "openrouter",
         "thinking": False,
+        "fallbacks": ["qwen3-vl-8b-sf"],
     },
     "qwen3-vl-8b-thinking-or": {
         "model": "qwen/qwen3-vl-8b-thinking",
         "provider": "openrouter",
         "thinking": True,
+        "fallbacks": ["qwen3-vl-8b-thinking-sf"],
     },
     "qwen3.5-397b-or": {
         "model": "qwen/qwen3.5-397b-a17b",
@@ -531,10 +628,49 @@ MODEL_REGISTRY = {
 }
 
 
+# ===========================================================================
+#  Pooled HTTP Transport
+# ===========================================================================
+
+# One keep-alive session per (provider, api_base), shared by every client in the
+# process so TCP/TLS connections are reused across requests, retries and models.
+_SESSIONS = {}
+_SESSION_POOL_SIZES = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(provider: str, api_base: str, pool_size: int = 16) -> requests.Session:
+    """Return the shared pooled session for a provider endpoint, growing its pool if needed."""
+    key = (provider, api_base)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            _SESSIONS[key] = session
+        if _SESSION_POOL_SIZES.get(key, 0) < pool_size:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION_POOL_SIZES[key] = pool_size
+        return session
+
+
 # ===========================================================================
 #  Unified API Client
 # ===========================================================================
 
+# Error messages of a server that reads no path/URL images at all (vLLM without --allowed-local-media-path)
+_LOCAL_MEDIA_REFUSALS = ("allowed-local-media-path", "allowed_local_media_path", "local files", "local media")
+
+
+def _refuses_local_media(status, message: str) -> bool:
+    """True if an image fetch error is about path/URL images in general, not just this one (404)."""
+    if status == 404:
+        return False
+    message = message.lower()
+    return status in (403, 415) or any(hint in message for hint in _LOCAL_MEDIA_REFUSALS)
+
+
 class GeoLocalizationClient:
     """
     Unified client for geo-localization inference across multiple API providers.
@@ -543,10 +679,38 @@ class GeoLocalizationClient:
     - Provider-specific headers and parameters
     - Thinking model tag stripping (<think>...</think>)
     - Automatic retry with temperature escalation
-    - Image compression for providers with size limits
+    - Image downscaling to a per provider/model image-token budget and to
+      providers' payload size limits
     - Coordinate parsing with multiple fallback strategies
+    - Pooled keep-alive connections shared per provider endpoint
+    - Optional on-disk response cache checked before any network call
+    - Shared per-provider rate limiting (RPM/TPM quotas, AIMD in-flight window)
+    - Optional hedged requests against tail latency (same or alternate endpoint)
+    - Optional SSE streaming that stops as soon as the answer holds coordinates,
+      or when a thinking model's reasoning exceeds its budget
+    - Load balancing over several replicas (api_base given as a list): least
+      outstanding requests, sticky per image, unhealthy replicas taken out
+    - Image transport for self-hosted servers: file:// paths or media-server URLs
+      instead of base64 data URLs; an image the server can't read goes inline as base64,
+      and repeated refusals of local media switch the client to base64
+    - Optional structured output (guided regex / JSON schema / stop sequence) so
+      answers parse without temperature-escalated retries
+    - Optional deferred retries: transient failures return at once ("deferred")
+      for the caller's retry queue instead of sleeping in the call
     """
 
+    # Stand-in for the image in the serialized request body; the real base64
+    # string is spliced in as raw bytes so it is never re-encoded by json.dumps.
+    _IMAGE_PLACEHOLDER = "__SIGNPOST_IMAGE_B64__"
+
+    # Rough size of a token in streamed text, for the reasoning budget
+    CHARS_PER_TOKEN = 4
+
+    IMAGE_TRANSPORTS = ("base64", "file", "http")
+
+    # Rejections of a request option, across all calls, before it is dropped for the rest of the run
+    REJECTIONS_TO_DISABLE = 3
+
     PROMPT = (
         "Analyze this photo and determine where it was taken.\n"
         "You MUST provide your best estimate of GPS coordinates even if uncertain.\n"
@@ -558,69 +722,141 @@ class GeoLocalizationClient:
     def __init__(
         self,
         model_name: str,
-        api_base: str,
+        api_base,
         api_key: str,
         provider: str = "local",
         is_thinking_model: bool = False,
         max_tokens: int = 2048,
         max_retries: int = 3,
         timeout: int = 90,
+        pool_size: Optional[int] = None,
+        keep_alive: Optional[bool] = None,
+        cache: Optional[ResponseCache] = None,
+        hedge: Optional[HedgePolicy] = None,
+        hedge_client: Optional["GeoLocalizationClient"] = None,
+        stream: bool = False,
+        reasoning_budget: Optional[int] = None,
+        backend: Optional[str] = None,
+        image_transport: str = "base64",
+        media_server=None,
+        image_policy: Optional[ImagePolicy] = None,
+        structured: Optional[str] = None,
+        defer_retries: bool = False,
     ):
         self.model_name = model_name
-        self.api_base = api_base.rstrip("/")
+        api_bases = split_api_bases(api_base)
+        self.api_base = api_bases[0]
         self.api_key = api_key
         self.provider = provider
         self.is_thinking_model = is_thinking_model
         self.max_tokens = max_tokens
         self.max_retries = max_retries
         self.timeout = timeout
+        self.cache = cache
+        self.hedge = hedge
+        # Endpoint the duplicate of a hedged request goes to (None = this client)
+        self.hedge_client = hedge_client
+        self.stream = stream
+        # Max reasoning tokens (estimated from streamed text) before a thinking stream is cut
+        self.reasoning_budget = reasoning_budget
+        # Name recorded in each result row's "backend" field (registry short name when built by build_client)
+        self.backend = backend or f"{provider}:{model_name}"
+        # "file": file:// paths, "http": URLs from media_server (an evaluation.media_server.MediaServer).
+        # Only a self-hosted server can read either; cloud providers always get base64.
+        if image_transport not in self.IMAGE_TRANSPORTS:
+            raise ValueError(f"Unknown image transport '{image_transport}' (expected one of {self.IMAGE_TRANSPORTS})")
+        if image_transport != "base64" and provider != "local":
+            print(f"  [WARN] Image transport '{image_transport}' needs a self-hosted server; "
+                  f"using base64 for {provider}")
+            image_transport = "base64"
+        if image_transport == "http" and media_server is None:
+            raise ValueError("Image transport 'http' needs a media_server")
+        self.image_transport = image_transport
+        self.media_server = media_server
+        # Image-token budget; evaluate.py resizes ahead of time, the client only catches what's still over
+        self.image_policy = image_policy
+        # Output constraint (evaluation.structured_output.STRUCTURED_MODES), None = free text
+        self.structured = structured
+        # Hand transient failures back as status "deferred" (see evaluation/retry_queue.py)
+        self.defer_retries = defer_retries
+        # Server rejections per option ("structured", "image_transport"); the client is shared by all workers
+        self._rejections = Counter()
+        self._options_lock = threading.Lock()
 
         provider_cfg = PROVIDER_CONFIGS.get(provider, {})
         self.supports_frequency_penalty = provider_cfg.get("supports_frequency_penalty", False)
+        self.continuous_stream_usage = provider_cfg.get("continuous_stream_usage", False)
         self.max_image_size_mb = provider_cfg.get("max_image_size_mb", None)
         self.extra_headers = provider_cfg.get("extra_headers", {})
+        # Never pool fewer connections than the caller intends to keep in flight
+        self.pool_size = max(pool_size or 0, provider_cfg.get("pool_size", 16))
+        self.keep_alive = provider_cfg.get("keep_alive", True) if keep_alive is None else keep_alive
+
+        self._session = get_session(provider, self.api_base, self.pool_size)
+        self._headers = self._build_headers()
+
+        # Several replicas: route through a shared EndpointPool, one pooled session each
+        self.endpoints = None
+        if len(api_bases) > 1:
+            self.endpoints = get_pool(api_bases, self._headers)
+            self._sessions = {b: get_session(provider, b, self.pool_size) for b in api_bases}
+            if provider_cfg.get("max_in_flight"):
+                provider_cfg = dict(provider_cfg, max_in_flight=provider_cfg["max_in_flight"] * len(api_bases))
+        self.rate_limiter = get_limiter(provider, provider_cfg)
 
     def _build_headers(self) -> dict:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
+        if not self.keep_alive:
+            headers["Connection"] = "close"
         headers.update(self.extra_headers)
         return headers
 
-    def _compress_image_if_needed(self, base64_image: str) -> str:
-        """Compress image if it exceeds provider's size limit."""
-        if self.max_image_size_mb is None:
-            return base64_image
-
+    def _fit_image(self, base64_image: str) -> Tuple[str, float]:
+        """
+        Downscale an image to the image-token budget and the provider's payload size
+        limit. Returns (base64, scale); the input string itself when nothing is needed.
+        """
+        scale = 1.0
+        size = image_size_from_base64(base64_image)
+        if self.image_policy is not None and size is not None:
+            scale = budget_scale(*size, self.image_policy.token_budget, self.image_policy.token_rule)
+            if scale > 0.98:
+                scale = 1.0  # Rounding of an image already resized for the budget, not worth a second pass
         size_mb = len(base64_image) * 3 / 4 / (1024 * 1024)
-        if size_mb <= self.max_image_size_mb:
-            return base64_image
+        if self.max_image_size_mb is not None and size_mb > self.max_image_size_mb:
+            # Encoded size grows about linearly with the pixel count; keep 10% headroom
+            scale = min(scale, math.sqrt(self.max_image_size_mb / size_mb) * 0.9)
+        if scale >= 1.0:
+            return base64_image, 1.0
 
         try:
             from PIL import Image
-            img_bytes = base64.b64decode(base64_image)
-            img = Image.open(io.BytesIO(img_bytes))
-
-            # Resize to fit within limit
-            max_pixels = int(self.max_image_size_mb * 1024 * 1024 * 0.75)
+            img = Image.open(io.BytesIO(base64.b64decode(base64_image))).convert("RGB")
             w, h = img.size
-            scale = (max_pixels / (w * h * 3)) ** 0.5
-            if scale < 1.0:
-                new_w, new_h = int(w * scale), int(h * scale)
-                img = img.resize((new_w, new_h), Image.LANCZOS)
-
+            img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
             buf = io.BytesIO()
             img.save(buf, format="JPEG", quality=85)
-            compressed = base64.b64encode(buf.getvalue()).decode("utf-8")
-            print(f"  [IMG] Compressed {size_mb:.1f}MB -> {len(compressed)*3/4/1024/1024:.1f}MB")
-            return compressed
+            fitted = base64.b64encode(buf.getvalue()).decode("utf-8")
+            print(f"  [IMG] Resized {w}x{h} -> {img.size[0]}x{img.size[1]} "
+                  f"({size_mb:.1f}MB -> {len(fitted)*3/4/1024/1024:.1f}MB)")
+            return fitted, scale
         except ImportError:
-            print("  [WARN] PIL not installed, skipping image compression")
-            return base64_image
+            print("  [WARN] PIL not installed, skipping image resizing")
         except Exception as e:
-            print(f"  [WARN] Image compression failed: {e}")
-            return base64_image
+            print(f"  [WARN] Image resizing failed: {e}")
+        return base64_image, 1.0
+
+    def health_check(self, timeout: float = 10) -> bool:
+        """True if the endpoint (any replica) answers GET /models."""
+        if self.endpoints is not None:
+            return self.endpoints.check_all() > 0
+        try:
+            return self._session.get(f"{self.api_base}/models", headers=self._headers, timeout=timeout).ok
+        except requests.RequestException:
+            return False
 
     def _clean_thinking_tags(self, text: str) -> str:
         """Strip <think>...</think> tags from Thinking model output."""
@@ -634,7 +870,21 @@ class GeoLocalizationClient:
         text = re.sub(r"```[a-z]*\n?", "", text)
         return text.strip()
 
-    def _build_payload(self, base64_image: str, temperature: float) -> dict:
+    def _image_url(self, image_path: Optional[str]) -> Optional[str]:
+        """URL the server reads the image from, or None to send it inline as base64."""
+        if image_path is None or self.image_transport == "base64":
+            return None
+        if self.image_transport == "file":
+            return "file://" + quote(os.path.abspath(image_path))
+        try:
+            return self.media_server.url_for(image_path)
+        except ValueError as e:
+            # Outside the served roots: this image goes inline, the transport stays
+            print(f"  [WARN] {e}, sending it as base64")
+            return None
+
+    def _build_payload(self, base64_image: str, temperature: float, structured: Optional[str],
+                       stream: bool = False, image_url: Optional[str] = None) -> dict:
         payload = {
             "model": self.model_name,
             "messages": [
@@ -644,7 +894,7 @@ class GeoLocalizationClient:
                         {"type": "text", "text": self.PROMPT},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
+                            "image_url": {"url": image_url or f"data:image/jpeg;base64,{base64_image}"},
                         },
                     ],
                 }
@@ -654,122 +904,483 @@ class GeoLocalizationClient:
         }
         if self.supports_frequency_penalty:
             payload["frequency_penalty"] = 0.1
+        payload.update(coordinate_constraint(structured))
+        if stream:
+            payload["stream"] = True
+            # Token usage arrives in a final chunk (or in every chunk, where the server supports it)
+            payload["stream_options"] = {"include_usage": True}
+            if self.continuous_stream_usage:
+                payload["stream_options"]["continuous_usage_stats"] = True
         return payload
 
-    def predict_location(self, base64_image: str) -> Optional[str]:
+    def _build_body(self, image_bytes: bytes, temperature: float, structured: Optional[str]) -> bytes:
+        """
+        Serialize the request with the image URL (an already ASCII data:/file:/http: URL)
+        spliced in verbatim, so a base64 payload is never re-encoded by json.dumps.
+        """
+        head, tail = json.dumps(self._build_payload("", temperature, structured, self.stream,
+                                                    image_url=self._IMAGE_PLACEHOLDER)).split(self._IMAGE_PLACEHOLDER)
+        return b"".join((head.encode("utf-8"), image_bytes, tail.encode("utf-8")))
+
+    @staticmethod
+    def _inline_image(base64_image: str) -> bytes:
+        return b"data:image/jpeg;base64," + base64_image.encode("ascii")
+
+    def build_request_payload(self, base64_image: str) -> dict:
+        """First-attempt request body for an image, e.g. for offline batch submission."""
+        return self._build_payload(self._fit_image(base64_image)[0], 0.0, self.structured)
+
+    def content_from_result(self, result: dict) -> Optional[str]:
+        """Extract the cleaned answer text from a chat-completions response body (None if unusable)."""
+        if not result or not result.get("choices"):
+            return None
+        choice = result["choices"][0]
+        if choice.get("finish_reason") == "length" and self.is_thinking_model:
+            return None  # Thinking runaway
+        content = (choice.get("message") or {}).get("content") or ""
+        if self.is_thinking_model:
+            content = self._clean_thinking_tags(content)
+        return complete_answer(content, self.structured) or None
+
+    def _acquire(self, est_tokens: int, cancel: Optional[Cancellation]):
+        """
+        Take a rate-limiter slot. Returns its one-shot release, which `cancel` also
+        calls, so a cancelled request gives its slot back without waiting to finish.
+        """
+        self.rate_limiter.acquire(est_tokens)
+        release = once(self.rate_limiter.release)
+        if cancel is not None:
+            cancel.on_cancel(lambda: release("cancelled", est_tokens))
+            if cancel.cancelled:
+                raise Cancelled()  # Lost its hedge while waiting for the slot: never sent
+        return release
+
+    def _post(self, url: str, body: bytes, est_tokens: int, session: Optional[requests.Session] = None,
+              cancel: Optional[Cancellation] = None):
+        """
+        POST through the provider rate limiter (on `session`, default: this client's endpoint).
+        Returns (response, parsed_json); parsed_json is None for non-2xx responses.
+        Throttled responses (429/503) shrink the provider window and pause it for Retry-After.
+        Raises Cancelled if `cancel` fired before the response arrived.
+        """
+        release = self._acquire(est_tokens, cancel)
+        outcome, actual_tokens, retry_after = "error", None, None
+        try:
+            start = time.monotonic()
+            response = (session or self._session).post(url, headers=self._headers, data=body, timeout=self.timeout)
+            if cancel is not None and cancel.cancelled:
+                raise Cancelled()
+            if response.status_code in (429, 503):
+                outcome = "throttled"
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                return response, None
+            if not response.ok:
+                return response, None
+            result = response.json()
+            outcome = "ok"
+            actual_tokens = (result.get("usage") or {}).get("total_tokens")
+            if self.hedge is not None:
+                self.hedge.observe(time.monotonic() - start)
+            return response, result
+        finally:
+            release(outcome, est_tokens, actual_tokens=actual_tokens, retry_after=retry_after)
+
+    def _post_stream(self, url: str, body: bytes, est_tokens: int, session: Optional[requests.Session] = None,
+                     cancel: Optional[Cancellation] = None):
+        """
+        Streaming variant of _post. The SSE stream is consumed until the answer holds
+        complete coordinates (or the reasoning budget runs out) and then closed, so
+        the server stops generating. Returns (response, result) where result has the
+        shape of a non-streamed chat-completions body. `cancel` closes the stream.
+        """
+        release = self._acquire(est_tokens, cancel)
+        outcome, actual_tokens, retry_after = "error", None, None
+        try:
+            start = time.monotonic()
+            response = (session or self._session).post(url, headers=self._headers, data=body,
+                                                       timeout=self.timeout, stream=True)
+            if response.status_code in (429, 503):
+                outcome = "throttled"
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                response.close()
+                return response, None
+            if not response.ok:
+                response.content  # Read the short error body for the caller, which frees the connection
+                return response, None
+            if cancel is not None:
+                cancel.on_cancel(response.close)
+            content, finish_reason, ttfb, usage = self._consume_stream(response, start, cancel)
+            if cancel is not None and cancel.cancelled:
+                raise Cancelled()
+            outcome = "ok"
+            actual_tokens = (usage or {}).get("total_tokens")
+            if self.hedge is not None:
+                self.hedge.observe(time.monotonic() - start)
+            # "_ttfb_s": time to the first streamed delta, which the response headers don't show
+            return response, {"choices": [{"message": {"content": content}, "finish_reason": finish_reason}],
+                              "usage": usage, "_ttfb_s": ttfb}
+        finally:
+            release(outcome, est_tokens, actual_tokens=actual_tokens, retry_after=retry_after)
+
+    def _consume_stream(self, response, start: float, cancel: Optional[Cancellation] = None):
+        """
+        Read SSE chunks until done, complete coordinates, or the reasoning budget.
+        Returns (content, finish_reason, seconds to first delta, usage or None).
+        Usage is the last one seen: the final chunk of a stream read to the end
+        (stream_options.include_usage), or the running total of a stream closed
+        early on a server that sends continuous usage stats. Elsewhere the
+        stream is read to its end after complete coordinates, discarding any
+        further text, so the usage chunk is not lost.
+        """
+        content = ""
+        ttfb = None
+        usage = None
+        reasoning_chars = 0  # Reasoning sent in a separate delta field (vLLM reasoning parser, OpenRouter)
+        finish_reason = None
+        answered = False  # Complete coordinates seen, reading on to the usage chunk
+        budget_chars = self.reasoning_budget * self.CHARS_PER_TOKEN if self.reasoning_budget else None
+        try:
+            for line in response.iter_lines():
+                if cancel is not None and cancel.cancelled:
+                    break
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                if not chunk.get("choices"):
+                    continue
+                if ttfb is None:
+                    ttfb = time.monotonic() - start
+                choice = chunk["choices"][0]
+                delta = choice.get("delta") or {}
+                if answered:
+                    continue
+                reasoning_chars += len(delta.get("reasoning_content") or delta.get("reasoning") or "")
+                content += delta.get("content") or ""
+                finish_reason = choice.get("finish_reason") or finish_reason
+
+                # Split what has arrived into reasoning and answer
+                if not self.is_thinking_model:
+                    answer, thinking = content, 0
+                elif "</think>" in content:
+                    idx = content.index("</think>")
+                    answer, thinking = content[idx + len("</think>"):], reasoning_chars + idx
+                elif reasoning_chars:
+                    answer, thinking = content, reasoning_chars
+                else:
+                    answer, thinking = "", len(content)  # Still inside the reasoning
+
+                if answer and has_complete_coordinates(answer):
+                    finish_reason = "stop"
+                    if self.continuous_stream_usage and usage is not None:
+                        break
+                    answered = True
+                    continue
+                if budget_chars is not None and not answer and thinking > budget_chars:
+                    print(f"  ⚠️  Reasoning budget ({self.reasoning_budget} tokens) exceeded, closing stream")
+                    finish_reason = "length"
+                    break
+        finally:
+            response.close()
+        return content, finish_reason or "stop", ttfb, usage
+
+    def _post_image(self, image_bytes: bytes, temperature: float, est_tokens: int, structured: Optional[str],
+                    cancel: Optional[Cancellation] = None):
+        body = self._build_body(image_bytes, temperature, structured)
+        post = self._post_stream if self.stream else self._post
+        if self.endpoints is None:
+            return post(f"{self.api_base}/chat/completions", body, est_tokens, cancel=cancel)
+
+        # Keyed on the image so its retries go to the replica that has it in the prefix cache
+        api_base = self.endpoints.route(image_bytes)
+        release = once(self.endpoints.release)
+        if cancel is not None:
+            cancel.on_cancel(lambda: release(api_base))
+        failed = True  # Connection errors and timeouts raise before this is cleared
+        try:
+            response, result = post(f"{api_base}/chat/completions", body, est_tokens, self._sessions[api_base],
+                                    cancel=cancel)
+            failed = response.status_code >= 500 and response.status_code != 503  # 503 = busy, not down
+            return response, result
+        finally:
+            release(api_base, failed)
+
+    def _send(self, image_bytes: bytes, temperature: float, est_tokens: int, structured: Optional[str], info: dict):
+        """
+        One attempt, hedged when the policy has a delay: if no answer arrives within it,
+        a duplicate goes to hedge_client (or this endpoint), the first 2xx answer wins
+        and the other request is cancelled.
+        """
+        delay = self.hedge.delay() if self.hedge is not None else None
+        if delay is None:
+            return self._post_image(image_bytes, temperature, est_tokens, structured)
+
+        primary_cancel, secondary_cancel = Cancellation(), Cancellation()
+        primary = run_async(self._post_image, image_bytes, temperature, est_tokens, structured, primary_cancel)
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+
+        target = self.hedge_client or self
+        if not image_bytes.startswith(b"data:"):
+            target = self  # Only this (self-hosted) endpoint can read the image by path/URL
+        info["hedged"] = True
+        secondary = run_async(target._post_image, image_bytes, temperature, est_tokens, structured,
+                              secondary_cancel)
+        pending = {primary, secondary}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result()[1] is not None:
+                    self.hedge.record(won=future is secondary)
+                    (primary_cancel if future is secondary else secondary_cancel).cancel()
+                    return future.result()
+        # Neither produced a usable answer: report the original request's outcome
+        self.hedge.record(won=False)
+        return primary.result()
+
+    def predict_location(self, base64_image: str, image_path: Optional[str] = None) -> Optional[str]:
         """
         Run geo-localization inference on a base64-encoded image.
+        With a file/http image transport, the server reads the image from image_path
+        (same content as base64_image, which stays the fallback and the cache key).
         Returns the raw text response (coordinates), or None on failure.
         """
-        base64_image = self._compress_image_if_needed(base64_image)
-        url = f"{self.api_base}/chat/completions"
-        headers = self._build_headers()
-        current_temp = 0.0
+        return self.predict_location_detailed(base64_image, image_path)[0]
+
+    def predict_location_detailed(self, base64_image: str,
+                                  image_path: Optional[str] = None) -> Tuple[Optional[str], dict]:
+        """
+        Like predict_location, plus a dict of per-request details:
+            hedged             True if any attempt fired a duplicate request
+            status             ok / cached / no_coords / runaway / http_<code> / failed / deferred
+            latency_s          wall time of the whole call, retries included
+            ttfb_s             time to first byte (first streamed delta) of the final response
+            prompt_tokens, completion_tokens, reasoning_tokens
+                               usage summed over all attempts (None if never reported)
+            attempts           requests made; retry_reasons names why each failed attempt failed
+            temperature        temperature of the final attempt (> 0 means it was escalated)
+            compressed         True if the client recompressed the image (token budget or size limit)
+            image_scale        downscale factor the client applied (evaluate.py folds in its own)
+            backend            name of the backend that served the image
+            structured         output constraint of the final attempt (None = free text)
+            retry_after_s      with status "deferred": the server's Retry-After (None if not sent)
+            truncated          attempts cut at max_tokens (finish_reason "length"), any model
+            max_tokens, reasoning_budget
+                               limits the call was made with (calibrated ones change during a run)
+        """
+        info = {
+            "hedged": False, "status": None, "latency_s": None, "ttfb_s": None,
+            "prompt_tokens": None, "completion_tokens": None, "reasoning_tokens": None,
+            "attempts": 0, "retry_reasons": [], "temperature": 0.0, "compressed": False,
+            "image_scale": 1.0, "backend": self.backend, "structured": self.structured,
+            "retry_after_s": None, "truncated": 0, "max_tokens": self.max_tokens,
+            "reasoning_budget": self.reasoning_budget,
+        }
+        start = time.monotonic()
+        text = self._predict(base64_image, info, image_path)
+        info["latency_s"] = round(time.monotonic() - start, 3)
+        return text, info
 
-        for attempt in range(self.max_retries + 1):
-            payload = self._build_payload(base64_image, current_temp)
+    @staticmethod
+    def _add_usage(info: dict, usage: Optional[dict]) -> None:
+        if not usage:
+            return
+        details = usage.get("completion_tokens_details") or {}
+        reasoning = details.get("reasoning_tokens", usage.get("reasoning_tokens"))
+        for key, value in (("prompt_tokens", usage.get("prompt_tokens")),
+                           ("completion_tokens", usage.get("completion_tokens")),
+                           ("reasoning_tokens", reasoning)):
+            if value is not None:
+                info[key] = (info[key] or 0) + value
+
+    def _reject_option(self, option: str) -> None:
+        """
+        Count a server rejection that is clearly about a request option ("structured"
+        or "image_transport"). After REJECTIONS_TO_DISABLE of them the option is
+        dropped client-wide; until then only the rejected call goes without it.
+        """
+        with self._options_lock:
+            self._rejections[option] += 1
+            if self._rejections[option] != self.REJECTIONS_TO_DISABLE:
+                return
+            if option == "structured" and self.structured:
+                print(f"  [WARN] {self.provider} keeps rejecting '{self.structured}' structured output, "
+                      f"using free text from now on")
+                self.structured = None
+            elif option == "image_transport" and self.image_transport != "base64":
+                print(f"  [WARN] Server keeps rejecting the {self.image_transport} image transport, "
+                      f"using base64 from now on")
+                self.image_transport = "base64"
+
+    def _predict(self, base64_image: str, info: dict, image_path: Optional[str] = None) -> Optional[str]:
+        # Read once: a rejected constraint is dropped for this call only
+        structured = self.structured
+        # Cache key uses the original image content and the starting temperature
+        cache_key = None
+        if self.cache is not None:
+            # A constrained answer has its own format, so it gets its own entry
+            prompt = f"{self.PROMPT}\n[structured: {structured}]" if structured else self.PROMPT
+            cache_key = ResponseCache.make_key(
+                self.model_name, self.provider, prompt, base64_image, 0.0, self.max_tokens
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                info["status"] = "cached"
+                return cached
+
+        fitted, info["image_scale"] = self._fit_image(base64_image)
+        info["compressed"] = fitted is not base64_image
+        base64_image = fitted
+        image_url = None if info["compressed"] else self._image_url(image_path)
+        image_bytes = image_url.encode("ascii") if image_url else self._inline_image(base64_image)
+        current_temp = 0.0
+        est_tokens = estimate_request_tokens(
+            base64_image, output_tokens=self.max_tokens if self.is_thinking_model else OUTPUT_TOKENS_EST
+        )
+        retries = info["retry_reasons"]
+
+        attempt = -1
+        while attempt < self.max_retries:
+            attempt += 1
+            info["attempts"] += 1
+            info["temperature"] = round(current_temp, 2)
+            info["structured"] = structured
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
+                response, result = self._send(image_bytes, current_temp, est_tokens, structured, info)
                 response.raise_for_status()
-                result = response.json()
+                self._add_usage(info, result.get("usage"))
+                info["ttfb_s"] = round(result.get("_ttfb_s") or response.elapsed.total_seconds(), 3)
 
                 if "choices" not in result or not result["choices"]:
                     print(f"  [WARN] No choices in response (attempt {attempt+1})")
+                    retries.append("no_choices")
                     current_temp = min(current_temp + 0.1, 1.0)
                     continue
 
                 choice = result["choices"][0]
                 finish_reason = choice.get("finish_reason", "")
+                if finish_reason == "length":
+                    info["truncated"] += 1
 
                 # Thinking model runaway detection
                 if finish_reason == "length" and self.is_thinking_model:
                     if attempt < self.max_retries:
                         print(f"  ⚠️  Thinking runaway (truncated), retrying {attempt+1}/{self.max_retries}...")
+                        retries.append("runaway")
                         current_temp = min(current_temp + 0.1, 1.0)
                         continue
                     else:
                         print("  ❌ Max retries for thinking runaway.")
+                        info["status"] = "runaway"
                         return None
 
                 content = choice["message"].get("content", "")
                 if self.is_thinking_model:
                     content = self._clean_thinking_tags(content)
+                content = complete_answer(content, structured)
 
                 if content:
                     lat, lon = self.parse_coordinates(content)
                     if lat is not None:
+                        if cache_key is not None:
+                            self.cache.put(cache_key, content)
+                        info["status"] = "ok"
                         return content
                     # Coordinates not found, retry
                     if attempt < self.max_retries:
                         print(f"  ⚠️  No coordinates found, retrying {attempt+1}/{self.max_retries}...")
+                        retries.append("no_coords")
                         current_temp = min(current_temp + 0.15, 1.0)
                         continue
+                    info["status"] = "no_coords"
                     return content  # Return as-is on last attempt
 
+                if self.defer_retries:
+                    print(f"  ⚠️  Empty response, deferring")
+                    retries.append("empty")
+                    info["status"] = "deferred"
+                    return None
                 if attempt < self.max_retries:
                     print(f"  ⚠️  Empty response, retrying...")
+                    retries.append("empty")
                     time.sleep(1)
                     continue
 
             except requests.exceptions.HTTPError as e:
-                status = e.response.status_code if e.response else "?"
+                status = e.response.status_code if e.response is not None else "?"
+                message = e.response.text if e.response is not None else ""
                 print(f"  HTTP {status} Error (attempt {attempt+1}): {e}")
-                if status == 429:  # Rate limit
-                    wait = 2 ** attempt
-                    print(f"  Rate limited, waiting {wait}s...")
-                    time.sleep(wait)
-                elif status in (500, 502, 503):  # Server error
-                    time.sleep(2)
-                else:
+                about_constraint = structured and status in (400, 422) and rejects_constraint(message)
+                if image_url is not None and status in (400, 403, 404, 415, 422) and not about_constraint:
+                    # The server couldn't read this image by path/URL (missing file, undecodable
+                    # image, local media not allowed): resend it inline, without using up an attempt
+                    print(f"  [WARN] Server couldn't read the image by {image_url.split(':')[0]} URL, "
+                          f"sending it as base64")
+                    image_url, image_bytes = None, self._inline_image(base64_image)
+                    retries.append("transport")
+                    if _refuses_local_media(status, message):
+                        self._reject_option("image_transport")
+                    attempt -= 1
+                    continue
+                if structured and status in (400, 422):
+                    # Maybe constraint parameters the endpoint doesn't support: resend this
+                    # request as free text, without using up an attempt
+                    print(f"  [WARN] {self.provider} rejected '{structured}' structured output, "
+                          f"retrying as free text")
+                    structured = None
+                    retries.append("structured")
+                    if about_constraint:
+                        self._reject_option("structured")
+                    attempt -= 1
+                    continue
+                if status not in (429, 503, 500, 502):
+                    info["status"] = f"http_{status}"
                     return None  # Client error, don't retry
+                retries.append(f"http_{status}")
+                if self.defer_retries:
+                    info["status"] = "deferred"
+                    info["retry_after_s"] = parse_retry_after(e.response.headers.get("Retry-After"))
+                    return None
+                if status in (429, 503):  # Rate limit / overloaded
+                    # The limiter already halved the provider window and paused it
+                    # (honoring Retry-After); the next acquire() waits that out.
+                    print(f"  Throttled by {self.provider}, in-flight limit now {self.rate_limiter.limit}")
+                else:  # Server error
+                    time.sleep(2)
             except requests.exceptions.Timeout:
+                retries.append("timeout")
+                if self.defer_retries:
+                    print(f"  Timeout (attempt {attempt+1}), deferring")
+                    info["status"] = "deferred"
+                    return None
                 print(f"  Timeout (attempt {attempt+1}), retrying...")
                 time.sleep(2)
             except Exception as e:
                 print(f"  API Error (attempt {attempt+1}): {e}")
+                retries.append("error")
+                if self.defer_retries:
+                    # Only transport errors and undecodable bodies are worth another pass;
+                    # anything else is a bug that a retry queue would only hide
+                    transient = isinstance(e, (requests.exceptions.RequestException, ValueError))
+                    info["status"] = "deferred" if transient else "failed"
+                    return None
                 if attempt < self.max_retries:
                     time.sleep(1)
 
+        info["status"] = "failed"
         return None
 
     @staticmethod
     def parse_coordinates(text: str) -> Tuple[Optional[float], Optional[float]]:
-        """Parse GPS coordinates from model output using multiple strategies."""
-        if not text:
-            return None, None
-
-        # 1. JSON format: {"latitude": ..., "longitude": ...}
-        try:
-            json_match = re.search(r"\{.*\}", text, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group(0))
-                if "latitude" in data and "longitude" in data:
-                    return float(data["latitude"]), float(data["longitude"])
-        except Exception:
-            pass
-
-        # 2. Tuple format: (lat, lon) or [lat, lon]
-        match = re.search(r"[\(\[]\s*(-?\d+\.?\d*)\s*,\s*(-?\d+\.?\d*)\s*[\)\]]", text)
-        if match:
-            return float(match.group(1)), float(match.group(2))
-
-        # 3. Labeled format: "Latitude: 48.85, Longitude: 2.29"
-        lat = re.search(r"[Ll]at(?:itude)?[:\s]+(-?\d+\.?\d*)", text)
-        lon = re.search(r"[Ll]on(?:gitude)?[:\s]+(-?\d+\.?\d*)", text)
-        if lat and lon:
-            return float(lat.group(1)), float(lon.group(1))
-
-        # 4. Plain two-number format: "48.8584 2.2945"
-        nums = re.findall(r"-?\d{1,3}\.\d{2,}", text)
-        if len(nums) >= 2:
-            try:
-                lat_v, lon_v = float(nums[0]), float(nums[1])
-                if -90 <= lat_v <= 90 and -180 <= lon_v <= 180:
-                    return lat_v, lon_v
-            except Exception:
-                pass
-
-        return None, None
+        """Parse GPS coordinates from model output (see evaluation.coord_parser)."""
+        return parse_coordinates(text)
 
 
 # ===========================================================================
@@ -791,7 +1402,11 @@ def build_client(
                           or a full model path for local vLLM.
         provider: Override the provider (e.g., "openrouter", "siliconflow").
         api_key: API key. If None, uses environment variable or default.
-        api_base: Override the API base URL.
+        api_base: Override the API base URL (a list or comma-separated string load-balances replicas).
+        image_token_budget (kwarg): Override the registry/provider image-token budget (0 = full size).
+        structured (kwarg): Constrain the answer with the registry/provider structured-output mode.
+        token_profile (kwarg): TokenProfileStore; sets max_tokens (and a thinking model's reasoning
+                               budget) from the model's measured token counts, unless max_tokens is given.
         **kwargs: Additional arguments passed to GeoLocalizationClient.
 
     Returns:
@@ -827,10 +1442,23 @@ def build_client(
         resolved_model = model_short_name
         resolved_provider = provider or "local"
         is_thinking = kwargs.pop("is_thinking_model", False)
+    kwargs.setdefault("backend", model_short_name)
 
     # Get provider config
     provider_cfg = PROVIDER_CONFIGS.get(resolved_provider, PROVIDER_CONFIGS["local"])
-    resolved_api_base = api_base or provider_cfg["api_base"]
+    kwargs["image_policy"] = policy_for(provider_cfg, MODEL_REGISTRY.get(model_short_name, {"model": resolved_model}),
+                                        kwargs.pop("image_token_budget", None))
+    token_profile = kwargs.pop("token_profile", None)
+    if token_profile is not None and "max_tokens" not in kwargs:
+        # Per-model limits measured in earlier runs (evaluation/token_profile.py)
+        limits = token_profile.limits(kwargs["backend"], is_thinking)
+        if limits is not None:
+            kwargs["max_tokens"] = limits.max_tokens
+            if limits.reasoning_budget and kwargs.get("reasoning_budget") is None:
+                kwargs["reasoning_budget"] = limits.reasoning_budget
+    if kwargs.pop("structured", False):
+        kwargs["structured"] = structured_mode(provider_cfg, MODEL_REGISTRY.get(model_short_name), is_thinking)
+    resolved_api_base = api_base or provider_cfg.get("api_bases") or provider_cfg["api_base"]
 
     # Resolve API key
     if api_key:
@@ -0,0 +1,342 @@
+"""
+evaluation/batch_client.py
+==========================
+Offline batch-job evaluation (OpenAI Batch API format).
+
+Instead of one interactive chat-completion call per image, requests are written
+to JSONL files in the OpenAI batch format, submitted through a backend, polled
+until the job finishes, and the downloaded responses are handed back to
+evaluate.py to be merged into the usual results_*.jsonl rows.
+
+Backends:
+  - OpenAIBatchBackend:    any provider exposing OpenAI-compatible /files and /batches
+                           (OpenAI, SiliconFlow; see "supports_batch" in PROVIDER_CONFIGS)
+  - LocalFileBatchBackend: file-based stand-in that walks a job through the same
+                           lifecycle (validating -> in_progress -> completed) and answers
+                           each request with a pluggable responder. By default the
+                           responder forwards to a chat-completions endpoint, so it also
+                           serves as an offline batch runner for local vLLM.
+
+Usage:
+    backend = OpenAIBatchBackend(client.api_base, client.api_key)
+    runner = BatchRunner(backend, state_dir="results/results_Adversarial_gpt-4o.jsonl.batch")
+    runner.prepare(requests_iter)
+    for custom_id, result in runner.wait_and_collect():
+        ...
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+# OpenAI limits: 50,000 requests and 200 MB per input file
+MAX_REQUESTS_PER_FILE = 50_000
+MAX_FILE_BYTES = 190 * 1024 * 1024
+
+
+def make_batch_line(custom_id: str, body: dict) -> dict:
+    """One request line in OpenAI batch input format."""
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def parse_batch_output_line(line: str) -> Tuple[Optional[str], Optional[dict]]:
+    """Return (custom_id, response_body) from a batch output line; body is None for failed requests."""
+    try:
+        entry = json.loads(line)
+    except json.JSONDecodeError:
+        return None, None
+    response = entry.get("response") or {}
+    if entry.get("error") or response.get("status_code") != 200:
+        return entry.get("custom_id"), None
+    return entry.get("custom_id"), response.get("body")
+
+
+# ===========================================================================
+#  Backends
+# ===========================================================================
+
+class BatchBackend:
+    """Interface for batch job backends."""
+
+    name = "base"
+
+    def submit(self, input_path: str) -> str:
+        """Upload a request file and create a job. Returns the job id."""
+        raise NotImplementedError
+
+    def status(self, job_id: str) -> dict:
+        """Return the job object; must contain "status" (one of TERMINAL_STATES when done)."""
+        raise NotImplementedError
+
+    def download(self, job: dict, dest_path: str) -> bool:
+        """Write the job's output JSONL to dest_path. Returns False if there is no output."""
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """OpenAI-compatible /files + /batches endpoints."""
+
+    name = "openai"
+
+    def __init__(self, api_base: str, api_key: str, completion_window: str = "24h", timeout: int = 600):
+        self.api_base = api_base.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.completion_window = completion_window
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            resp = self._session.post(
+                f"{self.api_base}/files",
+                headers=self.headers,
+                data={"purpose": "batch"},
+                files={"file": (os.path.basename(input_path), f, "application/jsonl")},
+                timeout=self.timeout,
+            )
+        resp.raise_for_status()
+        file_id = resp.json()["id"]
+
+        resp = self._session.post(
+            f"{self.api_base}/batches",
+            headers=self.headers,
+            json={
+                "input_file_id": file_id,
+                "endpoint": BATCH_ENDPOINT,
+                "completion_window": self.completion_window,
+            },
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    def status(self, job_id: str) -> dict:
+        resp = self._session.get(f"{self.api_base}/batches/{job_id}", headers=self.headers, timeout=60)
+        resp.raise_for_status()
+        return resp.json()
+
+    def download(self, job: dict, dest_path: str) -> bool:
+        file_id = job.get("output_file_id")
+        if not file_id:
+            return False
+        with self._session.get(
+            f"{self.api_base}/files/{file_id}/content", headers=self.headers, stream=True, timeout=self.timeout
+        ) as resp:
+            resp.raise_for_status()
+            with open(dest_path, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+        return True
+
+
+def forward_responder(api_base: str, api_key: str, timeout: int = 300) -> Callable[[dict], Tuple[int, dict]]:
+    """Responder for LocalFileBatchBackend that sends each request body to a chat-completions endpoint."""
+    session = requests.Session()
+    url = f"{api_base.rstrip('/')}/chat/completions"
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    def respond(body: dict) -> Tuple[int, dict]:
+        try:
+            resp = session.post(url, headers=headers, json=body, timeout=timeout)
+            try:
+                return resp.status_code, resp.json()
+            except ValueError:
+                return resp.status_code, {"error": {"message": resp.text[:500]}}
+        except requests.exceptions.RequestException as e:
+            return 599, {"error": {"message": str(e)}}
+
+    return respond
+
+
+class LocalFileBatchBackend(BatchBackend):
+    """
+    File-based stand-in for the batch endpoint.
+
+    Each job lives in <root>/<job_id>/ with input.jsonl, job.json and (once done)
+    output.jsonl. Every status() call advances the job one lifecycle step, like a
+    remote job observed across polls; the in_progress step answers all requests
+    through `responder(body) -> (status_code, response_body)`.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, responder: Callable[[dict], Tuple[int, dict]]):
+        self.root = root
+        self.responder = responder
+        os.makedirs(root, exist_ok=True)
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id)
+
+    def _save(self, job: dict) -> None:
+        path = os.path.join(self._job_dir(job["id"]), "job.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+
+    def submit(self, input_path: str) -> str:
+        job_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        os.makedirs(self._job_dir(job_id))
+        with open(input_path, "rb") as src, open(os.path.join(self._job_dir(job_id), "input.jsonl"), "wb") as dst:
+            dst.write(src.read())
+        self._save({"id": job_id, "status": "validating", "created_at": time.time(), "request_counts": {}})
+        return job_id
+
+    def status(self, job_id: str) -> dict:
+        with open(os.path.join(self._job_dir(job_id), "job.json"), "r", encoding="utf-8") as f:
+            job = json.load(f)
+        if job["status"] == "validating":
+            job["status"] = "in_progress"
+        elif job["status"] == "in_progress":
+            job["request_counts"] = self._run(job_id)
+            job["status"] = "completed"
+            job["output_file_id"] = "output.jsonl"
+        self._save(job)
+        return job
+
+    def _run(self, job_id: str) -> dict:
+        job_dir = self._job_dir(job_id)
+        counts = {"total": 0, "completed": 0, "failed": 0}
+        with open(os.path.join(job_dir, "input.jsonl"), "r", encoding="utf-8") as f_in, \
+             open(os.path.join(job_dir, "output.jsonl"), "w", encoding="utf-8") as f_out:
+            for line in f_in:
+                if not line.strip():
+                    continue
+                req = json.loads(line)
+                counts["total"] += 1
+                status_code, body = self.responder(req["body"])
+                ok = status_code == 200
+                counts["completed" if ok else "failed"] += 1
+                f_out.write(json.dumps({
+                    "id": f"resp_{uuid.uuid4().hex[:12]}",
+                    "custom_id": req["custom_id"],
+                    "response": {"status_code": status_code, "body": body},
+                    "error": None if ok else {"code": str(status_code), "message": json.dumps(body)[:500]},
+                }) + "\n")
+        return counts
+
+    def download(self, job: dict, dest_path: str) -> bool:
+        output = os.path.join(self._job_dir(job["id"]), "output.jsonl")
+        if not os.path.exists(output):
+            return False
+        with open(output, "rb") as src, open(dest_path, "wb") as dst:
+            dst.write(src.read())
+        return True
+
+
+# ===========================================================================
+#  Job Runner (resumable)
+# ===========================================================================
+
+class BatchRunner:
+    """
+    Drives request files through a backend and keeps its progress in
+    <state_dir>/state.json, so a killed run resumes polling the submitted jobs
+    instead of submitting (and paying for) them again.
+    """
+
+    def __init__(self, backend: BatchBackend, state_dir: str, poll_interval: float = 30.0):
+        self.backend = backend
+        self.state_dir = state_dir
+        self.poll_interval = poll_interval
+        self.state_path = os.path.join(state_dir, "state.json")
+        os.makedirs(state_dir, exist_ok=True)
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"backend": self.backend.name, "jobs": []}
+
+    def _save_state(self) -> None:
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    @property
+    def has_open_jobs(self) -> bool:
+        return any(not job.get("merged") for job in self.state["jobs"])
+
+    def prepare(self, lines: Iterable[dict]) -> int:
+        """Write request lines into size-capped chunk files and submit each. Returns the request count."""
+        total = 0
+        chunk_lines: List[str] = []
+        chunk_bytes = 0
+
+        def flush():
+            nonlocal chunk_lines, chunk_bytes
+            if not chunk_lines:
+                return
+            path = os.path.join(self.state_dir, f"requests_{len(self.state['jobs']):03d}.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(chunk_lines)
+            job_id = self.backend.submit(path)
+            print(f"  [Batch] Submitted {len(chunk_lines)} requests as job {job_id}")
+            self.state["jobs"].append({"id": job_id, "input": path, "requests": len(chunk_lines)})
+            self._save_state()
+            chunk_lines, chunk_bytes = [], 0
+
+        for line in lines:
+            text = json.dumps(line) + "\n"
+            size = len(text.encode("utf-8"))
+            if chunk_lines and (len(chunk_lines) >= MAX_REQUESTS_PER_FILE or chunk_bytes + size > MAX_FILE_BYTES):
+                flush()
+            chunk_lines.append(text)
+            chunk_bytes += size
+            total += 1
+        flush()
+        return total
+
+    def wait_and_collect(self) -> Iterator[Tuple[str, Optional[dict]]]:
+        """Poll unmerged jobs until they finish and yield (custom_id, response_body) from their output."""
+        for job_entry in self.state["jobs"]:
+            if job_entry.get("merged"):
+                continue
+            while True:
+                job = self.backend.status(job_entry["id"])
+                status = job.get("status")
+                if status in TERMINAL_STATES:
+                    break
+                counts = job.get("request_counts") or {}
+                print(f"  [Batch] Job {job_entry['id']}: {status} "
+                      f"({counts.get('completed', 0)}/{counts.get('total', job_entry['requests'])})")
+                time.sleep(self.poll_interval)
+
+            print(f"  [Batch] Job {job_entry['id']} finished: {status}")
+            output_path = os.path.join(self.state_dir, f"output_{job_entry['id']}.jsonl")
+            if self.backend.download(job, output_path):
+                with open(output_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        custom_id, body = parse_batch_output_line(line)
+                        if custom_id is not None:
+                            yield custom_id, body
+
+            job_entry["status"] = status
+            job_entry["merged"] = True
+            self._save_state()
+
+    def reset(self) -> None:
+        """Forget all jobs once everything has been merged."""
+        self.state = {"backend": self.backend.name, "jobs": []}
+        self._save_state()
+
+
+def build_backend(kind: str, client, state_dir: str) -> BatchBackend:
+    """Create the backend for evaluate.py's --batch-backend choice."""
+    if kind == "openai":
+        return OpenAIBatchBackend(client.api_base, client.api_key)
+    if kind == "local":
+        return LocalFileBatchBackend(
+            os.path.join(state_dir, "local_jobs"), forward_responder(client.api_base, client.api_key)
+        )
+    raise ValueError(f"Unknown batch backend: {kind}")
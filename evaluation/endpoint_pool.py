@@ -0,0 +1,179 @@
+"""
+evaluation/endpoint_pool.py
+===========================
+Client-side load balancing across several replicas serving the same model.
+
+A provider (or `--api-base`) may list several OpenAI-compatible endpoints, e.g.
+one vLLM server per GPU node. EndpointPool routes each request to a replica:
+  - Sticky per image: replicas are ranked by rendezvous hashing of the image, so
+    retries and re-runs of one image land on the replica whose prefix cache
+    already holds it.
+  - Least outstanding: the sticky replica is skipped when it has more than
+    STICKY_SLACK requests in flight above the least loaded healthy one.
+  - Health: consecutive connection errors / 5xx responses take a replica out of
+    rotation; a background thread probes `<api_base>/models` and puts it back
+    once it answers again.
+
+Usage:
+    pool = get_pool(["http://node1:8001/v1", "http://node2:8001/v1"], headers)
+    base = pool.route(image_bytes)
+    ...
+    pool.release(base, failed=False)
+"""
+
+import hashlib
+import threading
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import requests
+
+# In-flight requests a sticky replica may carry above the least loaded one
+STICKY_SLACK = 4
+# Consecutive failed requests that take a replica out of rotation
+MAX_FAILURES = 2
+# Seconds between health probes (all replicas, so a dead one is noticed while idle too)
+PROBE_INTERVAL_S = 10.0
+PROBE_TIMEOUT_S = 5.0
+
+
+def split_api_bases(api_base) -> List[str]:
+    """API bases from a list or a comma-separated string, without trailing slashes."""
+    if isinstance(api_base, str):
+        api_base = api_base.split(",")
+    return [b.strip().rstrip("/") for b in api_base if b and b.strip()]
+
+
+def _score(seed: bytes, api_base: str) -> bytes:
+    """Rendezvous weight of a replica for a key (crc32 alone is linear and ranks poorly)."""
+    return hashlib.blake2b(seed + api_base.encode(), digest_size=8).digest()
+
+
+class _Endpoint:
+    def __init__(self, api_base: str):
+        self.api_base = api_base
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0       # consecutive
+        self.requests = 0
+        self.errors = 0
+
+
+class EndpointPool:
+    """Least-outstanding, image-sticky routing over replicas with health checks."""
+
+    def __init__(
+        self,
+        api_bases: Sequence[str],
+        headers: Optional[dict] = None,
+        probe_interval: float = PROBE_INTERVAL_S,
+        max_failures: int = MAX_FAILURES,
+        sticky_slack: int = STICKY_SLACK,
+    ):
+        self.endpoints = [_Endpoint(b) for b in split_api_bases(api_bases)]
+        if not self.endpoints:
+            raise ValueError("EndpointPool needs at least one api_base")
+        self._by_base = {e.api_base: e for e in self.endpoints}
+        self.headers = headers or {}
+        self.probe_interval = probe_interval
+        self.max_failures = max_failures
+        self.sticky_slack = sticky_slack
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._stop = threading.Event()
+        self._prober = None
+        if probe_interval and len(self.endpoints) > 1:
+            self._prober = threading.Thread(target=self._probe_loop, name="endpoint-probe", daemon=True)
+            self._prober.start()
+
+    @property
+    def api_bases(self) -> List[str]:
+        return [e.api_base for e in self.endpoints]
+
+    def route(self, key: Optional[bytes] = None) -> str:
+        """Pick a replica for a request (counted as outstanding until release)."""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.healthy]
+            if not candidates:
+                # Everything is marked down: keep trying rather than fail the whole run
+                candidates = self.endpoints
+            least = min(e.outstanding for e in candidates)
+            chosen = None
+            if key is not None and len(candidates) > 1:
+                seed = zlib.crc32(key).to_bytes(4, "big")
+                ranked = sorted(candidates, key=lambda e: _score(seed, e.api_base), reverse=True)
+                for endpoint in ranked:
+                    if endpoint.outstanding <= least + self.sticky_slack:
+                        chosen = endpoint
+                        break
+            if chosen is None:
+                chosen = min(candidates, key=lambda e: e.outstanding)
+            chosen.outstanding += 1
+            chosen.requests += 1
+            return chosen.api_base
+
+    def release(self, api_base: str, failed: bool = False) -> None:
+        """Finish a routed request; `failed` = connection error, timeout or 5xx."""
+        with self._lock:
+            endpoint = self._by_base[api_base]
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if not failed:
+                endpoint.failures = 0
+                return
+            endpoint.errors += 1
+            endpoint.failures += 1
+            if endpoint.healthy and endpoint.failures >= self.max_failures:
+                endpoint.healthy = False
+                print(f"  [LB] {api_base} out of rotation after {endpoint.failures} failed requests")
+
+    def check(self, api_base: str) -> bool:
+        """Probe `<api_base>/models`; updates and returns the replica's health."""
+        try:
+            ok = self._session.get(f"{api_base}/models", headers=self.headers, timeout=PROBE_TIMEOUT_S).ok
+        except requests.RequestException:
+            ok = False
+        with self._lock:
+            endpoint = self._by_base[api_base]
+            if ok and not endpoint.healthy:
+                print(f"  [LB] {api_base} back in rotation")
+            elif not ok and endpoint.healthy:
+                print(f"  [LB] {api_base} failed its health check, out of rotation")
+            endpoint.healthy = ok
+            if ok:
+                endpoint.failures = 0
+        return ok
+
+    def check_all(self) -> int:
+        """Probe every replica. Returns the number of healthy ones."""
+        return sum(self.check(base) for base in self.api_bases)
+
+    def _probe_loop(self) -> None:
+        while not self._stop.wait(self.probe_interval):
+            for base in self.api_bases:
+                self.check(base)
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return [{"api_base": e.api_base, "healthy": e.healthy, "outstanding": e.outstanding,
+                     "requests": e.requests, "errors": e.errors} for e in self.endpoints]
+
+
+# One pool per replica set, shared by every client in the process
+_POOLS: Dict[tuple, EndpointPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(api_bases: Sequence[str], headers: Optional[dict] = None) -> EndpointPool:
+    """Return the shared EndpointPool for a set of replicas, creating (and probing) it on first use."""
+    key = tuple(split_api_bases(api_bases))
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = EndpointPool(key, headers)
+            healthy = pool.check_all()
+            print(f"[LB] {healthy}/{len(key)} replicas healthy: {', '.join(key)}")
+            _POOLS[key] = pool
+        return pool
@@ -0,0 +1,234 @@
+"""
+evaluation/failover.py
+======================
+Provider failover with per-backend circuit breakers.
+
+A MODEL_REGISTRY entry may list equivalent backends under "fallbacks" (same
+weights served by another provider, e.g. qwen3-vl-235b-sf -> qwen3-vl-235b-or).
+FailoverClient tries them in order. Each backend has a CircuitBreaker:
+  - closed      requests go through; BREAKER_THRESHOLD consecutive images that
+                end in a backend failure (retries exhausted, auth/quota/model
+                errors) open it
+  - open        requests skip the backend; a background thread probes its
+                `/models` endpoint every PROBE_INTERVAL_S after the cooldown
+  - half-open   the probe answered: one real request is let through, which
+                closes the breaker on success or reopens it on failure
+An image whose backend fails is retried on the next one, so a provider outage
+moves the run to the fallback instead of filling the results with failed rows.
+The backend that served each image is recorded in the row ("backend").
+
+A fallback is usually another provider, billed separately, so failover is off
+unless asked for (`evaluate.py --failover`). The fallback clients send their
+requests like the primary: same streaming, reasoning budget, structured
+output, image transport, deferred retries and hedging (with its own latency
+percentile). They also use the primary's API key when they are on the same
+provider.
+
+Usage:
+    client = with_fallbacks(build_client("qwen3-vl-235b-sf"), "qwen3-vl-235b-sf")
+    text, info = client.predict_location_detailed(b64)    # info["backend"]
+"""
+
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from evaluation.hedging import HedgePolicy
+
+# Consecutive failed images that open a breaker
+BREAKER_THRESHOLD = 3
+# Seconds an open breaker waits before its backend is probed
+BREAKER_COOLDOWN_S = 30.0
+PROBE_INTERVAL_S = 10.0
+
+# Final statuses that point at the backend rather than at the image
+# ("deferred": a transient failure handed back for the caller's retry queue)
+BACKEND_FAILURES = {"failed", "deferred", "http_401", "http_402", "http_403", "http_404"}
+
+
+class CircuitBreaker:
+    """Closed / open / half-open state of one backend."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.threshold = threshold
+        self.cooldown_s = cooldown_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._trial = False     # a half-open trial request is in flight
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """May a request go to this backend now? (Half-open admits one trial at a time.)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok: bool) -> Optional[str]:
+        """Outcome of an admitted request. Returns the new state if it changed."""
+        with self._lock:
+            self._trial = False
+            if ok:
+                self.failures = 0
+                if self.state != self.CLOSED:
+                    self.state = self.CLOSED
+                    return self.CLOSED
+                return None
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return self.OPEN
+            return None
+
+    def probe_due(self) -> bool:
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown_s
+
+    def half_open(self) -> None:
+        with self._lock:
+            if self.state == self.OPEN:
+                self.state = self.HALF_OPEN
+                self._trial = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "trips": self.trips}
+
+
+class FailoverClient:
+    """
+    Ordered chain of GeoLocalizationClients serving the same model. Attribute
+    access falls through to the primary client, so it can stand in for one
+    (the batch path, for instance, only ever uses the primary).
+    """
+
+    def __init__(self, clients: List, probe_interval: float = PROBE_INTERVAL_S, **breaker_kwargs):
+        self.clients = clients
+        self.breakers = [CircuitBreaker(**breaker_kwargs) for _ in clients]
+        self._stop = threading.Event()
+        self._prober = threading.Thread(target=self._probe_loop, args=(probe_interval,),
+                                        name="failover-probe", daemon=True)
+        self._prober.start()
+
+    @property
+    def primary(self):
+        return self.clients[0]
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on FailoverClient itself
+        if name in ("clients", "breakers"):
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    @property
+    def backends(self) -> List[str]:
+        return [c.backend for c in self.clients]
+
+    def _candidates(self):
+        """Backends to try in order; a breaker is only asked (and a half-open trial taken) when reached."""
+        admitted = False
+        for index, client in enumerate(self.clients):
+            if self.breakers[index].allow():
+                admitted = True
+                yield index, client
+        if not admitted:
+            # Every breaker is open: keep sending to the primary rather than stall the run
+            yield 0, self.primary
+
+    def _record(self, index: int, ok: bool) -> None:
+        change = self.breakers[index].record(ok)
+        name = self.clients[index].backend
+        if change == CircuitBreaker.OPEN:
+            following = [c.backend for j, c in enumerate(self.clients)
+                         if j != index and self.breakers[j].state != CircuitBreaker.OPEN]
+            target = following[0] if following else "none left, staying on " + self.primary.backend
+            print(f"  [Failover] Circuit open for {name}, routing to {target}")
+        elif change == CircuitBreaker.CLOSED:
+            print(f"  [Failover] {name} recovered, circuit closed")
+
+    def predict_location(self, base64_image: str, image_path: Optional[str] = None) -> Optional[str]:
+        return self.predict_location_detailed(base64_image, image_path)[0]
+
+    def predict_location_detailed(self, base64_image: str,
+                                  image_path: Optional[str] = None) -> Tuple[Optional[str], dict]:
+        start = time.monotonic()
+        attempts, reasons = 0, []
+        text, info = None, None
+        for index, client in self._candidates():
+            if info is not None:
+                reasons.append(f"failover:{info['backend']}")
+            text, info = client.predict_location_detailed(base64_image, image_path)
+            attempts += info["attempts"]
+            reasons.extend(info["retry_reasons"])
+            # A throttled backend is up: its image waits for Retry-After instead of moving on
+            throttled = info["status"] == "deferred" and info["retry_reasons"][-1:] == ["http_429"]
+            ok = info["status"] not in BACKEND_FAILURES or throttled
+            self._record(index, ok)
+            if ok:
+                break
+        # Report the whole chain: total wall time and every attempt on every backend
+        info["attempts"] = attempts
+        info["retry_reasons"] = reasons
+        info["latency_s"] = round(time.monotonic() - start, 3)
+        return text, info
+
+    def _probe_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            for breaker, client in zip(self.breakers, self.clients):
+                if breaker.probe_due() and client.health_check():
+                    print(f"  [Failover] {client.backend} answered its health check, sending a trial request")
+                    breaker.half_open()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def snapshot(self) -> dict:
+        return {c.backend: b.snapshot() for c, b in zip(self.clients, self.breakers)}
+
+
+def request_options(client) -> dict:
+    """build_client kwargs under which another backend sends its requests like `client`."""
+    options = {
+        "stream": client.stream,
+        "reasoning_budget": client.reasoning_budget,
+        "structured": bool(client.structured),   # resolved again for the fallback's provider
+        "image_transport": client.image_transport,
+        "media_server": client.media_server,
+        "defer_retries": client.defer_retries,
+    }
+    if client.hedge is not None:
+        hedge = client.hedge
+        options["hedge"] = HedgePolicy(hedge.percentile, min_samples=hedge.min_samples, min_delay_s=hedge.min_delay_s)
+    return options
+
+
+def with_fallbacks(client, model_short_name: str, **kwargs):
+    """
+    Wrap `client` in a FailoverClient over the registry fallbacks of
+    model_short_name, built with the primary's request_options plus kwargs
+    (e.g. pool_size/cache). Fallbacks that cannot be built (no API key) are
+    skipped. Returns `client` itself when no fallback is available.
+    """
+    from evaluation.api_client import MODEL_REGISTRY, build_client
+
+    chain = [client]
+    for name in MODEL_REGISTRY.get(model_short_name, {}).get("fallbacks", []):
+        options = dict(request_options(client), **kwargs)
+        if MODEL_REGISTRY.get(name, {}).get("provider") == client.provider:
+            # Another provider's key would be rejected there: those read their own env var
+            options.setdefault("api_key", client.api_key)
+        try:
+            chain.append(build_client(name, **options))
+        except ValueError as e:
+            print(f"[Failover] [WARN] Skipping fallback {name}: {e}")
+    return FailoverClient(chain) if len(chain) > 1 else client
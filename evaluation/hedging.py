@@ -0,0 +1,134 @@
+"""
+evaluation/hedging.py
+=====================
+Hedged requests: cut tail latency by racing a duplicate against slow calls.
+
+HedgePolicy tracks each client's response latency online (P² sketch of the
+chosen percentile). Once enough samples are in, a request still unanswered
+after that percentile gets one duplicate, sent to the same endpoint or to an
+alternate endpoint serving the same model; the first usable answer wins.
+
+The other request is cancelled through its Cancellation: its rate-limiter slot
+and replica count are given back at once, and a streamed answer is closed, so
+the server stops generating. A request still waiting for its slot is never
+sent. `requests` cannot interrupt a non-streamed call waiting for its
+response; that one finishes on a daemon thread and its answer is dropped.
+
+Usage:
+    client.hedge = HedgePolicy(percentile=0.95)
+    client.hedge_client = build_client("gpt-4o", provider="openai")   # optional alternate endpoint
+    text, info = client.predict_location_detailed(b64)                # info["hedged"]
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from evaluation.running_metrics import P2Quantile
+
+
+class HedgePolicy:
+    """When to fire a duplicate request, from an online latency percentile."""
+
+    def __init__(self, percentile: float = 0.95, min_samples: int = 20, min_delay_s: float = 1.0):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay_s = min_delay_s
+        self._latency = P2Quantile(percentile)
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, seconds: float) -> None:
+        """Record the latency of a successful response."""
+        with self._lock:
+            self._latency.add(seconds)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        with self._lock:
+            if self._latency.n < self.min_samples:
+                return None
+            return max(self.min_delay_s, self._latency.value())
+
+    def record(self, won: bool) -> None:
+        with self._lock:
+            self.hedges += 1
+            if won:
+                self.hedge_wins += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            n = self._latency.n
+            return {
+                "percentile": self.percentile,
+                "latency_s": self._latency.value() if n >= self.min_samples else None,
+                "samples": n,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
+
+
+def run_async(fn, *args) -> Future:
+    """Run fn(*args) on a daemon thread; an abandoned call never blocks interpreter exit."""
+    future = Future()
+
+    def _target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_target, daemon=True).start()
+    return future
+
+
+class Cancelled(Exception):
+    """Raised in a request cancelled by the winner of its hedge."""
+
+
+class Cancellation:
+    """Cancel handle of one in-flight request; cancel() runs the cleanups the request registered."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.cancelled = False
+
+    def on_cancel(self, fn: Callable[[], object]) -> None:
+        """Run fn on cancel(), or at once if already cancelled."""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass  # e.g. closing a response another thread is reading
+
+
+def once(fn: Callable) -> Callable:
+    """fn that runs on its first call only (thread-safe); e.g. a release shared by a request and its cancel."""
+    lock = threading.Lock()
+    done = False
+
+    def wrapper(*args, **kwargs):
+        nonlocal done
+        with lock:
+            if done:
+                return None
+            done = True
+        return fn(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,93 @@
+"""
+evaluation/image_policy.py
+==========================
+Per provider/model image resizing to a target image-token budget.
+
+A policy is a budget of image tokens plus the rule the provider bills by
+(evaluation.image_tokens.TOKEN_RULES). It comes from, in order:
+  - the `--image-token-budget` override,
+  - "image_token_budget" / "token_rule" of the MODEL_REGISTRY entry,
+  - the same keys in PROVIDER_CONFIGS.
+OpenRouter bills openai/* models with OpenAI's tile rule. Without a budget,
+images are sent at their own resolution, as before.
+
+evaluate.py resizes each image once per distinct policy on its shared encode
+pool (through the derivative store when one is configured, so every process
+reuses the JPEG) and records the applied scale in the row (`image_scale`).
+
+Usage:
+    policy = policy_for("openrouter", MODEL_REGISTRY["gpt-4o"], budget=765)
+    b64, scale, path = resize_for_policy("images/Original/123.png", policy)
+"""
+
+import base64
+import math
+from typing import NamedTuple, Optional, Tuple
+
+from evaluation.image_store import transcode_jpeg
+from evaluation.image_tokens import TOKEN_RULES, budget_scale, image_size_from_bytes
+
+# Bytes read to get an image's size from its header
+_HEADER_BYTES = 256 * 1024
+
+
+class ImagePolicy(NamedTuple):
+    token_budget: int
+    token_rule: str = "pixels_750"
+
+    def describe(self) -> str:
+        return f"{self.token_budget} image tokens ({self.token_rule})"
+
+
+def policy_for(provider_cfg: dict, entry: Optional[dict] = None, budget: Optional[int] = None) -> Optional[ImagePolicy]:
+    """Resizing policy of a model on a provider; None = send images at their own size."""
+    entry = entry or {}
+    if budget is None:
+        budget = entry.get("image_token_budget", provider_cfg.get("image_token_budget"))
+    if not budget:
+        return None
+    rule = entry.get("token_rule")
+    if rule is None:
+        # Gateways bill each upstream model by its own provider's rule
+        for prefix, prefix_rule in (provider_cfg.get("token_rule_by_prefix") or {}).items():
+            if entry.get("model", "").startswith(prefix):
+                rule = prefix_rule
+                break
+    rule = rule or provider_cfg.get("token_rule") or "pixels_750"
+    if rule not in TOKEN_RULES:
+        raise ValueError(f"Unknown token rule '{rule}' (expected one of {TOKEN_RULES})")
+    return ImagePolicy(int(budget), rule)
+
+
+def target_side(width: int, height: int, policy: Optional[ImagePolicy], max_side: int = 0) -> Tuple[int, float]:
+    """
+    (longer side to transcode to, 0 = keep; scale vs. the original) for an image
+    under a policy, after the optional max_side cap of the derivative store.
+    """
+    long_side = max(width, height)
+    side = min(long_side, max_side) if max_side else long_side
+    if policy is not None:
+        capped = side / long_side
+        scale = budget_scale(max(1, int(width * capped)), max(1, int(height * capped)),
+                             policy.token_budget, policy.token_rule)
+        side = max(1, math.floor(side * scale))
+    if side >= long_side:
+        return 0, 1.0
+    return side, side / long_side
+
+
+def resize_for_policy(image_path: str, policy: Optional[ImagePolicy], image_store=None,
+                      max_side: int = 0) -> Tuple[str, float, Optional[str]]:
+    """
+    Base64 JPEG/original payload of an image fitted to the policy. Returns
+    (base64, scale, path of a file holding exactly that payload or None).
+    """
+    with open(image_path, "rb") as f:
+        size = image_size_from_bytes(f.read(_HEADER_BYTES))
+    side, scale = target_side(*size, policy, max_side) if size else (max_side, 1.0)
+    if image_store is not None:
+        return image_store.get_base64(image_path, side), scale, image_store.jpeg_path(image_path, side)
+    if side == 0:
+        with open(image_path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8"), 1.0, image_path
+    return base64.b64encode(transcode_jpeg(image_path, side)).decode("utf-8"), scale, None
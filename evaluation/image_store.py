@@ -0,0 +1,170 @@
+"""
+evaluation/image_store.py
+=========================
+Shared store of pre-transcoded image derivatives, keyed by content hash.
+
+Each source image is hashed once (SHA-256 of its bytes, memoized by path/size/mtime)
+and transcoded to JPEG at a few target resolutions. The ready-made base64 payload
+is kept next to each JPEG, so attack generation and every model × provider
+evaluation reuse it instead of decoding, resizing and encoding the original again.
+
+Layout:
+    <root>/index.sqlite                  path -> content hash memo
+    <root>/<h[:2]>/<hash>_<side>.jpg     JPEG derivative (side 0 = full resolution)
+    <root>/<h[:2]>/<hash>_<side>.b64     base64 text of that JPEG
+
+Usage:
+    store = ImageDerivativeStore("/data/SIGNPOST-Bench/cache/derivatives")
+    b64 = store.get_base64("images/Adversarial/123_adversarial_Broadway.png", max_side=1024)
+
+    # Fill ahead of time, in parallel:
+    python -m evaluation.image_store --root /data/.../derivatives --dirs images/Adversarial --sizes 0 1024
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, List, Optional
+
+JPEG_QUALITY = 90
+VALID_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def transcode_jpeg(path: str, max_side: int = 0, quality: int = JPEG_QUALITY) -> bytes:
+    """Decode an image and re-encode it as RGB JPEG, downscaled so its longer side is <= max_side (0 = keep)."""
+    from PIL import Image
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality)
+        return buf.getvalue()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _derivative_paths(root: str, content_hash: str, max_side: int):
+    stem = os.path.join(root, content_hash[:2], f"{content_hash}_{max_side}")
+    return stem + ".jpg", stem + ".b64"
+
+
+def _build_derivatives(root: str, path: str, content_hash: str, sizes: List[int], quality: int) -> int:
+    """Create any missing derivatives of one image. Runs in worker processes. Returns the number created."""
+    created = 0
+    for max_side in sizes:
+        jpg_path, b64_path = _derivative_paths(root, content_hash, max_side)
+        if os.path.exists(b64_path):
+            continue
+        os.makedirs(os.path.dirname(jpg_path), exist_ok=True)
+        data = transcode_jpeg(path, max_side, quality)
+        _write_atomic(jpg_path, data)
+        _write_atomic(b64_path, base64.b64encode(data))
+        created += 1
+    return created
+
+
+class ImageDerivativeStore:
+    """Content-addressed JPEG/base64 derivatives shared across processes."""
+
+    def __init__(self, root: str, quality: int = JPEG_QUALITY):
+        self.root = root
+        self.quality = quality
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)"
+        )
+        self._conn.commit()
+
+    def content_hash(self, path: str) -> str:
+        """SHA-256 of the file, re-hashed only when its size or mtime changes."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        digest = hash_file(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, digest),
+            )
+            self._conn.commit()
+        return digest
+
+    def jpeg_path(self, path: str, max_side: int = 0) -> str:
+        """Path of the JPEG derivative, creating it on first use."""
+        content_hash = self.content_hash(path)
+        _build_derivatives(self.root, path, content_hash, [max_side], self.quality)
+        return _derivative_paths(self.root, content_hash, max_side)[0]
+
+    def get_base64(self, path: str, max_side: int = 0) -> str:
+        """Ready-made base64 JPEG payload for an image, creating it on first use."""
+        content_hash = self.content_hash(path)
+        _build_derivatives(self.root, path, content_hash, [max_side], self.quality)
+        with open(_derivative_paths(self.root, content_hash, max_side)[1], "r", encoding="ascii") as f:
+            return f.read()
+
+    def prefill(self, paths: Iterable[str], sizes: List[int], workers: Optional[int] = None) -> int:
+        """Create all missing derivatives for `paths` in a process pool. Returns the number created."""
+        jobs = [(p, self.content_hash(p)) for p in paths]
+        created = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_build_derivatives, self.root, p, h, list(sizes), self.quality) for p, h in jobs
+            ]
+            for i, future in enumerate(as_completed(futures), start=1):
+                try:
+                    created += future.result()
+                except Exception as e:
+                    print(f"  [WARN] Derivative failed: {e}")
+                if i % 500 == 0:
+                    print(f"  [Store] {i}/{len(futures)} images checked, {created} derivatives created")
+        return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fill the shared image derivative store")
+    parser.add_argument("--root", type=str, required=True, help="Derivative store directory")
+    parser.add_argument("--dirs", nargs='+', required=True, help="Image directories to transcode")
+    parser.add_argument("--sizes", nargs='+', type=int, default=[0],
+                        help="Target longer-side sizes in pixels, 0 = full resolution (default: 0)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    store = ImageDerivativeStore(args.root)
+    paths = []
+    for d in args.dirs:
+        paths.extend(os.path.join(d, f) for f in sorted(os.listdir(d)) if f.lower().endswith(VALID_EXTS))
+    print(f"Transcoding {len(paths)} images at sizes {args.sizes} into {args.root}...")
+    created = store.prefill(paths, args.sizes, workers=args.workers)
+    print(f"Done. {created} new derivatives created.")
+
+
+if __name__ == "__main__":
+    main()
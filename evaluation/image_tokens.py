@@ -0,0 +1,102 @@
+"""
+evaluation/image_tokens.py
+==========================
+Up-front token estimates for image + prompt requests.
+
+Uses the same rule as the cost sheet (latest_standard_vlm_benchmark_suite.csv):
+image tokens ≈ (W×H)/750, prompt ≈ 65 tokens, output ≈ 15 tokens.
+Only the image header is parsed to get W×H; pixels are never decoded.
+
+Token rules for image budgets (see evaluation/image_policy.py):
+    pixels_750     ceil(W×H / 750), the cost-sheet rule (Anthropic bills the same way)
+    openai_tiles   fit in 2048×2048, shorter side to 768, then 85 + 170 per 512-px tile
+"""
+
+import base64
+import io
+import math
+from typing import Optional, Tuple
+
+PIXELS_PER_TOKEN = 750
+PROMPT_TOKENS_EST = 65
+OUTPUT_TOKENS_EST = 15
+
+# Enough base64 text to cover PNG/JPEG headers, including large EXIF blocks
+_HEADER_B64_CHARS = 256 * 1024
+
+
+TOKEN_RULES = ("pixels_750", "openai_tiles")
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Image tokens for a W×H image under the (W×H)/750 rule."""
+    return math.ceil(width * height / PIXELS_PER_TOKEN)
+
+
+def _openai_tile_tokens(width: int, height: int) -> int:
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def image_tokens(width: int, height: int, rule: str = "pixels_750") -> int:
+    """Billed image tokens for a W×H image under a token rule."""
+    if rule == "openai_tiles":
+        return _openai_tile_tokens(width, height)
+    return estimate_image_tokens(width, height)
+
+
+def budget_scale(width: int, height: int, budget: int, rule: str = "pixels_750") -> float:
+    """Largest downscale factor (<= 1) that brings a W×H image within `budget` image tokens."""
+    budget = max(budget, image_tokens(1, 1, rule))  # No image costs less than this
+    if image_tokens(width, height, rule) <= budget:
+        return 1.0
+    if rule == "pixels_750":
+        scale = math.sqrt(budget * PIXELS_PER_TOKEN / (width * height))
+        # Pixel dimensions are floored when resizing; step down if rounding still overshoots
+        while scale > 0 and image_tokens(int(width * scale), int(height * scale), rule) > budget:
+            scale *= 0.995
+        return scale
+    # Tile counts are step functions of the size: bisect on the scale
+    lo, hi = 0.0, 1.0
+    for _ in range(30):
+        mid = (lo + hi) / 2
+        if image_tokens(max(1, int(width * mid)), max(1, int(height * mid)), rule) <= budget:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def image_size_from_bytes(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from an encoded image's header, or None if unreadable."""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def image_size_from_base64(base64_image: str) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from the header of a base64-encoded image."""
+    prefix = base64_image[:_HEADER_B64_CHARS]
+    prefix = prefix[: len(prefix) - len(prefix) % 4]
+    try:
+        return image_size_from_bytes(base64.b64decode(prefix))
+    except Exception:
+        return None
+
+
+def estimate_request_tokens(base64_image: str, output_tokens: int = OUTPUT_TOKENS_EST) -> int:
+    """Estimated total tokens (prompt + image + output) billed for one geo-localization request."""
+    size = image_size_from_base64(base64_image)
+    if size is not None:
+        image_tokens = estimate_image_tokens(*size)
+    else:
+        # Header unreadable: assume ~3 bytes per pixel compressed 10x
+        raw_bytes = len(base64_image) * 3 // 4
+        image_tokens = math.ceil(raw_bytes * 10 / 3 / PIXELS_PER_TOKEN)
+    return PROMPT_TOKENS_EST + image_tokens + output_tokens
@@ -0,0 +1,240 @@
+"""
+evaluation/manifest.py
+======================
+Typed sample manifest: one SQLite row per clean or synthesized image.
+
+Maps every filename to its base id (the clean sample it derives from), GT
+lat/lon, attack type, injected text and original source, so evaluation and
+the compute_* scripts join on exact keys instead of guessing from filename
+patterns (which breaks for GoogleSV ids like `panoid_angle`). Lookups are
+indexed queries against the file, so million-sample datasets never need to
+be loaded into memory.
+
+Written by convert_metadata.py (clean samples) and main_benchmark.py
+(synthesized samples); existing datasets can be backfilled with:
+    python -m evaluation.manifest build --manifest .../metadata/im2gps3k_manifest.sqlite \
+        --gt-tsv .../metadata/im2gps3k_gt.tsv --bench-meta .../images/benchmark_meta.jsonl
+
+Usage:
+    manifest = SampleManifest(".../metadata/im2gps3k_manifest.sqlite")
+    rec = manifest.get("123_adversarial_Broadway.png")   # SampleRecord or None
+    rec.base_id, rec.gt_lat, rec.gt_lon, rec.attack_type
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import astuple, dataclass, fields
+from typing import Iterable, Iterator, Optional
+from urllib.parse import urlparse
+
+ORIGINAL = "original"
+
+
+def file_stem(filename: str) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+@dataclass
+class SampleRecord:
+    filename: str
+    base_id: str
+    gt_lat: Optional[float] = None
+    gt_lon: Optional[float] = None
+    attack_type: str = ORIGINAL
+    injected_text: Optional[str] = None
+    original_source: Optional[str] = None
+
+    @property
+    def is_original(self) -> bool:
+        return self.attack_type == ORIGINAL
+
+    @property
+    def gt(self):
+        if self.gt_lat is None or self.gt_lon is None:
+            return None
+        return (self.gt_lat, self.gt_lon)
+
+
+_COLUMNS = [f.name for f in fields(SampleRecord)]
+
+
+class SampleManifest:
+    """SQLite-backed filename -> SampleRecord map, queried from disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            " filename TEXT PRIMARY KEY, base_id TEXT NOT NULL, gt_lat REAL, gt_lon REAL,"
+            " attack_type TEXT NOT NULL, injected_text TEXT, original_source TEXT, stem TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_stem ON samples (stem)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_base ON samples (base_id, attack_type)")
+        self._conn.commit()
+
+    def upsert(self, records: Iterable[SampleRecord], chunk_size: int = 5000) -> int:
+        """Insert or replace records. Returns the number written."""
+        sql = (f"INSERT OR REPLACE INTO samples ({', '.join(_COLUMNS)}, stem) "
+               f"VALUES ({', '.join('?' * (len(_COLUMNS) + 1))})")
+        count = 0
+        chunk = []
+        for rec in records:
+            chunk.append(astuple(rec) + (file_stem(rec.filename),))
+            if len(chunk) >= chunk_size:
+                count += self._write(sql, chunk)
+                chunk = []
+        if chunk:
+            count += self._write(sql, chunk)
+        return count
+
+    def _write(self, sql, rows) -> int:
+        with self._lock:
+            self._conn.executemany(sql, rows)
+            self._conn.commit()
+        return len(rows)
+
+    def _query_one(self, where: str, params) -> Optional[SampleRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM samples WHERE {where} LIMIT 1", params
+            ).fetchone()
+        return SampleRecord(*row) if row else None
+
+    def get(self, filename: str) -> Optional[SampleRecord]:
+        """Record for an image filename; also matches when only the extension differs."""
+        filename = os.path.basename(filename)
+        rec = self._query_one("filename = ?", (filename,))
+        if rec is None:
+            rec = self._query_one("stem = ?", (file_stem(filename),))
+        return rec
+
+    def base_id_of(self, filename: str) -> Optional[str]:
+        rec = self.get(filename)
+        return rec.base_id if rec else None
+
+    def original_of(self, base_id: str) -> Optional[SampleRecord]:
+        """The clean sample a base id refers to."""
+        return self._query_one("base_id = ? AND attack_type = ?", (base_id, ORIGINAL))
+
+    def iter_records(self, attack_type: Optional[str] = None) -> Iterator[SampleRecord]:
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM samples"
+        params = ()
+        if attack_type is not None:
+            sql += " WHERE attack_type = ?"
+            params = (attack_type,)
+        cursor = self._conn.cursor()
+        with self._lock:
+            cursor.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for row in rows:
+                yield SampleRecord(*row)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ============================================================
+#  Record builders (shared by convert_metadata / main_benchmark)
+# ============================================================
+
+def original_record(filename: str, lat: float, lon: float) -> SampleRecord:
+    return SampleRecord(filename=filename, base_id=file_stem(filename), gt_lat=lat, gt_lon=lon)
+
+
+def synthesized_record(meta_entry: dict, manifest: Optional[SampleManifest] = None) -> SampleRecord:
+    """Record for a benchmark_meta.jsonl entry; GT and base id come from its clean source when known."""
+    original_source = meta_entry.get('original_source') or ''
+    source = manifest.get(original_source) if manifest is not None and original_source else None
+    return SampleRecord(
+        filename=meta_entry['filename'],
+        base_id=source.base_id if source else file_stem(original_source or meta_entry['filename']),
+        gt_lat=source.gt_lat if source else None,
+        gt_lon=source.gt_lon if source else None,
+        attack_type=meta_entry.get('attack_type') or 'unknown',
+        injected_text=meta_entry.get('injected_text'),
+        original_source=original_source or None,
+    )
+
+
+def result_base_id(entry: dict, manifest: Optional[SampleManifest] = None) -> Optional[str]:
+    """Base id of a result row: its own `base_id` field, else a manifest lookup; None when unknown."""
+    if entry.get('base_id'):
+        return entry['base_id']
+    if manifest is not None:
+        return manifest.base_id_of(entry['filename'])
+    return None
+
+
+def default_manifest_path(dataset_dir: str, dataset_name: str) -> Optional[str]:
+    """The manifest convert_metadata.py writes for a dataset, if it exists."""
+    path = os.path.join(dataset_dir, "metadata", f"{dataset_name}_manifest.sqlite")
+    return path if os.path.exists(path) else None
+
+
+def iter_gt_tsv(tsv_path: str) -> Iterator[SampleRecord]:
+    """Clean records from a *_gt.tsv file (columns: 1=id, 10=lon, 11=lat, 14=url)."""
+    with open(tsv_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split('\t')
+            if len(parts) < 15:
+                continue
+            try:
+                lon, lat = float(parts[10]), float(parts[11])
+            except ValueError:
+                continue
+            filename = os.path.basename(urlparse(parts[14]).path) or parts[1]
+            yield original_record(filename, lat, lon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a SIGNPOST-Bench sample manifest")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Backfill a manifest from existing GT / benchmark metadata files")
+    build.add_argument("--manifest", type=str, required=True, help="Manifest SQLite path")
+    build.add_argument("--gt-tsv", type=str, default=None, help="*_gt.tsv written by convert_metadata.py")
+    build.add_argument("--bench-meta", type=str, default=None, help="benchmark_meta.jsonl written by main_benchmark.py")
+
+    show = sub.add_parser("show", help="Print the records for some filenames")
+    show.add_argument("--manifest", type=str, required=True, help="Manifest SQLite path")
+    show.add_argument("filenames", nargs='+')
+    args = parser.parse_args()
+
+    manifest = SampleManifest(args.manifest)
+    if args.command == "build":
+        if args.gt_tsv:
+            print(f"Loaded {manifest.upsert(iter_gt_tsv(args.gt_tsv))} clean samples from {args.gt_tsv}")
+        if args.bench_meta:
+            def _synth():
+                with open(args.bench_meta, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            yield synthesized_record(json.loads(line), manifest)
+                        except (ValueError, KeyError):
+                            continue
+            print(f"Loaded {manifest.upsert(_synth())} synthesized samples from {args.bench_meta}")
+        print(f"Manifest {args.manifest}: {len(manifest)} samples")
+    else:
+        for filename in args.filenames:
+            print(f"{filename}: {manifest.get(filename)}")
+    manifest.close()
+
+
+if __name__ == "__main__":
+    main()
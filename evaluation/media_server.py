@@ -0,0 +1,110 @@
+"""
+evaluation/media_server.py
+==========================
+Minimal static file server that lets a self-hosted model server fetch images by URL.
+
+With `--image-transport http`, evaluate.py starts a MediaServer on a background
+thread and sends `http://<host>:<port>/<root>/<relative path>` image URLs instead
+of base64 data URLs, so request bodies stay small and vLLM fetches the bytes
+itself. Only files under the registered roots (the image directory and, if used,
+the derivative store) are served.
+
+Usage:
+    server = MediaServer(["/data/im2gps3k/images/Adversarial"], public_host="gpu-login-01")
+    server.start()
+    server.url_for("/data/im2gps3k/images/Adversarial/123_adversarial_Broadway.png")
+    # -> http://gpu-login-01:41234/0/123_adversarial_Broadway.png
+
+    # Standalone:
+    python -m evaluation.media_server --root /data/im2gps3k/images --port 8090
+"""
+
+import argparse
+import os
+import socket
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import quote, unquote, urlsplit
+
+
+class _MediaHandler(SimpleHTTPRequestHandler):
+    """GET/HEAD of files under the server's roots, addressed as /<root index>/<relative path>."""
+
+    def __init__(self, *args, roots: List[str], **kwargs):
+        self.roots = roots
+        super().__init__(*args, **kwargs)
+
+    def translate_path(self, path: str) -> str:
+        parts = unquote(urlsplit(path).path).lstrip("/").split("/", 1)
+        if len(parts) != 2 or not parts[0].isdigit() or int(parts[0]) >= len(self.roots):
+            return ""
+        root = self.roots[int(parts[0])]
+        full = os.path.realpath(os.path.join(root, parts[1]))
+        if not full.startswith(root + os.sep):
+            return ""  # Outside the root (.. or a symlink out)
+        return full
+
+    def list_directory(self, path):
+        self.send_error(403, "Directory listing is disabled")
+        return None
+
+    def log_message(self, format, *args):
+        pass  # One line per image would drown the evaluation log
+
+
+class MediaServer:
+    """Threaded HTTP server for the images of one evaluation process."""
+
+    def __init__(self, roots: List[str], host: str = "0.0.0.0", port: int = 0, public_host: Optional[str] = None):
+        self.roots = [os.path.realpath(r) for r in roots]
+        handler = partial(_MediaHandler, roots=self.roots)
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        # Name the model server uses to reach us (it may run on another node of the cluster)
+        self.public_host = public_host or socket.getfqdn()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.public_host}:{self.port}"
+
+    def start(self) -> "MediaServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="media-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def url_for(self, path: str) -> str:
+        """URL of a file under one of the roots (ValueError otherwise)."""
+        full = os.path.realpath(path)
+        for index, root in enumerate(self.roots):
+            if full.startswith(root + os.sep):
+                return f"{self.base_url}/{index}/{quote(os.path.relpath(full, root))}"
+        raise ValueError(f"{path} is not under a media server root")
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve image directories to a model server over HTTP")
+    parser.add_argument("--root", nargs='+', required=True, help="Directories to serve (URL prefix /0, /1, ...)")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Bind address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8090, help="Port (default: 8090)")
+    parser.add_argument("--public-host", type=str, default=None, help="Host name put in URLs (default: FQDN)")
+    args = parser.parse_args()
+
+    server = MediaServer(args.root, args.host, args.port, args.public_host)
+    for index, root in enumerate(server.roots):
+        print(f"[Media] {server.base_url}/{index}/ -> {root}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
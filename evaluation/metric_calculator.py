@@ -1,5 +1,9 @@
 import math
 
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
 class MetricCalculator:
     # WLA Thresholds (km) - Covering Street to Continental scales
     WLA_THRESHOLDS = [1, 25, 200, 750, 2500]
@@ -19,7 +23,7 @@ class MetricCalculator:
             dlat = lat2 - lat1 
             a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
             c = 2 * math.asin(math.sqrt(a)) 
-            r = 6371 # Radius of earth in kilometers
+            r = EARTH_RADIUS_KM # Radius of earth in kilometers
             return c * r
         except Exception:
             return None
@@ -63,3 +67,43 @@ class MetricCalculator:
             return False
             
         return dist < threshold_km
+
+    # ==================== Batch (NumPy) versions ====================
+    # Same formulas as the scalar methods above, over whole arrays of rows.
+    # Missing values are NaN (None in the scalar API).
+
+    @staticmethod
+    def haversine_batch(lat1, lon1, lat2, lon2):
+        """
+        Great circle distances (km) between coordinate arrays, elementwise with broadcasting
+        (pass lat1[:, None] etc. for an all-pairs matrix). NaN where any input is NaN.
+        """
+        lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * EARTH_RADIUS_KM
+
+    @staticmethod
+    def wla_batch(errors_km):
+        """WLA score per error (NaN error = failed prediction = 0.0)."""
+        errors = np.asarray(errors_km, dtype=float)
+        with np.errstate(invalid='ignore'):
+            hits = errors[..., None] < np.asarray(MetricCalculator.WLA_THRESHOLDS, dtype=float)
+        return hits @ np.asarray(MetricCalculator.WLA_WEIGHTS, dtype=float)
+
+    @staticmethod
+    def tbs_batch(clean_errors, adversarial_errors):
+        """Paired TBS = adversarial error - clean error, NaN where either side is missing."""
+        return np.asarray(adversarial_errors, dtype=float) - np.asarray(clean_errors, dtype=float)
+
+    @staticmethod
+    def trap_hit_matrix(pred_lat, pred_lon, trap_lat, trap_lon, threshold_km=50):
+        """
+        Boolean matrix [n_pred, n_trap]: prediction i lies within threshold_km of trap j.
+        For row-aligned (pred_i, trap_i) pairs, use haversine_batch(...) < threshold_km instead.
+        """
+        pred_lat, pred_lon = np.asarray(pred_lat, dtype=float), np.asarray(pred_lon, dtype=float)
+        dist = MetricCalculator.haversine_batch(pred_lat[:, None], pred_lon[:, None],
+                                                np.asarray(trap_lat, dtype=float)[None, :],
+                                                np.asarray(trap_lon, dtype=float)[None, :])
+        with np.errstate(invalid='ignore'):
+            return dist < threshold_km
@@ -0,0 +1,190 @@
+"""
+evaluation/rate_limiter.py
+==========================
+Provider-level adaptive rate limiting for API calls.
+
+Each provider gets one shared ProviderRateLimiter (per process) driven by the
+requests_per_min / tokens_per_min / max_in_flight fields of PROVIDER_CONFIGS:
+  - Token buckets keep requests and estimated tokens under the per-minute quotas.
+  - The in-flight window follows AIMD: +1 slot after a full window of healthy
+    responses, halved on HTTP 429/503.
+  - A Retry-After header pauses all callers of that provider until it expires.
+
+Usage:
+    limiter = get_limiter("openrouter", PROVIDER_CONFIGS["openrouter"])
+    limiter.acquire(est_tokens)
+    ...
+    limiter.release("ok", actual_tokens=usage["total_tokens"])
+"""
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# Used when a throttled response carries no Retry-After header
+DEFAULT_THROTTLE_PAUSE_S = 2.0
+MAX_THROTTLE_PAUSE_S = 120.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP-date) into seconds from now."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class _TokenBucket:
+    """Per-minute quota refilled continuously. Not thread-safe; guarded by the limiter."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._last = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self, amount: float) -> float:
+        # Requests larger than the whole bucket go through once it is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ProviderRateLimiter:
+    """Shared RPM/TPM buckets plus an AIMD-controlled in-flight window for one provider."""
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_min: Optional[float] = None,
+        tokens_per_min: Optional[float] = None,
+        max_in_flight: int = 32,
+        initial_in_flight: Optional[int] = None,
+    ):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.limit = initial_in_flight or max(1, self.max_in_flight // 4)
+        self.in_flight = 0
+        self.throttle_count = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._requests = _TokenBucket(requests_per_min) if requests_per_min else None
+        self._tokens = _TokenBucket(tokens_per_min) if tokens_per_min else None
+        self._cond = threading.Condition()
+
+    def acquire(self, est_tokens: int = 0) -> None:
+        """Block until a slot, a request and est_tokens are available, then reserve them."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if self.in_flight >= self.limit:
+                    wait = max(wait, 0.5)  # woken early by release()
+                for bucket, amount in ((self._requests, 1), (self._tokens, est_tokens)):
+                    if bucket is not None:
+                        bucket.refill()
+                        wait = max(wait, bucket.wait_time(amount))
+                if wait <= 0:
+                    break
+                self._cond.wait(timeout=wait)
+
+            self.in_flight += 1
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(min(est_tokens, self._tokens.capacity))
+
+    def release(
+        self,
+        outcome: str,
+        est_tokens: int = 0,
+        actual_tokens: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """
+        Return a slot. outcome is "ok", "throttled" (429/503), "error" or "cancelled"
+        (the loser of a hedged request; like "error", no signal for the window).
+        When the real token usage is known, the TPM bucket is corrected by the estimate's error.
+        """
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if self._tokens is not None and actual_tokens is not None:
+                self._tokens.give_back(min(est_tokens, self._tokens.capacity) - actual_tokens)
+
+            if outcome == "ok":
+                # Additive increase: one more slot per window of healthy responses
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_in_flight:
+                    self.limit += 1
+                    self._successes = 0
+            elif outcome == "throttled":
+                # Multiplicative decrease and a shared pause
+                self.throttle_count += 1
+                self._successes = 0
+                self.limit = max(1, self.limit // 2)
+                pause = retry_after if retry_after is not None else DEFAULT_THROTTLE_PAUSE_S
+                pause = min(pause, MAX_THROTTLE_PAUSE_S)
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._cond.notify_all()
+
+    def grow(self, max_in_flight: int) -> None:
+        """Raise the window ceiling (a larger replica pool registered); never shrinks it."""
+        with self._cond:
+            if max_in_flight <= self.max_in_flight:
+                return
+            self.max_in_flight = max_in_flight
+            self.limit = max(self.limit, max_in_flight // 4)
+            self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "provider": self.name,
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "throttled": self.throttle_count,
+            }
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(provider: str, provider_cfg: dict) -> ProviderRateLimiter:
+    """
+    Return the process-wide limiter for a provider, creating it from its config on
+    first use. A later config with a larger max_in_flight (a client over more
+    replicas) grows the existing window ceiling.
+    """
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(provider)
+        if limiter is not None:
+            limiter.grow(provider_cfg.get("max_in_flight", 32))
+        else:
+            limiter = ProviderRateLimiter(
+                provider,
+                requests_per_min=provider_cfg.get("requests_per_min"),
+                tokens_per_min=provider_cfg.get("tokens_per_min"),
+                max_in_flight=provider_cfg.get("max_in_flight", 32),
+            )
+            _LIMITERS[provider] = limiter
+        return limiter
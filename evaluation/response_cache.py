@@ -0,0 +1,130 @@
+"""
+evaluation/response_cache.py
+============================
+Content-addressed on-disk cache for geo-localization responses.
+
+Entries are keyed on everything that determines the model's answer:
+(model id, provider, prompt hash, image content hash, temperature, max_tokens).
+Storage is a single SQLite file in WAL mode, so several evaluate.py processes
+can share it; the least recently used entries are evicted once the stored
+responses exceed the configured size.
+
+Usage:
+    from evaluation.response_cache import ResponseCache
+
+    cache = ResponseCache("/data/cache/responses.sqlite", max_size_mb=256)
+    client = build_client("gpt-4o", cache=cache)
+    ...
+    print(cache.stats())
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class ResponseCache:
+    """SQLite-backed LRU cache of raw model responses."""
+
+    # Re-check the total size after this many inserts (SUM over the table is O(n))
+    EVICT_CHECK_INTERVAL = 32
+
+    def __init__(self, path: str, max_size_mb: float = 512):
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._puts_since_check = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One connection shared by this process's threads (guarded by _lock);
+        # cross-process safety comes from SQLite's own file locking.
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        model: str,
+        provider: str,
+        prompt: str,
+        base64_image: str,
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        """Build the cache key. The base64 text maps 1:1 to the image bytes, so hashing it is a content hash."""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        image_hash = hashlib.sha256(base64_image.encode("ascii")).hexdigest()
+        material = json.dumps([model, provider, prompt_hash, image_hash, temperature, max_tokens])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._conn.commit()
+            self.writes += 1
+            self._puts_since_check += 1
+            if self._puts_since_check >= self.EVICT_CHECK_INTERVAL:
+                self._puts_since_check = 0
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits max_size_bytes. Caller holds _lock."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        excess = total - self.max_size_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._evict()
+            self._conn.close()
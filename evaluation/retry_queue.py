@@ -0,0 +1,101 @@
+"""
+evaluation/retry_queue.py
+=========================
+Deferred retries: transient failures wait in a queue instead of in a worker.
+
+With `defer_retries`, GeoLocalizationClient does not sleep and retry a 5xx,
+429, timeout, connection error or empty answer in-line; it returns at once
+with status "deferred" (and the server's Retry-After, if any). evaluate.py
+then parks the image in a RetryQueue until its backoff deadline, keeps its
+request slots busy with fresh images, and resubmits the image when it is
+due. Parse retries (no coordinates, thinking runaway) are still made
+in-line: they need no wait.
+
+Once the fresh images are done, the remaining deferred images are the
+"stragglers". An image still failing after `max_deferrals` is dropped from the
+results (so a rerun picks it up through resume) and listed in
+`<output>.stragglers.jsonl`.
+
+Usage:
+    queue = RetryQueue()
+    queue.push(entry, backoff_delay(tries=1, retry_after=deferred.retry_after_s))
+    time.sleep(queue.wait_time())
+    for entry in queue.pop_due():
+        ...
+"""
+
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from typing import List, NamedTuple, Optional
+
+# Deferrals of one image before it is given up for this session
+MAX_DEFERRALS = 5
+BACKOFF_BASE_S = 2.0
+BACKOFF_CAP_S = 120.0
+
+
+class Deferred(NamedTuple):
+    """Outcome of a call that hit a transient failure and should be retried later."""
+    status: str                      # last transient failure, e.g. http_503 / timeout
+    retry_after_s: Optional[float]   # server's Retry-After (None = backoff only)
+    attempts: int
+    retry_reasons: List[str]
+
+
+def backoff_delay(tries: int, retry_after: Optional[float] = None,
+                  base: float = BACKOFF_BASE_S, cap: float = BACKOFF_CAP_S) -> float:
+    """
+    Seconds before the `tries`-th retry of an image: exponential with equal jitter
+    (so a burst of failures doesn't come back as a burst), never before Retry-After.
+    """
+    delay = min(cap, base * 2 ** (tries - 1))
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    return max(delay, retry_after or 0.0)
+
+
+class RetryQueue:
+    """Entries waiting for their retry deadline (not thread-safe; owned by the dispatch loop)."""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()   # FIFO among equal deadlines; entries are never compared
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, entry, delay: float) -> None:
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), entry))
+
+    def wait_time(self) -> Optional[float]:
+        """Seconds until the next entry is due (0 if one is); None when empty."""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def pop_due(self) -> list:
+        due = []
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+
+def stragglers_path(output_path: str) -> str:
+    return output_path + ".stragglers.jsonl"
+
+
+def write_stragglers(output_path: str, stragglers: List[dict]) -> Optional[str]:
+    """Write this session's permanently failed images (or drop a stale report). Returns the path written."""
+    path = stragglers_path(output_path)
+    if not stragglers:
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in stragglers:
+            f.write(json.dumps(entry) + "\n")
+    return path
@@ -0,0 +1,162 @@
+"""
+evaluation/running_metrics.py
+=============================
+Streaming accumulators for the evaluation summary.
+
+RunningMetrics folds each result row in as it lands: mean WLA, failure rate,
+mean TBS and the median error, where the median comes from a P² quantile sketch
+(Jain & Chlamtac, 1985) that keeps five markers instead of all errors. Summaries
+therefore cost O(1) at any point of a run. evaluate.py writes the state to a
+small JSON sidecar next to the results file (`<output>.summary.json`) every
+few dozen rows and at the end of the run, so progress can be watched from
+outside. A resumed run rebuilds the state from the results file itself, which
+the sidecar may lag behind.
+
+Usage:
+    metrics = RunningMetrics()
+    metrics.add(row)                      # row from evaluate.py (error_km, wla_score, tbs)
+    metrics.summary()                     # {"rows": ..., "mean_wla": ..., "median_error_km": ...}
+    metrics.save("results_Adversarial_qwen3-30b.jsonl.summary.json")
+"""
+
+import json
+import os
+from typing import Optional
+
+
+class P2Quantile:
+    """P² streaming estimate of one quantile, O(1) memory."""
+
+    def __init__(self, p: float = 0.5):
+        self.p = p
+        self.n = 0
+        self.heights = []       # marker heights (the first five samples until initialized)
+        self.positions = []     # actual marker positions, 1-based
+        self.desired = []       # desired marker positions
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        q = self.heights
+        if self.n <= 5:
+            q.append(x)
+            if self.n == 5:
+                q.sort()
+                self.positions = [1, 2, 3, 4, 5]
+                p = self.p
+                self.desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+            return
+
+        # Find the cell k with q[k] <= x < q[k+1], extending the extremes if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = self._parabolic(i, d)
+                if q[i - 1] < candidate < q[i + 1]:
+                    q[i] = candidate
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        if self.n == 0:
+            return None
+        if self.n < 5:
+            # Exact, with the same linear interpolation as numpy.percentile
+            values = sorted(self.heights)
+            pos = self.p * (len(values) - 1)
+            lo = int(pos)
+            hi = min(lo + 1, len(values) - 1)
+            return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+        return self.heights[2]
+
+    def to_dict(self) -> dict:
+        return {"p": self.p, "n": self.n, "heights": self.heights,
+                "positions": self.positions, "desired": self.desired}
+
+
+class RunningMetrics:
+    """Incremental WLA / median error / TBS / failure-rate summary of one results file."""
+
+    def __init__(self):
+        self.rows = 0
+        self.failed = 0
+        self.wla_sum = 0.0
+        self.tbs_sum = 0.0
+        self.tbs_count = 0
+        self.hedged = 0
+        self.median_error = P2Quantile(0.5)
+
+    def add(self, row: dict) -> None:
+        self.rows += 1
+        if row.get('error_km') is None:
+            self.failed += 1
+        else:
+            self.wla_sum += row.get('wla_score') or 0.0
+            self.median_error.add(row['error_km'])
+        if row.get('tbs') is not None:
+            self.tbs_sum += row['tbs']
+            self.tbs_count += 1
+        if row.get('hedged'):
+            self.hedged += 1
+
+    @property
+    def valid(self) -> int:
+        return self.rows - self.failed
+
+    def summary(self) -> dict:
+        return {
+            "rows": self.rows,
+            "valid": self.valid,
+            "failure_rate": self.failed / self.rows if self.rows else None,
+            "mean_wla": self.wla_sum / self.valid if self.valid else None,
+            "median_error_km": self.median_error.value(),
+            "mean_tbs_km": self.tbs_sum / self.tbs_count if self.tbs_count else None,
+            "tbs_pairs": self.tbs_count,
+            "hedged": self.hedged,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "summary": self.summary(),
+            "state": {"rows": self.rows, "failed": self.failed, "wla_sum": self.wla_sum,
+                      "tbs_sum": self.tbs_sum, "tbs_count": self.tbs_count, "hedged": self.hedged,
+                      "median_error": self.median_error.to_dict()},
+        }
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+
+def summary_path(output_path: str) -> str:
+    """Sidecar file holding the running summary of a results file."""
+    return output_path + ".summary.json"
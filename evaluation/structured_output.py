@@ -0,0 +1,128 @@
+"""
+evaluation/structured_output.py
+===============================
+Structured (constrained) decoding, so answers parse on the first attempt.
+
+Without it, an answer that doesn't parse (no coordinates, malformed attack
+JSON) is retried at a higher temperature, at the cost of a full extra image
+prefill and decode. With `--structured`, the request itself constrains the
+output, by the model's capability:
+  guided       vLLM guided decoding: `guided_regex` for the "(lat, lon)"
+               answer, `guided_json` for the attack schema
+  json_schema  OpenAI-style `response_format` with a strict JSON schema;
+               the answer is {"latitude": .., "longitude": ..}
+  stop         anything else OpenAI-compatible: stop at the ")" that closes
+               the answer (re-appended by the client), which cuts trailing
+               chatter but does not guarantee the format
+The capability comes from "structured" in the MODEL_REGISTRY entry, else from
+PROVIDER_CONFIGS. Thinking models only get it when their entry says so (a
+constraint on a server without a reasoning parser would also constrain, or
+cut, the reasoning).
+
+Each result row records the mode that produced it (`structured`); the telemetry
+report counts parse retries of constrained vs. unconstrained rows and the
+retries avoided against the unconstrained rate.
+
+A request whose constraint the server rejects (400/422) is resent without it.
+The mode is dropped for the rest of a run only after repeated rejections
+whose message is about the constraint parameters (rejects_constraint).
+
+Usage:
+    mode = structured_mode(PROVIDER_CONFIGS["local"], MODEL_REGISTRY.get(name), is_thinking=False)
+    payload.update(coordinate_constraint(mode))
+    payload.update(json_constraint(mode, "attack", ATTACK_SCHEMA))
+"""
+
+from typing import Optional
+
+STRUCTURED_MODES = ("guided", "json_schema", "stop")
+
+# Retry reasons that a constrained answer makes unnecessary
+PARSE_RETRY_REASONS = ("no_coords",)
+
+# The "(48.8584, 2.2945)" answer the prompt asks for
+COORD_REGEX = r"\(-?\d{1,2}\.\d{1,6}, -?\d{1,3}\.\d{1,6}\)"
+
+COORD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "latitude": {"type": "number"},
+        "longitude": {"type": "number"},
+    },
+    "required": ["latitude", "longitude"],
+    "additionalProperties": False,
+}
+
+# Output of data_collector/generate_attacks.py's prompt (null fields: no legible text)
+ATTACK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "original_text": {"type": ["string", "null"]},
+        "text_location": {"type": ["string", "null"]},
+        "attacks": {
+            "type": "object",
+            "properties": {
+                "similar": {"type": "string"},
+                "random": {"type": "string"},
+                "adversarial": {"type": "string"},
+            },
+            "required": ["similar", "random", "adversarial"],
+            "additionalProperties": False,
+        },
+    },
+    "required": ["original_text", "text_location", "attacks"],
+    "additionalProperties": False,
+}
+
+_STOP = ")"
+
+# Words of an error message about the constraint parameters themselves (not the image or prompt)
+_CONSTRAINT_ERROR_HINTS = ("guided", "response_format", "json_schema", "structured", "regex", "grammar", "stop")
+
+
+def structured_mode(provider_cfg: dict, entry: Optional[dict] = None, is_thinking: bool = False) -> Optional[str]:
+    """Structured-output mode of a model on a provider; None = unconstrained."""
+    entry = entry or {}
+    if "structured" in entry:
+        mode = entry["structured"]
+    elif is_thinking:
+        return None
+    else:
+        mode = provider_cfg.get("structured") or "stop"
+    if mode is not None and mode not in STRUCTURED_MODES:
+        raise ValueError(f"Unknown structured-output mode '{mode}' (expected one of {STRUCTURED_MODES})")
+    return mode
+
+
+def coordinate_constraint(mode: Optional[str]) -> dict:
+    """Request fields that constrain a coordinate answer."""
+    if mode == "guided":
+        return {"guided_regex": COORD_REGEX}
+    if mode == "json_schema":
+        return json_constraint(mode, "coordinates", COORD_SCHEMA)
+    if mode == "stop":
+        return {"stop": [_STOP]}
+    return {}
+
+
+def json_constraint(mode: Optional[str], name: str, schema: dict) -> dict:
+    """Request fields that constrain an answer to a JSON schema (a stop sequence can't, so nothing for "stop")."""
+    if mode == "guided":
+        return {"guided_json": schema}
+    if mode == "json_schema":
+        return {"response_format": {"type": "json_schema",
+                                    "json_schema": {"name": name, "strict": True, "schema": schema}}}
+    return {}
+
+
+def rejects_constraint(message: Optional[str]) -> bool:
+    """True if a 400/422 error message is about the constraint parameters."""
+    message = (message or "").lower()
+    return any(hint in message for hint in _CONSTRAINT_ERROR_HINTS)
+
+
+def complete_answer(text: Optional[str], mode: Optional[str]) -> Optional[str]:
+    """Put back the stop sequence, which servers leave out of the returned text."""
+    if mode == "stop" and text and "(" in text and not text.rstrip().endswith(_STOP):
+        return text.rstrip() + _STOP
+    return text
@@ -0,0 +1,51 @@
+"""
+evaluation/subset.py
+====================
+Subset manifests: a named core-set of base ids to evaluate instead of a whole dataset.
+
+A subset manifest is a JSON file written by build_lite_subset.py, by default
+`<dataset>/metadata/<dataset>_lite.json`. It holds the selected base ids and
+how they were chosen: strata, seed, source models, and the full-set and
+subset metrics it was checked against. `evaluate.py --subset` runs only the
+images whose base id is in it (clean images and their attacked versions
+alike). run_pipeline.py and run_scheduler.py take `--subset` either as a path
+or as a subset name that is looked up per dataset.
+
+Usage:
+    base_ids = load_subset(".../metadata/im2gps3k_lite.json")
+    path = subset_path(".../im2gps3k", "im2gps3k", "lite")
+"""
+
+import json
+import os
+from typing import Optional, Set
+
+DEFAULT_SUBSET = "lite"
+
+
+def subset_path(dataset_dir: str, dataset_name: str, name: str = DEFAULT_SUBSET) -> str:
+    """Where the subset manifest `name` of a dataset lives."""
+    return os.path.join(dataset_dir, "metadata", f"{dataset_name}_{name}.json")
+
+
+def resolve_subset(subset: Optional[str], dataset_dir: str, dataset_name: str) -> Optional[str]:
+    """A --subset value as a path: an existing file as is, anything else as a subset name."""
+    if not subset:
+        return None
+    if os.path.isfile(subset):
+        return subset
+    return subset_path(dataset_dir, dataset_name, subset)
+
+
+def load_subset(path: str) -> Set[str]:
+    """Base ids of a subset manifest."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return set(json.load(f)["base_ids"])
+
+
+def save_subset(path: str, subset: dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(subset, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
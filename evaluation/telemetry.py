@@ -0,0 +1,373 @@
+"""
+evaluation/telemetry.py
+=======================
+Per-request provider telemetry, aggregated per run.
+
+GeoLocalizationClient.predict_location_detailed reports wall time, time to
+first byte, token usage, retry reasons, temperature escalation, image
+recompression, output constraint and final status for every image;
+evaluate.py stores those in
+each result row (TELEMETRY_FIELDS) and folds them into a RunTelemetry. The
+run report has p50/p95/p99 latency, tokens/s, retries per 100 images, parse
+retries avoided by structured output and the cost at the prices in
+latest_standard_vlm_benchmark_suite.csv. It is saved
+as `<output>.telemetry.json` and as a Prometheus text-format file
+(`<output>.prom`) for the dashboard's textfile scraper.
+
+Usage:
+    telemetry = RunTelemetry(model_id="Qwen/Qwen3-VL-8B-Instruct", prices=load_prices())
+    telemetry.add(row)                           # result row with TELEMETRY_FIELDS
+    telemetry.report()                           # {"latency_s": {"p50": ...}, "cost_usd": ...}
+    telemetry.save("results_Adversarial_qwen3-vl-8b-sf.jsonl", labels={"model": "qwen3-vl-8b-sf"})
+
+    # Report for an existing results file:
+    python -m evaluation.telemetry results_Adversarial_qwen3-vl-8b-sf.jsonl --model qwen3-vl-8b-sf
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from evaluation.running_metrics import P2Quantile
+from evaluation.structured_output import PARSE_RETRY_REASONS
+
+PRICE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "latest_standard_vlm_benchmark_suite.csv")
+
+# Result row fields filled from predict_location_detailed's info dict
+TELEMETRY_FIELDS = [
+    "status", "latency_s", "ttfb_s", "prompt_tokens", "completion_tokens", "reasoning_tokens",
+    "attempts", "retry_reasons", "temperature", "compressed", "image_scale", "backend", "structured",
+    "truncated", "max_tokens", "reasoning_budget",
+]
+
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def row_telemetry(info: Optional[dict]) -> dict:
+    """Telemetry fields for a result row (all None when the request details are unknown, e.g. batch mode)."""
+    info = info or {}
+    return {field: info.get(field) for field in TELEMETRY_FIELDS}
+
+
+# ============================================================
+#  Prices
+# ============================================================
+
+def _norm(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def load_prices(csv_path: str = PRICE_CSV) -> List[Tuple[str, str, float, float]]:
+    """(normalized name, sheet name, input USD/1M, output USD/1M) for each model in the price sheet."""
+    prices = []
+    if not os.path.exists(csv_path):
+        return prices
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            try:
+                prices.append((_norm(row["model"]), row["model"],
+                               float(row["input_usd_per_1m"]), float(row["output_usd_per_1m"])))
+            except (KeyError, ValueError):
+                continue
+    return prices
+
+
+def price_for(model_id: str, prices) -> Optional[Tuple[str, float, float]]:
+    """(sheet name, input, output USD/1M) of the sheet model whose name is contained in model_id, longest first."""
+    key = _norm(model_id)
+    matches = [p for p in prices if p[0] and p[0] in key]
+    if not matches:
+        return None
+    _, name, price_in, price_out = max(matches, key=lambda p: len(p[0]))
+    return name, price_in, price_out
+
+
+# ============================================================
+#  Run accumulator
+# ============================================================
+
+class RunTelemetry:
+    """Streaming telemetry summary of the rows recorded in one evaluation session."""
+
+    def __init__(self, model_id: str = "", prices=None, timed: bool = True):
+        self.price = price_for(model_id, prices) if prices else None
+        # Wall-clock span of the session, for the per-second rates (untimed when replaying a file)
+        self.started = time.time() if timed else None
+        self.finished = self.started
+        self.rows = 0
+        self.statuses = Counter()
+        self.backends = Counter()
+        self.retry_reasons = Counter()
+        self.latency = {q: P2Quantile(q) for q in LATENCY_QUANTILES}
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.ttfb = {q: P2Quantile(q) for q in LATENCY_QUANTILES}
+        self.tokens = Counter()
+        self.rows_with_usage = 0
+        self.escalated = 0
+        self.compressed = 0
+        self.hedged = 0
+        self.structured = Counter()
+        # [rows, parse retries] of constrained / free-text rows
+        self.parse = {"structured": [0, 0], "free": [0, 0]}
+        # Free-text parse retries per row measured in another run (e.g. the baseline file)
+        self.reference_parse_rate = None
+
+    def add(self, row: dict) -> None:
+        self.rows += 1
+        if self.started is not None:
+            self.finished = time.time()
+        self.statuses[row.get("status") or "unknown"] += 1
+        if row.get("backend"):
+            self.backends[row["backend"]] += 1
+        self.retry_reasons.update(row.get("retry_reasons") or [])
+        if row.get("latency_s") is not None and row.get("status") != "cached":
+            for sketch in self.latency.values():
+                sketch.add(row["latency_s"])
+            self.latency_sum += row["latency_s"]
+            self.latency_count += 1
+        if row.get("ttfb_s") is not None:
+            for sketch in self.ttfb.values():
+                sketch.add(row["ttfb_s"])
+        if row.get("prompt_tokens") is not None or row.get("completion_tokens") is not None:
+            self.rows_with_usage += 1
+            for key in ("prompt_tokens", "completion_tokens", "reasoning_tokens"):
+                self.tokens[key] += row.get(key) or 0
+        if row.get("temperature"):
+            self.escalated += 1
+        if row.get("compressed"):
+            self.compressed += 1
+        if row.get("hedged"):
+            self.hedged += 1
+        if row.get("status") not in (None, "cached"):
+            parse = self.parse["structured" if row.get("structured") else "free"]
+            parse[0] += 1
+            parse[1] += sum(r in PARSE_RETRY_REASONS for r in row.get("retry_reasons") or [])
+            if row.get("structured"):
+                self.structured[row["structured"]] += 1
+
+    def set_reference(self, rows: int, parse_retries: int) -> None:
+        """Free-text parse retry rate of an earlier run of the model, for the retries-avoided estimate."""
+        if rows:
+            self.reference_parse_rate = parse_retries / rows
+
+    def _structured_report(self) -> Optional[dict]:
+        (rows, retries), (free_rows, free_retries) = self.parse["structured"], self.parse["free"]
+        if not rows:
+            return None
+        # Unconstrained rate of this run if it has free-text rows, else the reference run's
+        rate = free_retries / free_rows if free_rows else self.reference_parse_rate
+        return {
+            "modes": dict(self.structured),
+            "rows": rows,
+            "parse_retries": retries,
+            "free_rows": free_rows,
+            "free_parse_retries": free_retries,
+            "free_parse_rate": rate,
+            "parse_retries_avoided": max(0.0, rows * rate - retries) if rate is not None else None,
+        }
+
+    def report(self) -> dict:
+        wall = max(self.finished - self.started, 1e-9) if self.started is not None else None
+        retries = sum(self.retry_reasons.values())
+        cost = None
+        if self.price is not None and self.rows_with_usage:
+            _, price_in, price_out = self.price
+            cost = (self.tokens["prompt_tokens"] * price_in + self.tokens["completion_tokens"] * price_out) / 1e6
+        return {
+            "rows": self.rows,
+            "wall_s": round(wall, 3) if wall else None,
+            "statuses": dict(self.statuses),
+            "backends": dict(self.backends),
+            "latency_s": {f"p{q*100:g}": self.latency[q].value() for q in LATENCY_QUANTILES},
+            "latency_mean_s": self.latency_sum / self.latency_count if self.latency_count else None,
+            "ttfb_s": {f"p{q*100:g}": self.ttfb[q].value() for q in LATENCY_QUANTILES},
+            "tokens": dict(self.tokens),
+            "rows_with_usage": self.rows_with_usage,
+            "completion_tokens_per_s": self.tokens["completion_tokens"] / wall
+                                       if wall and self.rows_with_usage else None,
+            "total_tokens_per_s": (self.tokens["prompt_tokens"] + self.tokens["completion_tokens"]) / wall
+                                  if wall and self.rows_with_usage else None,
+            "retries": retries,
+            "retries_per_100": retries * 100 / self.rows if self.rows else None,
+            "retry_reasons": dict(self.retry_reasons),
+            "escalated": self.escalated,
+            "compressed": self.compressed,
+            "hedged": self.hedged,
+            "structured": self._structured_report(),
+            "price": {"model": self.price[0], "input_usd_per_1m": self.price[1],
+                      "output_usd_per_1m": self.price[2]} if self.price else None,
+            "cost_usd": cost,
+        }
+
+    def save(self, output_path: str, labels: Optional[Dict[str, str]] = None) -> dict:
+        """Write `<output>.telemetry.json` and `<output>.prom`. Returns the report."""
+        report = self.report()
+        _write_atomic(telemetry_path(output_path), json.dumps(report, indent=2))
+        _write_atomic(prom_path(output_path), to_prometheus(report, labels or {}))
+        return report
+
+
+def parse_retry_counts(results_path: str) -> Tuple[int, int]:
+    """(free-text rows, their parse retries) in a results file; rows from before telemetry are skipped."""
+    rows = retries = 0
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row.get("structured") or row.get("status") in (None, "cached"):
+                continue
+            rows += 1
+            retries += sum(r in PARSE_RETRY_REASONS for r in row.get("retry_reasons") or [])
+    return rows, retries
+
+
+def telemetry_path(output_path: str) -> str:
+    return output_path + ".telemetry.json"
+
+
+def prom_path(output_path: str) -> str:
+    return output_path + ".prom"
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+# ============================================================
+#  Prometheus text format
+# ============================================================
+
+def _labels(labels: Dict[str, str], **extra) -> str:
+    merged = {**labels, **extra}
+    if not merged:
+        return ""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    body = ",".join(f'{k}="{escape(v)}"' for k, v in merged.items())
+    return "{" + body + "}"
+
+
+def to_prometheus(report: dict, labels: Dict[str, str]) -> str:
+    """Render a run report as Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        samples = [(extra, value) for extra, value in samples if value is not None]
+        if not samples:
+            return
+        lines.append(f"# HELP signpost_{name} {help_text}")
+        lines.append(f"# TYPE signpost_{name} {kind}")
+        for extra, value in samples:
+            lines.append(f"signpost_{name}{_labels(labels, **extra)} {value:g}")
+
+    metric("requests_total", "counter", "Result rows recorded in this run, by final status",
+           [({"status": s}, n) for s, n in sorted(report["statuses"].items())])
+    metric("backend_requests_total", "counter", "Result rows by the backend that served them",
+           [({"backend": b}, n) for b, n in sorted(report.get("backends", {}).items())])
+    metric("request_latency_seconds", "gauge", "Per-image request wall time quantiles (retries included)",
+           [({"quantile": f"{q:g}"}, report["latency_s"][f"p{q*100:g}"]) for q in LATENCY_QUANTILES])
+    metric("ttfb_seconds", "gauge", "Time to first byte quantiles",
+           [({"quantile": f"{q:g}"}, report["ttfb_s"][f"p{q*100:g}"]) for q in LATENCY_QUANTILES])
+    metric("tokens_total", "counter", "Tokens reported in provider usage blocks",
+           [({"kind": k.replace("_tokens", "")}, n) for k, n in sorted(report["tokens"].items())])
+    metric("completion_tokens_per_second", "gauge", "Completion tokens per second of run wall time",
+           [({}, report["completion_tokens_per_s"])])
+    metric("retries_total", "counter", "Failed attempts, by reason",
+           [({"reason": r}, n) for r, n in sorted(report["retry_reasons"].items())])
+    metric("retries_per_100_images", "gauge", "Failed attempts per 100 images", [({}, report["retries_per_100"])])
+    metric("temperature_escalations_total", "counter", "Images answered above temperature 0",
+           [({}, report["escalated"])])
+    metric("compressed_images_total", "counter", "Images recompressed to fit the provider limit",
+           [({}, report["compressed"])])
+    metric("hedged_requests_total", "counter", "Images that fired a hedge duplicate", [({}, report["hedged"])])
+    structured = report.get("structured") or {}
+    metric("structured_rows_total", "counter", "Rows answered under an output constraint, by mode",
+           [({"mode": m}, n) for m, n in sorted((structured.get("modes") or {}).items())])
+    metric("parse_retries_avoided", "gauge", "Parse retries saved by structured output (vs. the free-text rate)",
+           [({}, structured.get("parse_retries_avoided"))])
+    metric("cost_usd_total", "counter", "Cost at the price sheet rates", [({}, report["cost_usd"])])
+    return "\n".join(lines) + "\n"
+
+
+def format_report(report: dict) -> List[str]:
+    """Human-readable report lines (used by evaluate.py's final report)."""
+    def secs(v):
+        return f"{v:.2f}s" if v is not None else "n/a"
+
+    lat, ttfb = report["latency_s"], report["ttfb_s"]
+    out = [f"Latency: p50 {secs(lat['p50'])} / p95 {secs(lat['p95'])} / p99 {secs(lat['p99'])}, "
+           f"TTFB p50 {secs(ttfb['p50'])} / p95 {secs(ttfb['p95'])}"]
+    if report["rows_with_usage"]:
+        tokens = report["tokens"]
+        rate = report["completion_tokens_per_s"]
+        out.append(f"Tokens: {tokens.get('prompt_tokens', 0)} prompt, {tokens.get('completion_tokens', 0)} completion "
+                   f"({tokens.get('reasoning_tokens', 0)} reasoning)"
+                   + (f", {rate:.1f} completion tokens/s" if rate is not None else ""))
+    else:
+        out.append("Tokens: n/a (no usage reported)")
+    if report["retries_per_100"] is not None:
+        reasons = ", ".join(f"{r}={n}" for r, n in sorted(report["retry_reasons"].items())) or "none"
+        out.append(f"Retries: {report['retries_per_100']:.1f} per 100 images ({reasons}); "
+                   f"{report['escalated']} escalated temperature, {report['compressed']} compressed")
+    structured = report.get("structured")
+    if structured:
+        modes = ", ".join(f"{m}={n}" for m, n in sorted(structured["modes"].items()))
+        line = f"Structured output: {structured['rows']} rows ({modes}), {structured['parse_retries']} parse retries"
+        if structured["parse_retries_avoided"] is not None:
+            line += (f"; ~{structured['parse_retries_avoided']:.0f} avoided at the free-text rate "
+                     f"of {structured['free_parse_rate']*100:.1f} per 100")
+        out.append(line)
+    if len(report.get("backends") or {}) > 1:
+        out.append("Backends: " + ", ".join(f"{b}={n}" for b, n in sorted(report["backends"].items())))
+    if report["cost_usd"] is not None:
+        price = report["price"]
+        out.append(f"Cost: ${report['cost_usd']:.4f} ({price['model']} @ ${price['input_usd_per_1m']}"
+                   f"/${price['output_usd_per_1m']} per 1M in/out)")
+    else:
+        out.append("Cost: n/a (no usage or no price sheet entry for this model)")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry report for an existing results file")
+    parser.add_argument("results", type=str, help="results_*.jsonl written by evaluate.py")
+    parser.add_argument("--model", type=str, default="", help="Model id or registry name, for prices")
+    parser.add_argument("--price-csv", type=str, default=PRICE_CSV, help="Price sheet (default: %(default)s)")
+    parser.add_argument("--reference", type=str, default=None,
+                        help="Free-text results file of the same model, for the parse retries avoided by --structured")
+    args = parser.parse_args()
+
+    from evaluation.api_client import MODEL_REGISTRY
+    model_id = MODEL_REGISTRY.get(args.model, {}).get("model", args.model)
+
+    # Rows carry no timestamps, so a replayed file has no per-second rates
+    telemetry = RunTelemetry(model_id, load_prices(args.price_csv), timed=False)
+    if args.reference:
+        telemetry.set_reference(*parse_retry_counts(args.reference))
+    with open(args.results, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                telemetry.add(json.loads(line))
+            except ValueError:
+                continue
+    report = telemetry.save(args.results, labels={"model": args.model or "unknown",
+                                                  "run": os.path.basename(args.results)})
+    for line in format_report(report):
+        print(line)
+    print(f"Saved {telemetry_path(args.results)} and {prom_path(args.results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+evaluation/token_profile.py
+===========================
+Per-model output token profile, and the max_tokens / reasoning budget it implies.
+
+Every evaluated row with usage adds its completion and reasoning token counts
+to a shared SQLite store (WAL, like the response cache), keyed by the model's
+registry name. Only single-attempt rows are sampled (usage is summed over
+retries); every attempt that hit max_tokens (finish_reason "length", a
+thinking runaway or a cut answer of any model) is kept as a truncated sample.
+
+From the stats, build_client derives per-model limits instead of the fixed
+2048: max_tokens = p99 completion tokens * (1 + margin), and for thinking
+models a reasoning budget = p99 reasoning tokens * (1 + margin) (enforced with
+--stream). Both are rounded up to a power of two. That keeps the setting
+stable as samples accumulate, which matters because max_tokens is part of the
+response-cache key. Smaller limits mean less KV cache reserved per request on
+vLLM. If more than TRUNCATION_TOLERANCE of the samples were cut, the tail is
+unknown, and the default stays.
+
+`evaluate.py --calibrate N` warms up a model without a profile: it runs N
+sampled images with the default limits first, then applies the derived ones.
+
+Usage:
+    profile = TokenProfileStore("/data/cache/token_profile.sqlite")
+    client = build_client("qwen3-vl-8b-sf", token_profile=profile)    # calibrated max_tokens
+    profile.record("qwen3-vl-8b-sf", completion_tokens=14, reasoning_tokens=None)
+
+    python -m evaluation.token_profile /data/cache/token_profile.sqlite
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+DEFAULT_MAX_TOKENS = 2048
+# Samples before a profile is trusted
+MIN_SAMPLES = 30
+# Newest samples kept per model
+MAX_SAMPLES = 2000
+TOKEN_MARGIN = 0.25
+TOKEN_QUANTILE = 0.99
+# Share of truncated samples above which the p99 is censored
+TRUNCATION_TOLERANCE = 0.01
+# Floor of a calibrated max_tokens: a coordinate answer, as JSON or with a short preamble, must fit
+MIN_MAX_TOKENS = 128
+MAX_MAX_TOKENS = 32768
+
+
+class TokenLimits(NamedTuple):
+    max_tokens: int
+    reasoning_budget: Optional[int]   # None: not a thinking model, or no reasoning counts reported
+    samples: int
+    truncated: int
+
+    def describe(self) -> str:
+        budget = f", reasoning budget {self.reasoning_budget}" if self.reasoning_budget else ""
+        return (f"max_tokens {self.max_tokens}{budget} "
+                f"(from {self.samples} samples, {self.truncated} truncated)")
+
+
+def _quantile(values: List[int], q: float) -> float:
+    """Nearest-rank quantile of a non-empty list."""
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def _round_up(tokens: float) -> int:
+    """Next power of two, within [MIN_MAX_TOKENS, MAX_MAX_TOKENS]."""
+    return min(MAX_MAX_TOKENS, max(MIN_MAX_TOKENS, 1 << max(0, math.ceil(tokens) - 1).bit_length()))
+
+
+class TokenProfileStore:
+    """SQLite store of per-model completion/reasoning token samples."""
+
+    # Trim old samples after this many inserts
+    PRUNE_INTERVAL = 200
+
+    def __init__(self, path: str):
+        self.path = path
+        self._inserts = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            " model TEXT NOT NULL,"
+            " completion_tokens INTEGER,"      # NULL for truncated samples
+            " reasoning_tokens INTEGER,"
+            " truncated INTEGER NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_model ON samples(model, created)")
+        self._conn.commit()
+
+    def record(self, model: str, completion_tokens: Optional[int], reasoning_tokens: Optional[int] = None,
+               truncated: bool = False) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO samples (model, completion_tokens, reasoning_tokens, truncated, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (model, completion_tokens, reasoning_tokens, int(truncated), time.time()),
+            )
+            self._conn.commit()
+            self._inserts += 1
+            if self._inserts % self.PRUNE_INTERVAL == 0:
+                self._prune(model)
+
+    def record_row(self, row: dict) -> int:
+        """Sample a result row (keyed by its backend). Returns the number of samples added."""
+        if not row.get("backend") or row.get("status") in (None, "cached"):
+            return 0
+        truncated = row.get("truncated")
+        if truncated is None:
+            # Rows written before `truncated` was recorded: only thinking runaways are known
+            truncated = (row.get("retry_reasons") or []).count("runaway") + (row.get("status") == "runaway")
+        for _ in range(truncated):
+            self.record(row["backend"], None, truncated=True)
+        if row.get("attempts") != 1 or row.get("completion_tokens") is None or truncated:
+            return truncated
+        self.record(row["backend"], row["completion_tokens"], row.get("reasoning_tokens"))
+        return 1
+
+    def _prune(self, model: str) -> None:
+        """Keep the newest MAX_SAMPLES samples of a model. Caller holds _lock."""
+        self._conn.execute(
+            "DELETE FROM samples WHERE model = ? AND rowid NOT IN "
+            "(SELECT rowid FROM samples WHERE model = ? ORDER BY created DESC LIMIT ?)",
+            (model, model, MAX_SAMPLES),
+        )
+        self._conn.commit()
+
+    def samples(self, model: str) -> List[tuple]:
+        """(completion_tokens, reasoning_tokens, truncated) of the newest samples of a model."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT completion_tokens, reasoning_tokens, truncated FROM samples WHERE model = ? "
+                "ORDER BY created DESC LIMIT ?", (model, MAX_SAMPLES)).fetchall()
+
+    def count(self, model: str) -> int:
+        return len(self.samples(model))
+
+    def models(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT model FROM samples ORDER BY model")]
+
+    def limits(self, model: str, thinking: bool = False, margin: float = TOKEN_MARGIN,
+               min_samples: int = MIN_SAMPLES, default: int = DEFAULT_MAX_TOKENS) -> Optional[TokenLimits]:
+        """Calibrated limits of a model, or None until it has min_samples samples."""
+        rows = self.samples(model)
+        if len(rows) < min_samples:
+            return None
+        truncated = sum(r[2] for r in rows)
+        complete = [r for r in rows if not r[2]]
+        if truncated > TRUNCATION_TOLERANCE * len(rows) or not complete:
+            return TokenLimits(default, None, len(rows), truncated)
+        max_tokens = _round_up(_quantile([r[0] for r in complete], TOKEN_QUANTILE) * (1 + margin))
+        budget = None
+        reasoning = [r[1] for r in complete if r[1] is not None]
+        if thinking and reasoning:
+            budget = _round_up(_quantile(reasoning, TOKEN_QUANTILE) * (1 + margin))
+        return TokenLimits(max_tokens, budget, len(rows), truncated)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def apply_limits(client, store: TokenProfileStore) -> List[str]:
+    """
+    Set calibrated limits on a client, or on every backend of a FailoverClient.
+    Returns a description per backend that got them.
+    """
+    applied = []
+    for backend in getattr(client, "clients", [client]):
+        limits = store.limits(backend.backend, backend.is_thinking_model)
+        if limits is None:
+            continue
+        backend.max_tokens = limits.max_tokens
+        if limits.reasoning_budget and backend.reasoning_budget is None:
+            backend.reasoning_budget = limits.reasoning_budget
+        applied.append(f"{backend.backend}: {limits.describe()}")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show per-model token profiles and the limits they imply")
+    parser.add_argument("db", type=str, help="Token profile SQLite file")
+    parser.add_argument("--margin", type=float, default=TOKEN_MARGIN, help="Margin over p99 (default: %(default)s)")
+    args = parser.parse_args()
+
+    from evaluation.api_client import MODEL_REGISTRY
+
+    store = TokenProfileStore(args.db)
+    print(f"{'Model':<40} {'Samples':>8} {'p50':>6} {'p99':>6}  Limits")
+    for model in store.models():
+        rows = store.samples(model)
+        completion = [r[0] for r in rows if not r[2]] or [0]
+        limits = store.limits(model, MODEL_REGISTRY.get(model, {}).get("thinking", False), args.margin)
+        print(f"{model:<40} {len(rows):>8} {_quantile(completion, 0.5):>6} {_quantile(completion, 0.99):>6}  "
+              f"{limits.describe() if limits else f'uncalibrated (< {MIN_SAMPLES} samples)'}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import requests
 import json
 import re
 
+from evaluation.coord_parser import parse_coordinates
+
 class VLLMInferenceClient:
     def __init__(self, api_base, api_key, model_name):
         self.api_base = api_base.rstrip('/')
@@ -117,26 +119,4 @@ Example: (48.8584, 2.2945)
 
     @staticmethod
     def parse_coordinates(text):
-        if not text: return None, None
-        
-        # 1. Try JSON
-        try:
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group(0))
-                if 'latitude' in data and 'longitude' in data:
-                    return float(data['latitude']), float(data['longitude'])
-        except: pass
-
-        # 2. Try Regex (Lat, Lon)
-        match = re.search(r'\(\s*(-?\d+\.?\d*)\s*,\s*(-?\d+\.?\d*)\s*\)', text)
-        if match:
-            return float(match.group(1)), float(match.group(2))
-            
-        # 3. Label format
-        lat = re.search(r'Latitude[:\s]+(-?\d+\.?\d*)', text, re.IGNORECASE)
-        lon = re.search(r'Longitude[:\s]+(-?\d+\.?\d*)', text, re.IGNORECASE)
-        if lat and lon:
-            return float(lat.group(1)), float(lon.group(1))
-
-        return None, None
+        return parse_coordinates(text)
@@ -5,6 +5,7 @@ import random
 import time
 from data_collector.comfy_client import ComfyClient
 from data_collector.utils import load_workflow_api
+from evaluation.manifest import SampleManifest, synthesized_record
 
 # Key Node IDs (must match image_qwen_image_edit.json)
 NODE_ID_LOAD_IMAGE = "78"
@@ -17,6 +18,8 @@ def parse_args():
     parser.add_argument("--output-dir", type=str, required=True, help="Directory to save final benchmark images")
     parser.add_argument("--comfy-server", type=str, default="127.0.0.1:8188", help="ComfyUI server address")
     parser.add_argument("--limit", type=int, default=0, help="Limit number of images processed")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Sample manifest to register synthesized images in (from convert_metadata.py)")
     return parser.parse_args()
 
 def generate_image_with_comfy(client, workflow_template, input_image_path, prompt, seed=None):
@@ -96,6 +99,8 @@ def main():
         print("Error: Failed to load workflow template.")
         return
 
+    manifest = SampleManifest(args.manifest) if args.manifest else None
+
     # 3. Load Attacks
     print(f"Reading attacks from {args.attack_file}...")
     attacks = []
@@ -196,6 +201,8 @@ def main():
         }
         with open(os.path.join(args.output_dir, "benchmark_meta.jsonl"), "a", encoding="utf-8") as meta_f:
             meta_f.write(json.dumps(meta_entry) + "\n")
+        if manifest is not None:
+            manifest.upsert([synthesized_record(meta_entry, manifest)])
 
         # ==========================================
         # Phase 2: Generate Attacks (Using ORIGINAL CLEAN IMAGE as input)
@@ -252,11 +259,15 @@ def main():
             }
             with open(os.path.join(args.output_dir, "benchmark_meta.jsonl"), "a", encoding="utf-8") as meta_f:
                 meta_f.write(json.dumps(meta_entry) + "\n")
+            if manifest is not None:
+                manifest.upsert([synthesized_record(meta_entry, manifest)])
 
         processed_count += 1
 
     print(f"\nBenchmark Generation Complete. Metadata saved to {os.path.join(args.output_dir, 'benchmark_meta.jsonl')}")
     client.close()
+    if manifest is not None:
+        manifest.close()
 
 if __name__ == "__main__":
     main()
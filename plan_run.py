@@ -0,0 +1,271 @@
+"""
+plan_run.py
+===========
+Pre-flight planner for evaluation runs: remaining work, tokens, cost and ETA.
+
+For every (dataset, attack, model) cell it counts the images evaluate.py would
+still send (image dir minus rows already in results_*.jsonl minus invalid_ids.json),
+estimates input tokens from the real image sizes (header-only reads of a sample,
+(W×H)/750 + prompt), takes output tokens and latency from the telemetry fields of
+the model's existing result rows when there are any, and prices the tokens with
+latest_standard_vlm_benchmark_suite.csv. Local models cost nothing.
+
+The ETA assumes `--concurrency` in-flight requests per cell and `--max-jobs`
+cells at a time, like run_scheduler.py. With `--budget-usd`, the planner exits
+non-zero when the estimated cost exceeds the budget; run_pipeline.py and
+run_scheduler.py run the same check before starting.
+
+Usage:
+    python plan_run.py --models qwen3-30b,gpt-4o --datasets im2gps3k yfcc4k --concurrency 8
+    python plan_run.py --models gpt-5.4 --datasets yfcc4k --budget-usd 50
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from collections import defaultdict
+
+from evaluate import load_invalid_ids
+from evaluation.image_tokens import (OUTPUT_TOKENS_EST, PROMPT_TOKENS_EST, estimate_image_tokens,
+                                     image_size_from_bytes)
+from evaluation.manifest import SampleManifest
+from evaluation.subset import load_subset
+from evaluation.telemetry import PRICE_CSV, load_prices, price_for
+from run_pipeline import MODEL_REGISTRY, eval_targets, get_paths, resolve_model
+
+DEFAULT_DATASETS = ["yfcc4k", "im2gps3k", "googlesv", "baidusv"]
+VALID_EXTS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Fallbacks when a model has no measured rows yet
+DEFAULT_LATENCY_S = 5.0
+THINKING_OUTPUT_TOKENS_EST = 2048   # the client's max_tokens, an upper bound
+SIZE_SAMPLE = 300                   # images per directory whose headers are read
+
+# Bytes that cover PNG/JPEG headers, including large EXIF blocks
+_HEADER_BYTES = 256 * 1024
+
+
+def matrix_targets(datasets, models):
+    """Cells of the evaluation matrix as dicts (same expansion as run_scheduler.py)."""
+    targets = []
+    for dataset in datasets:
+        paths = get_paths(dataset)
+        for model in models:
+            _, model_short, _ = resolve_model(model)
+            for name, img_dir, result_file, _, _ in eval_targets(paths, model_short):
+                if img_dir.exists() and img_dir.is_dir():
+                    targets.append({"dataset": dataset, "subdir": name, "model": model,
+                                    "img_dir": str(img_dir), "result_file": str(result_file),
+                                    "manifest": str(paths['manifest'])})
+    return targets
+
+
+def done_filenames(result_file):
+    done = set()
+    if os.path.exists(result_file):
+        with open(result_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['filename'])
+                except: pass
+    return done
+
+
+def remaining_images(target, invalid_ids, manifest=None, subset=None):
+    """Image files of a cell that evaluate.py would still send (only base ids in `subset`, if given)."""
+    done = done_filenames(target['result_file'])
+    remaining = []
+    for filename in sorted(os.listdir(target['img_dir'])):
+        if not filename.lower().endswith(VALID_EXTS) or filename in done:
+            continue
+        base_id = manifest.base_id_of(filename) if manifest is not None else None
+        key = base_id or os.path.splitext(filename.split('_')[0])[0]
+        if key in invalid_ids or (subset is not None and key not in subset):
+            continue
+        remaining.append(filename)
+    return remaining
+
+
+def mean_input_tokens(img_dir, filenames, sample=SIZE_SAMPLE, seed=0):
+    """Mean prompt + image tokens over a sample of the images (header reads only)."""
+    if not filenames:
+        return 0.0
+    picked = random.Random(seed).sample(filenames, min(sample, len(filenames)))
+    tokens = []
+    for filename in picked:
+        try:
+            with open(os.path.join(img_dir, filename), 'rb') as f:
+                size = image_size_from_bytes(f.read(_HEADER_BYTES))
+        except OSError:
+            size = None
+        if size is not None:
+            tokens.append(PROMPT_TOKENS_EST + estimate_image_tokens(*size))
+    return sum(tokens) / len(tokens) if tokens else 0.0
+
+
+def measured_stats(result_files):
+    """Mean latency and completion tokens over the telemetry fields of existing result rows."""
+    latency, completion = [], []
+    for path in result_files:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if row.get('latency_s') is not None and row.get('status') != 'cached':
+                    latency.append(row['latency_s'])
+                if row.get('completion_tokens') is not None:
+                    completion.append(row['completion_tokens'])
+    return {
+        "latency_s": sum(latency) / len(latency) if latency else None,
+        "completion_tokens": sum(completion) / len(completion) if completion else None,
+        "rows": len(latency),
+    }
+
+
+def plan_targets(targets, concurrency=1, prices=None, invalid_ids=None, sample=SIZE_SAMPLE):
+    """Plan each target cell. Returns one dict per cell with remaining images, tokens, cost and ETA."""
+    prices = load_prices() if prices is None else prices
+    invalid_ids = invalid_ids or set()
+
+    # Measured per-model stats pool every result file of that model in the plan
+    files_by_model = defaultdict(list)
+    for t in targets:
+        files_by_model[t['model']].append(t['result_file'])
+    stats = {model: measured_stats(files) for model, files in files_by_model.items()}
+
+    manifests, subsets = {}, {}
+    cells = []
+    for t in targets:
+        path = t.get('manifest')
+        if path and path not in manifests:
+            manifests[path] = SampleManifest(path) if os.path.exists(path) else None
+        subset_path = t.get('subset')
+        if subset_path and subset_path not in subsets:
+            subsets[subset_path] = load_subset(subset_path)
+        filenames = remaining_images(t, invalid_ids, manifests.get(path), subsets.get(subset_path))
+
+        entry = MODEL_REGISTRY.get(t['model'], {})
+        provider = entry.get("provider", "local")
+        model_stats = stats[t['model']]
+        output_tokens = model_stats['completion_tokens']
+        if output_tokens is None:
+            output_tokens = THINKING_OUTPUT_TOKENS_EST if entry.get("thinking") else OUTPUT_TOKENS_EST
+        latency = model_stats['latency_s'] or DEFAULT_LATENCY_S
+
+        input_tokens = mean_input_tokens(t['img_dir'], filenames, sample) * len(filenames)
+        output_total = output_tokens * len(filenames)
+        if provider == "local":
+            price, cost = None, 0.0
+        else:
+            price = price_for(entry.get("model", t['model']), prices)
+            cost = (input_tokens * price[1] + output_total * price[2]) / 1e6 if price else None
+
+        cells.append({
+            **t,
+            "provider": provider,
+            "remaining": len(filenames),
+            "input_tokens": int(input_tokens),
+            "output_tokens": int(output_total),
+            "latency_s": latency,
+            "latency_measured": model_stats['latency_s'] is not None,
+            "price": price[0] if price else None,
+            "cost_usd": cost,
+            "eta_s": len(filenames) * latency / max(1, concurrency),
+        })
+    for manifest in manifests.values():
+        if manifest is not None:
+            manifest.close()
+    return cells
+
+
+def total_cost(cells):
+    """(known cost, cells with remaining work but no price)."""
+    known = sum(c['cost_usd'] for c in cells if c['cost_usd'] is not None)
+    unpriced = [c for c in cells if c['cost_usd'] is None and c['remaining']]
+    return known, unpriced
+
+
+def check_budget(cells, budget_usd):
+    """True if the plan fits the budget; prints the refusal otherwise."""
+    cost, unpriced = total_cost(cells)
+    if unpriced:
+        models = sorted({c['model'] for c in unpriced})
+        print(f"[Plan] [WARN] No price for {', '.join(models)}; their cost is not counted against the budget")
+    if cost > budget_usd:
+        print(f"[Plan] Refusing to start: estimated cost ${cost:.2f} exceeds the budget of ${budget_usd:.2f}")
+        return False
+    print(f"[Plan] Estimated cost ${cost:.2f} is within the budget of ${budget_usd:.2f}")
+    return True
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+def print_plan(cells, concurrency, max_jobs=1):
+    print(f"{'Cell':<45} {'Left':>7} {'In tok':>11} {'Out tok':>10} {'Cost $':>9} {'ETA':>8}")
+    print("-" * 95)
+    for c in cells:
+        cost = f"{c['cost_usd']:.2f}" if c['cost_usd'] is not None else "n/a"
+        print(f"{c['dataset'] + '/' + c['subdir'] + '/' + c['model']:<45} {c['remaining']:>7} "
+              f"{c['input_tokens']:>11,} {c['output_tokens']:>10,} {cost:>9} {format_duration(c['eta_s']):>8}")
+    print("-" * 95)
+
+    by_model = defaultdict(list)
+    for c in cells:
+        by_model[c['model']].append(c)
+    for model, model_cells in by_model.items():
+        cost, unpriced = total_cost(model_cells)
+        first = model_cells[0]
+        source = "measured" if first['latency_measured'] else "default"
+        cost_text = "n/a" if unpriced else f"${cost:.2f}" + (f" @ {first['price']}" if first['price'] else "")
+        print(f"{model:<25} {sum(c['remaining'] for c in model_cells):>7} images, "
+              f"{first['latency_s']:.1f}s/request ({source}), cost {cost_text}")
+
+    cost, unpriced = total_cost(cells)
+    work = sum(c['eta_s'] for c in cells)
+    busy = [c for c in cells if c['remaining']]
+    wall = work / max(1, min(max_jobs, len(busy))) if busy else 0
+    print(f"\nTotal: {sum(c['remaining'] for c in cells)} requests, ${cost:.2f}"
+          + (f" (+{len(unpriced)} unpriced cells)" if unpriced else "")
+          + f", ETA {format_duration(wall)} at concurrency {concurrency} x {max_jobs} job(s)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Estimate remaining requests, cost and ETA of evaluation runs")
+    parser.add_argument("--models", type=str, required=True, help="Comma-separated model short names")
+    parser.add_argument("--datasets", nargs='+', default=DEFAULT_DATASETS,
+                        help=f"Datasets to plan (default: {' '.join(DEFAULT_DATASETS)})")
+    parser.add_argument("--concurrency", type=int, default=1, help="In-flight requests per run (default: 1)")
+    parser.add_argument("--max-jobs", type=int, default=1, help="Cells evaluated at the same time (default: 1)")
+    parser.add_argument("--price-csv", type=str, default=PRICE_CSV, help="Price sheet (default: %(default)s)")
+    parser.add_argument("--sample", type=int, default=SIZE_SAMPLE,
+                        help=f"Images per directory whose size is read for the token estimate (default: {SIZE_SAMPLE})")
+    parser.add_argument("--budget-usd", type=float, default=None,
+                        help="Exit with status 1 when the estimated cost exceeds this budget")
+    parser.add_argument("--json", type=str, default=None, help="Also write the per-cell plan to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    models = [m.strip() for m in args.models.split(',') if m.strip()]
+    cells = plan_targets(matrix_targets(args.datasets, models), args.concurrency,
+                         load_prices(args.price_csv), load_invalid_ids(), args.sample)
+    print_plan(cells, args.concurrency, args.max_jobs)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(cells, f, indent=2)
+    if args.budget_usd is not None and not check_budget(cells, args.budget_usd):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -69,7 +69,7 @@
 set -e
 
 if [ $# -lt 1 ]; then
-    echo "Usage: bash run_evaluate.sh <model> [dataset|all] [api_key]"
+    echo "Usage: bash run_evaluate.sh <model[,model...]> [dataset|all] [api_key]"
     echo ""
     echo "Local models:       qwen3-30b, qwen3-8b"
     echo "SiliconFlow models: qwen3-vl-235b-sf, qwen3-vl-32b-sf, qwen2.5-vl-72b-sf,"
@@ -111,13 +111,11 @@ echo "  Evaluation: ${DATASETS[*]} x ${MODEL}"
 echo "  Time: $(date)"
 echo "=========================================="
 
-for DS in "${DATASETS[@]}"; do
-    echo ""
-    echo ">>> Dataset: ${DS} | Model: ${MODEL}"
-    echo "    $(date)"
-    python run_pipeline.py --dataset "$DS" --stage evaluate --model "$MODEL" $API_KEY_ARG
-    echo "    ${DS} done. $(date)"
-done
+# Cells run through the scheduler: finished (dataset, subdir, model) cells are
+# skipped on rerun. MODEL may also be a comma-separated list of models.
+# Extra scheduler options can be passed via SCHEDULER_ARGS, e.g.
+#   SCHEDULER_ARGS="--max-jobs 8 --provider-jobs openrouter=4 --concurrency 8" bash run_evaluate.sh gpt-4o,qwen3-30b
+python run_scheduler.py --models "$MODEL" --datasets "${DATASETS[@]}" $API_KEY_ARG $SCHEDULER_ARGS
 
 echo ""
 echo "=========================================="
@@ -11,6 +11,9 @@ GOOGLESV_ROOT = Path("/home/nas/lsr/Data/GoogleSV")
 BAIDUSV_ROOT = Path("/home/nas/lsr/BaiduSvs_history/output")
 TRIG_BENCH_ROOT = Path("/home/nas/lsr/Data/SIGNPOST-Bench")
 CODE_DIR = Path("/home/nas/lsr/Code/SIGNPOST-Bench")
+RESPONSE_CACHE_DB = TRIG_BENCH_ROOT / "cache" / "responses.sqlite"
+TOKEN_PROFILE_DB = TRIG_BENCH_ROOT / "cache" / "token_profile.sqlite"
+DERIVATIVE_STORE_DIR = TRIG_BENCH_ROOT / "cache" / "derivatives"
 
 # Services
 LOCAL_API_BASE = "http://0.0.0.0:8001/v1"
@@ -40,6 +43,8 @@ def resolve_model(model_arg):
         provider = entry.get("provider", "local")
         provider_cfg = PROVIDER_CONFIGS.get(provider, {})
         api_base = provider_cfg.get("api_base", LOCAL_API_BASE)
+        if provider_cfg.get("api_bases"):
+            api_base = ",".join(provider_cfg["api_bases"])  # Replicas, load-balanced by evaluate.py
         return entry["model"], model_arg, api_base
     # If full path given, assume local vLLM
     base = model_arg.rstrip('/').split('/')[-1].lower()
@@ -51,12 +56,52 @@ def parse_args():
     parser.add_argument("--stage", type=str, choices=['all', 'attack_gen', 'synthesize', 'evaluate'], default='all', 
                         help="Run a specific stage. 'attack_gen' includes filtering, metadata, and LLM generation. Default: all")
     parser.add_argument("--api-key", type=str, default=None, help="API Key (default: None, uses env vars for cloud providers)")
-    parser.add_argument("--api-base", type=str, default=None, help="Override API base URL")
+    parser.add_argument("--api-base", type=str, default=None,
+                        help="Override API base URL (comma-separated replicas are load-balanced during evaluation)")
     parser.add_argument("--raw-img-dir", type=str, default=None, 
                         help="Override raw image directory (default: auto-derived from dataset name)")
     parser.add_argument("--model", type=str, default=None,
                         help="Model for evaluation (short name or full path). Short names: " + 
                              ", ".join(MODEL_REGISTRY.keys()))
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="In-flight inference requests per evaluation run (default: 1 = sequential)")
+    parser.add_argument("--cache-db", type=str, default=str(RESPONSE_CACHE_DB),
+                        help=f"Shared response cache for evaluation (default: {RESPONSE_CACHE_DB})")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the evaluation response cache")
+    parser.add_argument("--token-profile", type=str, nargs='?', const=str(TOKEN_PROFILE_DB), default=None,
+                        help="Opt in to per-model max_tokens from measured p99 token counts, recorded in this "
+                             f"profile (bare flag: {TOKEN_PROFILE_DB}; default: fixed max_tokens). "
+                             "The limits used are written to every result row")
+    parser.add_argument("--calibrate", type=int, default=0,
+                        help="With --token-profile: warm up models without a profile on this many sampled "
+                             "images (default: 0)")
+    parser.add_argument("--subset", type=str, default=None,
+                        help="Evaluate a core-set only: a subset manifest path, or a name such as 'lite' for "
+                             "metadata/<dataset>_<name>.json (see build_lite_subset.py)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Stop each evaluation run once WLA / median error / TBS have converged (see evaluate.py --adaptive)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Evaluate through offline batch jobs instead of interactive calls")
+    parser.add_argument("--batch-backend", type=str, choices=["openai", "local"], default="openai",
+                        help="Batch backend passed to evaluate.py (default: openai)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Hedge slow requests with a duplicate after the model's p95 latency")
+    parser.add_argument("--budget-usd", type=float, default=None,
+                        help="Refuse to start evaluation when its planned cost exceeds this (see plan_run.py)")
+    parser.add_argument("--failover", action="store_true",
+                        help="Fail over to the registry's fallback backends (another provider) during evaluation")
+    parser.add_argument("--image-transport", type=str, choices=["base64", "file", "http"], default="base64",
+                        help="How local vLLM gets images during evaluation: base64, file:// path or media-server URL")
+    parser.add_argument("--structured", action="store_true",
+                        help="Constrain model outputs (attack JSON, coordinates) with guided decoding / JSON schema")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses and stop each one as soon as it holds coordinates")
+    parser.add_argument("--reasoning-budget", type=int, default=None,
+                        help="With --stream: max reasoning tokens of thinking models before the stream is cut")
+    parser.add_argument("--image-store", type=str, default=None,
+                        help=f"Shared image derivative store, e.g. {DERIVATIVE_STORE_DIR} (default: disabled)")
+    parser.add_argument("--image-max-side", type=int, default=0,
+                        help="Longer-side size of derivatives sent to models, 0 = full resolution")
     return parser.parse_args()
 
 # Dataset-specific image directory names
@@ -101,10 +146,78 @@ def get_paths(dataset_name, raw_img_dir_override=None):
         "images_dir": work_dir / "images",
         "results_dir": work_dir / "results",
         "attacks_file": work_dir / "attacks.jsonl",
+        "manifest": work_dir / "metadata" / f"{dataset_name}_manifest.sqlite",
         "dataset_name": dataset_name
     }
 
 
+# Attack image subdirectories evaluated after the original (filtered) images
+ATTACK_SUBDIRS = ["Adversarial", "Similar", "Random"]
+
+
+def eval_targets(paths, model_short):
+    """
+    Evaluation runs for one dataset/model, baseline first:
+    [(name, img_dir, result_file, bench_meta_path, baseline_path), ...]
+    """
+    original_result_file = paths['results_dir'] / f"results_Original_{model_short}.jsonl"
+    targets = [("Original", paths['work_dir'] / "filtered_images", original_result_file, None, None)]
+    for subdir in ATTACK_SUBDIRS:
+        targets.append((subdir, paths['images_dir'] / subdir,
+                        paths['results_dir'] / f"results_{subdir}_{model_short}.jsonl",
+                        paths['images_dir'] / "benchmark_meta.jsonl", original_result_file))
+    return targets
+
+
+def build_eval_cmd(args, img_dir, output_file, gt_tsv, model_short, api_base,
+                   bench_meta_path=None, baseline_path=None, manifest_path=None, subset_path=None):
+    """evaluate.py command line for one run, forwarding the evaluation options in `args`."""
+    cmd = [
+        sys.executable, "evaluate.py",
+        "--img-dir", str(img_dir),
+        "--metadata-file", str(gt_tsv),
+        "--output", str(output_file),
+        "--model", model_short,   # FIX: pass short name, not model_path
+        "--api-base", api_base,
+        "--concurrency", str(args.concurrency),
+    ]
+    if args.api_key:             # FIX: only pass --api-key when explicitly provided
+        cmd.extend(["--api-key", args.api_key])
+    if not args.no_cache:
+        cmd.extend(["--cache-db", args.cache_db])
+    if args.token_profile:
+        cmd.extend(["--token-profile", args.token_profile])
+        if args.calibrate:
+            cmd.extend(["--calibrate", str(args.calibrate)])
+    if args.batch:
+        cmd.extend(["--batch", "--batch-backend", args.batch_backend])
+    if args.adaptive:
+        cmd.append("--adaptive")
+    if args.hedge:
+        cmd.append("--hedge")
+    if args.failover:
+        cmd.append("--failover")
+    if args.image_transport != "base64":
+        cmd.extend(["--image-transport", args.image_transport])
+    if args.structured:
+        cmd.append("--structured")
+    if args.stream:
+        cmd.append("--stream")
+        if args.reasoning_budget:
+            cmd.extend(["--reasoning-budget", str(args.reasoning_budget)])
+    if args.image_store:
+        cmd.extend(["--image-store", args.image_store, "--image-max-side", str(args.image_max_side)])
+    if bench_meta_path:
+        cmd.extend(["--bench-meta", str(bench_meta_path)])
+    if baseline_path and Path(baseline_path).exists():
+        cmd.extend(["--baseline", str(baseline_path)])
+    if manifest_path and Path(manifest_path).exists():
+        cmd.extend(["--manifest", str(manifest_path)])
+    if subset_path:
+        cmd.extend(["--subset", str(subset_path)])
+    return cmd
+
+
 def run_step(step_name, command, cwd=CODE_DIR):
     print(f"\n{'='*10} Step: {step_name} {'='*10}")
     print(f"Running: {' '.join(str(x) for x in command)}")
@@ -162,7 +275,8 @@ def main():
             sys.executable, "convert_metadata.py",
             "--csv", str(paths['raw_meta_csv']),
             "--out-dir", str(paths['metadata_dir']),
-            "--dataset-name", paths['dataset_name']
+            "--dataset-name", paths['dataset_name'],
+            "--manifest", str(paths['manifest'])
         ])
         
         # Step 2: Generate Attacks
@@ -175,11 +289,15 @@ def main():
             "--clean-meta", str(clean_meta),
             "--original-dir", str(filtered_img_dir),
             "--output", str(paths['attacks_file']),
-            "--api-base", api_base,
+            "--api-base", api_base.split(",")[0],
             "--model", model_path,
         ]
         if args.api_key:  # FIX: only pass --api-key when explicitly provided
             attack_cmd.extend(["--api-key", args.api_key])
+        if args.image_store:
+            attack_cmd.extend(["--image-store", args.image_store, "--image-max-side", str(args.image_max_side)])
+        if args.structured:
+            attack_cmd.extend(["--structured", "guided"])  # The attack model is served by local vLLM
         run_step("Generate Attacks", attack_cmd)
 
     # ================= Stage 2: Synthesis =================
@@ -194,55 +312,46 @@ def main():
             sys.executable, "main_benchmark.py",
             "--attack-file", str(paths['attacks_file']),
             "--output-dir", str(paths['images_dir']),
-            "--comfy-server", COMFY_SERVER
+            "--comfy-server", COMFY_SERVER,
+            "--manifest", str(paths['manifest'])
         ])
 
     # ================= Stage 4: Evaluation =================
     if args.stage in ['all', 'evaluate']:
         print(f">>> Stage: Evaluation (Model: {model_short})")
+
+        subset_path = None
+        if args.subset:
+            from evaluation.subset import resolve_subset
+            subset_path = resolve_subset(args.subset, str(paths['work_dir']), paths['dataset_name'])
+            if not os.path.exists(subset_path):
+                print(f"Error: Subset manifest {subset_path} not found. Run build_lite_subset.py first.")
+                sys.exit(1)
+            print(f"Evaluating the core-set in {subset_path}")
+
+        if args.budget_usd is not None:
+            # Imported here: plan_run itself imports this module
+            from evaluate import load_invalid_ids
+            from plan_run import check_budget, matrix_targets, plan_targets, print_plan
+            targets = [dict(t, subset=subset_path)
+                       for t in matrix_targets([args.dataset], [args.model or DEFAULT_MODEL])]
+            cells = plan_targets(targets, args.concurrency, invalid_ids=load_invalid_ids())
+            print_plan(cells, args.concurrency)
+            if not check_budget(cells, args.budget_usd):
+                sys.exit(1)
         
-        # Step 1: Evaluate Original Images (baseline for TBS)
-        original_result_file = paths['results_dir'] / f"results_Original_{model_short}.jsonl"
-        
-        # Build common eval args (api-key only appended when not None)
-        def _build_eval_cmd(img_dir, output_file, bench_meta_path=None, baseline_path=None):
-            cmd = [
-                sys.executable, "evaluate.py",
-                "--img-dir", str(img_dir),
-                "--metadata-file", str(gt_tsv),
-                "--output", str(output_file),
-                "--model", model_short,   # FIX: pass short name, not model_path
-                "--api-base", api_base,
-            ]
-            if args.api_key:             # FIX: only pass --api-key when explicitly provided
-                cmd.extend(["--api-key", args.api_key])
-            if bench_meta_path:
-                cmd.extend(["--bench-meta", str(bench_meta_path)])
-            if baseline_path and Path(baseline_path).exists():
-                cmd.extend(["--baseline", str(baseline_path)])
-            return cmd
-
-        if filtered_img_dir.exists() and filtered_img_dir.is_dir():
-            print(f"\n--- Evaluating Original Images ({model_short}) ---")
-            run_step(f"Evaluate Original ({model_short})",
-                     _build_eval_cmd(filtered_img_dir, original_result_file))
-        else:
-            print(f"Warning: Filtered images dir {filtered_img_dir} not found, TBS will be unavailable.")
-
-        # Step 2: Evaluate Attack Images (with baseline for TBS)
-        subdirs = ["Adversarial", "Similar", "Random"]
-
-        for subdir in subdirs:
-            target_dir = paths['images_dir'] / subdir
-            if target_dir.exists() and target_dir.is_dir():
-                print(f"\n--- Evaluating Subdirectory: {subdir} ({model_short}) ---")
-                result_file = paths['results_dir'] / f"results_{subdir}_{model_short}.jsonl"
-                run_step(f"Evaluate {subdir} ({model_short})",
-                         _build_eval_cmd(target_dir, result_file,
-                                         bench_meta_path=bench_meta,
-                                         baseline_path=original_result_file))
-            else:
-                print(f"Skipping evaluation for {subdir} (Directory not found)")
+        for name, img_dir, result_file, bench_meta_path, baseline_path in eval_targets(paths, model_short):
+            if not (img_dir.exists() and img_dir.is_dir()):
+                if name == "Original":
+                    print(f"Warning: Filtered images dir {img_dir} not found, TBS will be unavailable.")
+                else:
+                    print(f"Skipping evaluation for {name} (Directory not found)")
+                continue
+            print(f"\n--- Evaluating {name} Images ({model_short}) ---")
+            run_step(f"Evaluate {name} ({model_short})",
+                     build_eval_cmd(args, img_dir, result_file, gt_tsv, model_short, api_base,
+                                    bench_meta_path=bench_meta_path, baseline_path=baseline_path,
+                                    manifest_path=paths['manifest'], subset_path=subset_path))
 
     print(f"\nPipeline execution for stage '{args.stage}' completed!")
 
@@ -0,0 +1,407 @@
+"""
+run_scheduler.py
+================
+Cross-dataset × cross-model evaluation scheduler (replaces the serial loop in run_evaluate.sh).
+
+Builds the job matrix (dataset, image subdir, model) and runs one evaluate.py
+process per cell, concurrently, within a global budget and a per-provider budget.
+Providers take turns when a slot frees up, so a slow API provider cannot hold
+back local models (or the other way round). Each dataset/model starts with its
+Original images, which the attack subdirs need as the TBS baseline.
+
+A cell is finished once its result file has a row for every image evaluate.py
+selects in it (ground truth, valid id, --subset member), or with --adaptive once
+its run has converged. Finished cells are appended to a state file and skipped on
+restart while their results still cover the directory; a cell that exits cleanly
+with images left (stragglers, new images) is run again, and evaluate.py's own
+resume logic continues it.
+
+Usage:
+    python run_scheduler.py --models qwen3-30b,gpt-4o,qwen3-vl-235b-sf
+    python run_scheduler.py --models gpt-4o --datasets im2gps3k yfcc4k --provider-jobs openrouter=4 --concurrency 8
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+
+from evaluate import build_work_items, load_benchmark_meta, load_ground_truth, load_invalid_ids
+from evaluation.adaptive import adaptive_path
+from evaluation.manifest import SampleManifest
+from evaluation.subset import load_subset, resolve_subset
+from plan_run import check_budget, done_filenames, plan_targets, print_plan
+from run_pipeline import (CODE_DIR, DERIVATIVE_STORE_DIR, MODEL_REGISTRY, RESPONSE_CACHE_DB,
+                          TOKEN_PROFILE_DB, TRIG_BENCH_ROOT, build_eval_cmd, eval_targets, get_paths, resolve_model)
+
+DEFAULT_DATASETS = ["yfcc4k", "im2gps3k", "googlesv", "baidusv"]
+DEFAULT_STATE_FILE = TRIG_BENCH_ROOT / "scheduler_state.jsonl"
+VALID_EXTS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Seconds between checks of running jobs / between progress lines
+POLL_INTERVAL_S = 2.0
+PROGRESS_INTERVAL_S = 60.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Schedule SIGNPOST-Bench evaluations across datasets and models")
+    parser.add_argument("--models", type=str, required=True, help="Comma-separated model short names")
+    parser.add_argument("--datasets", nargs='+', default=DEFAULT_DATASETS,
+                        help=f"Datasets to evaluate (default: {' '.join(DEFAULT_DATASETS)})")
+    parser.add_argument("--max-jobs", type=int, default=8, help="Global limit on concurrent evaluate.py runs (default: 8)")
+    parser.add_argument("--provider-jobs", type=str, default="",
+                        help="Per-provider job limits, e.g. 'local=2,openrouter=4' (default: 2 per provider)")
+    parser.add_argument("--default-provider-jobs", type=int, default=2,
+                        help="Job limit for providers not listed in --provider-jobs (default: 2)")
+    parser.add_argument("--state-file", type=str, default=str(DEFAULT_STATE_FILE),
+                        help=f"Completed-cell log used to skip finished work on restart (default: {DEFAULT_STATE_FILE})")
+    parser.add_argument("--dry-run", action="store_true", help="Print the job matrix and exit")
+    parser.add_argument("--budget-usd", type=float, default=None,
+                        help="Refuse to start when the planned cost of the pending cells exceeds this (see plan_run.py)")
+    # Forwarded to evaluate.py (same meaning as in run_pipeline.py)
+    parser.add_argument("--api-key", type=str, default=None, help="API key for every model (default: provider env vars)")
+    parser.add_argument("--concurrency", type=int, default=1, help="In-flight requests per evaluate.py run (default: 1)")
+    parser.add_argument("--cache-db", type=str, default=str(RESPONSE_CACHE_DB),
+                        help=f"Shared response cache for evaluation (default: {RESPONSE_CACHE_DB})")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the evaluation response cache")
+    parser.add_argument("--token-profile", type=str, nargs='?', const=str(TOKEN_PROFILE_DB), default=None,
+                        help="Opt in to per-model max_tokens from measured p99 token counts, recorded in this "
+                             f"profile (bare flag: {TOKEN_PROFILE_DB}; default: fixed max_tokens). "
+                             "The limits used are written to every result row")
+    parser.add_argument("--calibrate", type=int, default=0,
+                        help="With --token-profile: warm up models without a profile on this many sampled "
+                             "images (default: 0)")
+    parser.add_argument("--subset", type=str, default=None,
+                        help="Evaluate each dataset's core-set only, e.g. 'lite' for metadata/<dataset>_lite.json "
+                             "(see build_lite_subset.py); datasets without one are skipped")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Stop each cell once WLA / median error / TBS have converged (see evaluate.py --adaptive)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Evaluate through offline batch jobs instead of interactive calls")
+    parser.add_argument("--batch-backend", type=str, choices=["openai", "local"], default="openai",
+                        help="Batch backend passed to evaluate.py (default: openai)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Hedge slow requests with a duplicate after the model's p95 latency")
+    parser.add_argument("--failover", action="store_true",
+                        help="Fail over to the registry's fallback backends (another provider) during evaluation")
+    parser.add_argument("--image-transport", type=str, choices=["base64", "file", "http"], default="base64",
+                        help="How local vLLM gets images during evaluation: base64, file:// path or media-server URL")
+    parser.add_argument("--structured", action="store_true",
+                        help="Constrain answers to the coordinate format instead of retrying unparsable ones")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses and stop each one as soon as it holds coordinates")
+    parser.add_argument("--reasoning-budget", type=int, default=None,
+                        help="With --stream: max reasoning tokens of thinking models before the stream is cut")
+    parser.add_argument("--image-store", type=str, default=None,
+                        help=f"Shared image derivative store, e.g. {DERIVATIVE_STORE_DIR} (default: disabled)")
+    parser.add_argument("--image-max-side", type=int, default=0,
+                        help="Longer-side size of derivatives sent to models, 0 = full resolution")
+    return parser.parse_args()
+
+
+def parse_provider_jobs(spec):
+    limits = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        provider, _, value = part.partition('=')
+        limits[provider.strip()] = int(value)
+    return limits
+
+
+def target_images(img_dir, gt_map, bench_meta, invalid_ids, manifest=None, subset=None):
+    """Filenames evaluate.py selects in an image dir, done or not (same rules as its work list)."""
+    image_files = [f for f in os.listdir(img_dir) if f.lower().endswith(VALID_EXTS)]
+    items = build_work_items(image_files, gt_map, bench_meta, invalid_ids, already_done=set(),
+                             manifest=manifest, subset=subset, log_skips=False)
+    return {item['filename'] for item in items}
+
+
+def adaptive_converged(result_file):
+    """True if an --adaptive run of this result file stopped because its metrics converged."""
+    path = adaptive_path(str(result_file))
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("decision") == "converged"
+    except (OSError, ValueError):
+        return False
+
+
+class Job:
+    """One cell of the matrix: evaluate.py on one image dir with one model."""
+
+    def __init__(self, dataset, subdir, model, provider, cmd_args, images, depends_on=None, subset_path=None):
+        self.dataset = dataset
+        self.subdir = subdir
+        self.model = model
+        self.provider = provider
+        # (img_dir, result_file, gt_tsv, model_short, api_base, bench_meta_path, baseline_path, manifest_path)
+        self.cmd_args = cmd_args
+        self.depends_on = depends_on
+        self.subset_path = subset_path
+        # Filenames evaluate.py runs in this cell; with a subset, its members only
+        self.images = images
+        self.total_images = len(images)
+        self.status = "pending"  # pending -> running -> done / incomplete / failed
+        self.proc = None
+        self.log_f = None
+        self.started = None
+
+    @property
+    def key(self):
+        key = f"{self.dataset}/{self.subdir}/{self.model}"
+        if self.subset_path:
+            # A core-set cell is not the full cell: finishing one must not mark the other done
+            key += "@" + os.path.splitext(os.path.basename(self.subset_path))[0]
+        return key
+
+    @property
+    def result_file(self):
+        return self.cmd_args[1]
+
+    def remaining_images(self):
+        """Target images without a row in the result file."""
+        if self.status == "done":
+            return 0
+        return len(self.images - done_filenames(self.result_file))
+
+    def complete(self, adaptive=False):
+        """The result file covers the target images, or (with --adaptive) the run converged early."""
+        return self.remaining_images() == 0 or (adaptive and adaptive_converged(self.result_file))
+
+    def ready(self):
+        return self.depends_on is None or self.depends_on.status in ("done", "incomplete", "failed")
+
+    def plan_target(self):
+        """This cell in the form plan_run.plan_targets takes."""
+        return {"dataset": self.dataset, "subdir": self.subdir, "model": self.model,
+                "img_dir": str(self.cmd_args[0]), "result_file": str(self.cmd_args[1]),
+                "manifest": str(self.cmd_args[7]), "subset": self.subset_path}
+
+
+def build_jobs(args, done_keys):
+    """Expand datasets × subdirs × models into Jobs, skipping cells recorded as done that are still complete."""
+    invalid_ids = load_invalid_ids()
+    jobs = []
+    for dataset in args.datasets:
+        paths = get_paths(dataset)
+        os.makedirs(paths['results_dir'], exist_ok=True)
+        os.makedirs(paths['results_dir'] / "logs", exist_ok=True)
+        gt_tsv = paths['metadata_dir'] / f"{paths['dataset_name']}_gt.tsv"
+        subset_path = resolve_subset(args.subset, str(paths['work_dir']), paths['dataset_name'])
+        if subset_path and not os.path.exists(subset_path):
+            print(f"[Sched] {dataset}: no subset manifest {subset_path} (run build_lite_subset.py), skipping")
+            continue
+        # The target images of each cell, selected like evaluate.py does (manifest first, GT TSV otherwise)
+        manifest = SampleManifest(str(paths['manifest'])) if os.path.exists(paths['manifest']) else None
+        gt_map = load_ground_truth(str(gt_tsv)) if manifest is None else {}
+        subset = load_subset(subset_path) if subset_path else None
+        images_by_dir = {}
+        for model in args.models:
+            _, model_short, api_base = resolve_model(model)
+            provider = MODEL_REGISTRY.get(model, {}).get("provider", "local")
+            baseline_job = None
+            for name, img_dir, result_file, bench_meta_path, baseline_path in eval_targets(paths, model_short):
+                if not (img_dir.exists() and img_dir.is_dir()):
+                    continue
+                if img_dir not in images_by_dir:
+                    bench_meta = load_benchmark_meta(bench_meta_path) if manifest is None else {}
+                    images_by_dir[img_dir] = target_images(img_dir, gt_map, bench_meta, invalid_ids, manifest, subset)
+                job = Job(dataset, name, model_short, provider,
+                          (img_dir, result_file, gt_tsv, model_short, api_base, bench_meta_path, baseline_path,
+                           paths['manifest']),
+                          images_by_dir[img_dir],
+                          depends_on=baseline_job if name != "Original" else None, subset_path=subset_path)
+                if name == "Original":
+                    baseline_job = job
+                # New images or stragglers reopen a recorded cell
+                if job.key in done_keys and job.complete(args.adaptive):
+                    job.status = "done"
+                jobs.append(job)
+        if manifest is not None:
+            manifest.close()
+    return jobs
+
+
+def load_done_keys(state_file):
+    done = set()
+    if os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['key'])
+                except: pass
+    return done
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--"
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class Scheduler:
+    """Launch jobs within the global/per-provider budgets, rotating between providers."""
+
+    def __init__(self, jobs, args):
+        self.jobs = jobs
+        self.args = args
+        self.max_jobs = args.max_jobs
+        self.provider_limits = parse_provider_jobs(args.provider_jobs)
+        self.running = []
+        # Providers take turns; each provider keeps its jobs in matrix order
+        self.queues = {}
+        for job in jobs:
+            if job.status == "pending":
+                self.queues.setdefault(job.provider, deque()).append(job)
+        self.rotation = deque(self.queues)
+        self.start_time = time.time()
+        self.start_remaining = sum(job.remaining_images() for job in jobs)
+
+    def provider_limit(self, provider):
+        return self.provider_limits.get(provider, self.args.default_provider_jobs)
+
+    def running_for(self, provider):
+        return sum(1 for job in self.running if job.provider == provider)
+
+    def next_job(self):
+        """Next ready job from the first provider in rotation with a free slot; that provider moves to the back."""
+        for _ in range(len(self.rotation)):
+            provider = self.rotation[0]
+            self.rotation.rotate(-1)
+            if self.running_for(provider) >= self.provider_limit(provider):
+                continue
+            queue = self.queues[provider]
+            for job in queue:
+                if job.ready():
+                    queue.remove(job)
+                    return job
+        return None
+
+    def launch(self, job):
+        if job.depends_on is not None and job.depends_on.status == "failed":
+            # Evaluate anyway; TBS is simply unavailable without the baseline
+            print(f"[Sched] {job.key}: baseline failed, running without TBS")
+        img_dir, result_file, gt_tsv, model_short, api_base, bench_meta_path, baseline_path, manifest = job.cmd_args
+        cmd = build_eval_cmd(self.args, img_dir, result_file, gt_tsv, model_short, api_base,
+                             bench_meta_path=bench_meta_path, baseline_path=baseline_path, manifest_path=manifest,
+                             subset_path=job.subset_path)
+        log_path = result_file.parent / "logs" / f"{result_file.stem}.log"
+        job.log_f = open(log_path, 'a', encoding='utf-8')
+        job.proc = subprocess.Popen(cmd, cwd=CODE_DIR, stdout=job.log_f, stderr=subprocess.STDOUT)
+        job.status = "running"
+        job.started = time.time()
+        self.running.append(job)
+        print(f"[Sched] Started {job.key} ({job.provider}, {job.remaining_images()} images left) -> {log_path}")
+
+    def reap(self):
+        for job in list(self.running):
+            code = job.proc.poll()
+            if code is None:
+                continue
+            self.running.remove(job)
+            job.log_f.close()
+            elapsed = time.time() - job.started
+            if code == 0 and job.complete(self.args.adaptive):
+                job.status = "done"
+                with open(self.args.state_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"key": job.key, "provider": job.provider,
+                                        "images": job.total_images, "seconds": round(elapsed, 1),
+                                        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")}) + "\n")
+                print(f"[Sched] Finished {job.key} in {format_eta(elapsed)}")
+            elif code == 0:
+                # Stragglers or images added meanwhile; not recorded, so the next run picks it up again
+                job.status = "incomplete"
+                print(f"[Sched] [WARN] {job.key} exited with {job.remaining_images()} images left, "
+                      f"it runs again on the next scheduler run")
+            else:
+                job.status = "failed"
+                print(f"[Sched] [WARN] {job.key} exited with code {code}, see {job.log_f.name}")
+
+    def print_progress(self):
+        counts = {}
+        for job in self.jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        remaining = sum(job.remaining_images() for job in self.jobs if job.status not in ("failed", "incomplete"))
+        processed = self.start_remaining - remaining
+        elapsed = time.time() - self.start_time
+        eta = remaining / (processed / elapsed) if processed > 0 else None
+        per_provider = ", ".join(f"{p}={self.running_for(p)}" for p in self.queues)
+        print(f"[Sched] Cells: {counts.get('done', 0)}/{len(self.jobs)} done, {counts.get('running', 0)} running, "
+              f"{counts.get('incomplete', 0)} incomplete, {counts.get('failed', 0)} failed "
+              f"| Images left: {remaining} | ETA {format_eta(eta)} "
+              f"| Running per provider: {per_provider}")
+
+    def run(self):
+        last_progress = 0.0
+        try:
+            while self.running or any(self.queues.values()):
+                self.reap()
+                while len(self.running) < self.max_jobs:
+                    job = self.next_job()
+                    if job is None:
+                        break
+                    self.launch(job)
+                if time.time() - last_progress >= PROGRESS_INTERVAL_S:
+                    self.print_progress()
+                    last_progress = time.time()
+                time.sleep(POLL_INTERVAL_S)
+        except KeyboardInterrupt:
+            print("\n[Sched] Interrupted, stopping running jobs (they resume on the next run)...")
+            for job in self.running:
+                job.proc.terminate()
+            for job in self.running:
+                job.proc.wait()
+                job.log_f.close()
+            raise
+        self.print_progress()
+
+
+def main():
+    args = parse_args()
+    args.models = [m.strip() for m in args.models.split(',') if m.strip()]
+    os.makedirs(os.path.dirname(os.path.abspath(args.state_file)), exist_ok=True)
+
+    done_keys = load_done_keys(args.state_file)
+    jobs = build_jobs(args, done_keys)
+    pending = [job for job in jobs if job.status == "pending"]
+
+    print("=" * 50)
+    print(f"  Evaluation matrix: {len(args.datasets)} dataset(s) x {len(args.models)} model(s)")
+    print(f"  Cells: {len(jobs)} total, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+    print("=" * 50)
+    for job in pending:
+        print(f"  {job.key:<60} {job.provider:<12} {job.remaining_images()} images left")
+
+    if args.budget_usd is not None and pending:
+        cells = plan_targets([job.plan_target() for job in pending], args.concurrency,
+                             invalid_ids=load_invalid_ids())
+        print_plan(cells, args.concurrency, args.max_jobs)
+        if not check_budget(cells, args.budget_usd):
+            sys.exit(1)
+
+    if args.dry_run or not pending:
+        return
+
+    scheduler = Scheduler(jobs, args)
+    scheduler.run()
+
+    failed = [job.key for job in jobs if job.status == "failed"]
+    incomplete = [job.key for job in jobs if job.status == "incomplete"]
+    if failed:
+        print(f"\n[Sched] {len(failed)} cell(s) failed and will be retried on the next run: {', '.join(failed)}")
+    if incomplete:
+        print(f"\n[Sched] {len(incomplete)} cell(s) finished with images left and will be resumed on the next run: "
+              f"{', '.join(incomplete)}")
+    if not failed and not incomplete:
+        print("\n[Sched] All evaluations complete!")
+
+
+if __name__ == "__main__":
+    main()
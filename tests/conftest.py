@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts run from the repository root; make `evaluation` importable the same way
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
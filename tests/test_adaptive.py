@@ -0,0 +1,102 @@
+import json
+import random
+
+import pytest
+
+from evaluation.adaptive import AdaptiveStop, AdaptiveTargets, adaptive_path, stratified_order, stratum_of
+
+
+@pytest.fixture(scope="module")
+def items():
+    rng = random.Random(0)
+    return [{"filename": f"{i}.jpg", "gt": (rng.uniform(-60, 70), rng.uniform(-180, 180)), "meta_info": None}
+            for i in range(3000)]
+
+
+def _row(rng):
+    error = rng.lognormvariate(6, 1.5)
+    return {"error_km": error, "wla_score": sum(error < t for t in (1, 25, 200, 750, 2500)) / 5,
+            "tbs": rng.gauss(300, 800)}
+
+
+def test_order_is_a_seeded_permutation(items):
+    order = stratified_order(items, seed=1)
+    assert sorted(it["filename"] for it in order) == sorted(it["filename"] for it in items)
+    assert stratified_order(list(reversed(items)), seed=1) == order
+    assert stratified_order(items, seed=2) != order
+
+
+def test_attacked_copies_follow_the_clean_order(items):
+    order = stratified_order(items, seed=1)
+    attacked = [{**it, "filename": it["filename"].replace(".jpg", "_adv.png")} for it in items]
+    assert [it["filename"][:-8] for it in stratified_order(attacked, seed=1)] == [it["filename"][:-4] for it in order]
+    # Attack rows carry their base image in meta_info instead
+    by_source = [{**it, "filename": f"x{i}.png", "meta_info": {"original_source": it["filename"]}}
+                 for i, it in enumerate(items)]
+    assert [it["meta_info"]["original_source"] for it in stratified_order(by_source, seed=1)] == \
+        [it["filename"] for it in order]
+
+
+def test_every_prefix_is_proportional(items):
+    order = stratified_order(items, seed=1)
+    stratum = stratum_of(*items[0]["gt"])
+    share = lambda seq: sum(stratum_of(*it["gt"]) == stratum for it in seq) / len(seq)
+    for size in (300, 600, 1500):
+        assert abs(share(order[:size]) - share(items)) < 0.01
+
+
+def test_stops_once_converged():
+    rng = random.Random(0)
+    stop = AdaptiveStop(AdaptiveTargets(wla=0.03, median_rel=0.15, tbs_km=200), min_rows=100)
+    for _ in range(5000):
+        stop.add(_row(rng))
+        if stop.check():
+            break
+    assert stop.stopped_at is not None and 100 <= stop.stopped_at < 5000
+    assert stop.stopped_at % stop.check_every == 0
+    assert all(m["met"] is not False for m in stop.precision().values())
+
+
+def test_never_stops_before_min_rows():
+    stop = AdaptiveStop(AdaptiveTargets(wla=1.0, median_rel=10.0, tbs_km=1e9), min_rows=200, check_every=1)
+    for _ in range(199):
+        stop.add({"error_km": 10.0, "wla_score": 0.6, "tbs": 0.0})
+        assert not stop.check()
+    stop.add({"error_km": 10.0, "wla_score": 0.6, "tbs": 0.0})
+    assert stop.check()
+
+
+def test_missing_tbs_does_not_block():
+    stop = AdaptiveStop(AdaptiveTargets(wla=1.0, median_rel=10.0, tbs_km=1.0), min_rows=10)
+    for i in range(10):
+        stop.add({"error_km": 100.0 + i, "wla_score": 0.4, "tbs": None})
+    assert stop.precision()["tbs_km"]["met"] is None
+    assert stop.check(force=True)
+
+
+def test_median_interval_brackets_the_median():
+    stop = AdaptiveStop()
+    for error in range(1, 102):
+        stop.add({"error_km": float(error), "wla_score": 0.0})
+    median, lo, hi = stop.median_interval()
+    assert median == 51.0 and lo < median < hi
+    assert AdaptiveStop().median_interval() is None
+
+
+def test_unparsed_rows_count_but_have_no_error():
+    stop = AdaptiveStop()
+    stop.add({"error_km": None, "wla_score": 0.0})
+    assert stop.rows == 1 and stop.wla.n == 0 and stop.describe() == "no parsed rows yet"
+
+
+def test_decision_sidecar(tmp_path):
+    stop = AdaptiveStop(min_rows=1)
+    for error in (10.0, 20.0, 30.0):
+        stop.add({"error_km": error, "wla_score": 0.6, "tbs": 5.0})
+    path = adaptive_path(str(tmp_path / "results_Original_m.jsonl"))
+    assert path.endswith(".jsonl.adaptive.json")
+    stop.save(path, total=600)
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["decision"] == "exhausted" and saved["rows"] == 3 and saved["total_images"] == 600
+    assert set(saved["precision"]) == {"wla", "median_error_km", "tbs_km"}
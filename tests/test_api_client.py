@@ -0,0 +1,295 @@
+import base64
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from evaluation.api_client import GeoLocalizationClient
+from evaluation.hedging import HedgePolicy
+from evaluation.media_server import MediaServer
+
+ANSWER = ["(48.8584", ", 2.2945)"]
+
+
+class _ChatServer(ThreadingHTTPServer):
+    """OpenAI-style chat completions endpoint that records the request bodies."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ChatHandler)
+        self.requests = []
+        self.pieces = list(ANSWER)     # streamed content deltas
+        self.finish_reason = "stop"
+        self.reject = None             # body -> (status, error message) to refuse a request, or None
+        self.delays = []               # seconds to stall each request before answering, in arrival order
+        self.chunk_delay = 0.0         # seconds between streamed chunks
+        self.chunks_sent = []          # chunks written per streamed request before it ended or was closed
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class _ChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        if self.server.delays:
+            time.sleep(self.server.delays.pop(0))
+        refused = self.server.reject(body) if self.server.reject else None
+        if refused:
+            data = json.dumps({"error": {"message": refused[1]}}).encode()
+            self.send_response(refused[0])
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        pieces = self.server.pieces
+        usage = {"prompt_tokens": 1100, "completion_tokens": len(pieces), "total_tokens": 1100 + len(pieces)}
+        if not body.get("stream"):
+            data = json.dumps({"choices": [{"message": {"content": "".join(pieces)},
+                                            "finish_reason": self.server.finish_reason}],
+                               "usage": usage}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        options = body.get("stream_options") or {}
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunks = []
+        for i, piece in enumerate(pieces):
+            chunk = {"choices": [{"delta": {"content": piece}, "finish_reason": None}]}
+            if options.get("continuous_usage_stats"):
+                chunk["usage"] = {"prompt_tokens": 1100, "completion_tokens": i + 1, "total_tokens": 1101 + i}
+            chunks.append(chunk)
+        chunks.append({"choices": [{"delta": {}, "finish_reason": self.server.finish_reason}]})
+        if options.get("include_usage"):
+            chunks.append({"choices": [], "usage": usage})
+        sent = 0
+        try:
+            for chunk in chunks:
+                self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+                self.wfile.flush()
+                sent += 1
+                if self.server.chunk_delay:
+                    time.sleep(self.server.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # the client closed the stream early
+        finally:
+            self.server.chunks_sent.append(sent)
+
+
+@pytest.fixture
+def server():
+    server = _ChatServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="module")
+def image_b64():
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), (90, 140, 200)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def _client(server, provider, **kwargs):
+    return GeoLocalizationClient("m", server.api_base, "k", provider=provider, max_retries=0, timeout=10, **kwargs)
+
+
+@pytest.mark.parametrize("provider, continuous", [("local", True), ("siliconflow", False)])
+def test_stream_requests_usage(server, image_b64, provider, continuous):
+    text, info = _client(server, provider, stream=True).predict_location_detailed(image_b64)
+    assert text == "(48.8584, 2.2945)" and info["status"] == "ok"
+    options = server.requests[-1]["stream_options"]
+    assert options["include_usage"] is True
+    assert options.get("continuous_usage_stats", False) is continuous
+    assert (info["prompt_tokens"], info["completion_tokens"]) == (1100, 2)
+
+
+def test_stream_reads_past_chatter_to_the_usage_chunk(server, image_b64):
+    server.pieces = ANSWER + [" Because of", " the Eiffel Tower."]
+    text, info = _client(server, "siliconflow", stream=True).predict_location_detailed(image_b64)
+    assert text == "(48.8584, 2.2945)"
+    assert (info["prompt_tokens"], info["completion_tokens"]) == (1100, 4)
+
+
+def test_stream_closes_early_with_continuous_usage(server, image_b64):
+    server.pieces = ANSWER + [" Because of", " the Eiffel Tower."]
+    text, info = _client(server, "local", stream=True).predict_location_detailed(image_b64)
+    assert text == "(48.8584, 2.2945)"
+    # Running usage up to the answer, not the whole stream's
+    assert (info["prompt_tokens"], info["completion_tokens"]) == (1100, 2)
+
+
+def test_non_streamed_request_has_no_stream_options(server, image_b64):
+    text, info = _client(server, "local").predict_location_detailed(image_b64)
+    assert text == "(48.8584, 2.2945)" and info["completion_tokens"] == 2
+    assert "stream" not in server.requests[-1] and "stream_options" not in server.requests[-1]
+
+
+def _image_content(request):
+    return next(part for part in request["messages"][-1]["content"] if part["type"] == "image_url")
+
+
+def test_image_outside_the_media_roots_is_sent_inline(server, image_b64, tmp_path):
+    served, other = tmp_path / "served", tmp_path / "other"
+    served.mkdir()
+    other.mkdir()
+    for folder in (served, other):
+        (folder / "1.png").write_bytes(base64.b64decode(image_b64))
+    media = MediaServer([str(served)], host="127.0.0.1", public_host="127.0.0.1").start()
+    try:
+        client = _client(server, "local", image_transport="http", media_server=media)
+        text, info = client.predict_location_detailed(image_b64, str(served / "1.png"))
+        assert info["status"] == "ok"
+        assert _image_content(server.requests[-1])["image_url"]["url"] == media.url_for(str(served / "1.png"))
+        text, info = client.predict_location_detailed(image_b64, str(other / "1.png"))
+        assert text == "(48.8584, 2.2945)" and info["status"] == "ok"
+        assert _image_content(server.requests[-1])["image_url"]["url"].startswith("data:image/")
+        # One stray image does not switch the client off the http transport
+        assert client.image_transport == "http"
+    finally:
+        media.close()
+
+
+def _refuse_guided(message):
+    return lambda body: (400, message) if "guided_regex" in body else None
+
+
+def test_rejected_constraint_is_dropped_for_the_call_only(server, image_b64):
+    server.reject = _refuse_guided("unknown field: guided_regex")
+    client = _client(server, "local", structured="guided")
+    text, info = client.predict_location_detailed(image_b64)
+    assert text == "(48.8584, 2.2945)" and info["status"] == "ok"
+    # The free-text resend is an extra request, not one of the (zero) retries
+    assert info["attempts"] == 2 and info["retry_reasons"] == ["structured"] and info["structured"] is None
+    assert "guided_regex" not in server.requests[-1]
+    assert client.structured == "guided"
+
+
+def test_repeated_constraint_rejections_disable_it(server, image_b64):
+    server.reject = _refuse_guided("unknown field: guided_regex")
+    client = _client(server, "local", structured="guided")
+    for _ in range(client.REJECTIONS_TO_DISABLE):
+        client.predict_location_detailed(image_b64)
+    assert client.structured is None
+    text, info = client.predict_location_detailed(image_b64)
+    assert info["attempts"] == 1 and info["structured"] is None
+
+
+def test_rejections_about_something_else_keep_the_constraint(server, image_b64):
+    server.reject = _refuse_guided("image could not be decoded")
+    client = _client(server, "local", structured="guided")
+    for _ in range(client.REJECTIONS_TO_DISABLE + 1):
+        assert client.predict_location_detailed(image_b64)[1]["status"] == "ok"
+    assert client.structured == "guided"
+
+
+def test_stream_error_body_is_readable(server, image_b64):
+    server.reject = _refuse_guided("unknown field: guided_regex")
+    client = _client(server, "local", structured="guided", stream=True)
+    for _ in range(client.REJECTIONS_TO_DISABLE):
+        assert client.predict_location_detailed(image_b64)[1]["status"] == "ok"
+    assert client.structured is None
+
+
+def _refuse_paths(status, message):
+    return lambda body: (status, message) if _image_content(body)["image_url"]["url"].startswith("file:") else None
+
+
+def test_missing_image_file_goes_inline_for_that_request(server, image_b64, tmp_path):
+    server.reject = _refuse_paths(404, "file not found")
+    client = _client(server, "local", image_transport="file")
+    for _ in range(client.REJECTIONS_TO_DISABLE + 1):
+        text, info = client.predict_location_detailed(image_b64, str(tmp_path / "gone.png"))
+        assert text == "(48.8584, 2.2945)"
+        assert info["attempts"] == 2 and info["retry_reasons"] == ["transport"]
+        assert _image_content(server.requests[-1])["image_url"]["url"].startswith("data:image/")
+    # Per-image 404s never switch the transport off
+    assert client.image_transport == "file"
+
+
+@pytest.mark.parametrize("status, message", [
+    (403, "forbidden"),
+    (400, "Cannot load local files without `--allowed-local-media-path`"),
+])
+def test_server_refusing_local_media_switches_to_base64(server, image_b64, tmp_path, status, message):
+    server.reject = _refuse_paths(status, message)
+    client = _client(server, "local", image_transport="file")
+    for i in range(client.REJECTIONS_TO_DISABLE):
+        assert client.image_transport == "file"
+        assert client.predict_location_detailed(image_b64, str(tmp_path / f"{i}.png"))[1]["status"] == "ok"
+    assert client.image_transport == "base64"
+    text, info = client.predict_location_detailed(image_b64, str(tmp_path / "next.png"))
+    assert info["attempts"] == 1
+
+
+@pytest.mark.parametrize("defer", [True, False])
+def test_empty_response_is_deferred_not_slept_on(server, image_b64, monkeypatch, defer):
+    sleeps = []
+    monkeypatch.setattr("evaluation.api_client.time.sleep", sleeps.append)
+    server.pieces = [""]
+    client = GeoLocalizationClient("m", server.api_base, "k", provider="local", max_retries=2, timeout=10,
+                                   defer_retries=defer)
+    text, info = client.predict_location_detailed(image_b64)
+    assert text is None
+    if defer:
+        assert info["status"] == "deferred" and info["attempts"] == 1 and info["retry_reasons"] == ["empty"]
+        assert sleeps == []
+    else:
+        assert info["status"] == "failed" and info["attempts"] == 3 and sleeps == [1, 1]
+
+
+def _hedged_client(server, **kwargs):
+    hedge = HedgePolicy(min_samples=1, min_delay_s=0.2)
+    hedge.observe(0.2)
+    return _client(server, "local", hedge=hedge, **kwargs)
+
+
+def test_hedge_winner_frees_the_losers_slot(server, image_b64):
+    server.delays = [2.0]                         # the first request stalls, its duplicate doesn't
+    client = _hedged_client(server)
+    start = time.monotonic()
+    text, info = client.predict_location_detailed(image_b64)
+    assert text == "(48.8584, 2.2945)" and info["hedged"]
+    assert time.monotonic() - start < 1.5
+    # The stalled request still waits on the server, but no longer holds a limiter slot
+    assert client.rate_limiter.in_flight == 0
+    assert client.hedge.snapshot()["hedge_wins"] == 1
+
+
+def test_hedge_loser_stream_is_closed(server, image_b64):
+    server.pieces = ANSWER[:1] + ["."] * 40 + ANSWER[1:]
+    server.chunk_delay = 0.05                     # each stream takes about 2 s
+    server.delays = [0.0, 1.5]                    # and the duplicate starts well behind
+    client = _hedged_client(server, stream=True)
+    text, info = client.predict_location_detailed(image_b64)
+    assert info["hedged"] and info["status"] == "ok"
+    assert client.rate_limiter.in_flight == 0
+    deadline = time.monotonic() + 5
+    while len(server.chunks_sent) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # The winner was read to its answer; the duplicate was closed a few chunks in
+    winner, loser = sorted(server.chunks_sent, reverse=True)
+    assert winner >= len(server.pieces) and loser < len(server.pieces) // 2
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from evaluation import batch_client
+from evaluation.batch_client import BatchRunner, LocalFileBatchBackend, make_batch_line, parse_batch_output_line
+
+
+def _responder(body):
+    if body.get("fail"):
+        return 500, {"error": "boom"}
+    return 200, {"choices": [{"message": {"content": f"echo {body['n']}"}}]}
+
+
+@pytest.fixture
+def runner(tmp_path):
+    backend = LocalFileBatchBackend(str(tmp_path / "jobs"), _responder)
+    return BatchRunner(backend, str(tmp_path / "state"), poll_interval=0)
+
+
+def _lines(n, fail=()):
+    return [make_batch_line(f"img-{i}", {"n": i, "fail": i in fail}) for i in range(n)]
+
+
+def test_parse_output_line():
+    ok = {"custom_id": "a", "response": {"status_code": 200, "body": {"x": 1}}, "error": None}
+    failed = {"custom_id": "b", "response": {"status_code": 500, "body": {}}, "error": {"code": "500"}}
+    assert parse_batch_output_line(json.dumps(ok)) == ("a", {"x": 1})
+    assert parse_batch_output_line(json.dumps(failed)) == ("b", None)
+    assert parse_batch_output_line("not json") == (None, None)
+
+
+def test_round_trip_through_the_local_backend(runner):
+    assert runner.prepare(_lines(5, fail={3})) == 5
+    assert runner.has_open_jobs
+    results = dict(runner.wait_and_collect())
+    assert results["img-0"]["choices"][0]["message"]["content"] == "echo 0"
+    assert results["img-3"] is None and len(results) == 5
+    assert not runner.has_open_jobs
+    assert runner.state["jobs"][0]["status"] == "completed"
+
+
+def test_requests_are_split_across_files(runner, monkeypatch):
+    monkeypatch.setattr(batch_client, "MAX_REQUESTS_PER_FILE", 2)
+    runner.prepare(_lines(5))
+    assert [job["requests"] for job in runner.state["jobs"]] == [2, 2, 1]
+    assert sorted(dict(runner.wait_and_collect())) == [f"img-{i}" for i in range(5)]
+
+
+def test_resumed_runner_polls_instead_of_resubmitting(runner):
+    runner.prepare(_lines(3))
+    job_id = runner.state["jobs"][0]["id"]
+    resumed = BatchRunner(runner.backend, runner.state_dir, poll_interval=0)
+    assert resumed.state["jobs"][0]["id"] == job_id
+    assert len(dict(resumed.wait_and_collect())) == 3
+    # Merged jobs are not collected twice
+    again = BatchRunner(runner.backend, runner.state_dir, poll_interval=0)
+    assert list(again.wait_and_collect()) == []
+    again.reset()
+    assert again.state["jobs"] == [] and not again.has_open_jobs
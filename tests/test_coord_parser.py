@@ -0,0 +1,96 @@
+import json
+import os
+import random
+import re
+
+import pytest
+
+from conftest import DATA_DIR
+from evaluation.coord_parser import (bench_corpus, build_corpus, extract_coordinates, has_complete_coordinates,
+                                     parse_coordinates, reparse_row)
+
+CORPUS = os.path.join(DATA_DIR, "coord_corpus.jsonl")
+
+
+def _cases():
+    with open(CORPUS, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _reference(text):
+    """The per-form parser the single-pass scanner replaced, with range-checked labels (no JSON form)."""
+    match = re.search(r"[\(\[]\s*(-?\d+\.?\d*)\s*,\s*(-?\d+\.?\d*)\s*[\)\]]", text)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    candidates = []
+    lat = re.search(r"[Ll]at(?:itude)?[:\s]+(-?\d+\.?\d*)", text)
+    lon = re.search(r"[Ll]on(?:gitude)?[:\s]+(-?\d+\.?\d*)", text)
+    if lat and lon:
+        candidates.append((float(lat.group(1)), float(lon.group(1))))
+    nums = re.findall(r"-?\d{1,3}\.\d{2,}", text)
+    if len(nums) >= 2:
+        candidates.append((float(nums[0]), float(nums[1])))
+    for lat_v, lon_v in candidates:
+        if -90 <= lat_v <= 90 and -180 <= lon_v <= 180:
+            return lat_v, lon_v
+    return None, None
+
+
+@pytest.mark.parametrize("case", _cases(), ids=lambda c: c["text"][:40])
+def test_corpus_case(case):
+    lat, lon, form = extract_coordinates(case["text"])
+    assert (lat, lon) == (case["lat"], case["lon"])
+    if "form" in case:
+        assert form == case["form"]
+
+
+def test_corpus_bench_has_no_mismatches():
+    report = bench_corpus(CORPUS, repeat=1, show=0)
+    assert report["cases"] == len(_cases())
+    assert report["mismatches"] == 0
+
+
+def test_matches_reference_on_random_text():
+    tokens = ["Lat", "lat", "LAT", "Latitude", "latitude", "LATITUDE", "Lon", "lon", "LON", "Longitude",
+              "LONGITUDE", "lng", "flat", ":", " ", "\n", ",", "(", ")", "[", "]", "-", ".", "x", "°",
+              "48.8584", "2.2945", "-33.86", "151.2", "200.55", "-95.5", "12", "7.", "1234.567", "90.00"]
+    rng = random.Random(0)
+    for _ in range(20000):
+        text = "".join(rng.choice(tokens) for _ in range(rng.randint(1, 12)))
+        assert parse_coordinates(text) == _reference(text), text
+
+
+def test_json_object_is_matched_flat():
+    text = "<think>candidates {x} and {\"y\": 1}</think> " + '{"latitude": 10.5, "longitude": -20.25}'
+    assert extract_coordinates(text) == (10.5, -20.25, "json")
+
+
+def test_has_complete_coordinates():
+    assert has_complete_coordinates("</think> (48.85, 2.29)")
+    assert has_complete_coordinates('{"latitude": 1.5, "longitude": 2.5}')
+    assert not has_complete_coordinates("(48.85, 2.2")
+    assert not has_complete_coordinates("Latitude: 48.85, Longitude: 2.29")
+
+
+def test_reparse_row_recomputes_error():
+    row = {"prediction_text": "(48.8584, 2.2945)", "gt_lat": 48.8584, "gt_lon": 2.2945,
+           "pred_lat": None, "pred_lon": None, "error_km": None, "wla_score": 0.0}
+    out = reparse_row(row)
+    assert (out["pred_lat"], out["pred_lon"]) == (48.8584, 2.2945)
+    assert out["error_km"] == pytest.approx(0.0)
+    assert out["wla_score"] == 1.0
+    assert row["pred_lat"] is None
+
+
+def test_build_corpus_keeps_distinct_texts(tmp_path):
+    results = tmp_path / "results_Original_m.jsonl"
+    rows = [{"prediction_text": "(1.25, 2.25)", "pred_lat": 1.25, "pred_lon": 2.25},
+            {"prediction_text": "(1.25, 2.25)", "pred_lat": 1.25, "pred_lon": 2.25},
+            {"prediction_text": None},
+            {"prediction_text": "no idea", "pred_lat": None, "pred_lon": None}]
+    results.write_text("\n".join(json.dumps(r) for r in rows) + "\nnot json\n", encoding="utf-8")
+    out = tmp_path / "corpus.jsonl"
+    assert build_corpus([str(results)], str(out)) == 2
+    report = bench_corpus(str(out), repeat=1, show=0)
+    assert report["mismatches"] == 0
+    assert report["forms"]["tuple"] == 1 and report["forms"]["none"] == 1
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from evaluation.endpoint_pool import MAX_FAILURES, STICKY_SLACK, EndpointPool, split_api_bases
+
+BASES = ["http://a/v1", "http://b/v1", "http://c/v1"]
+
+
+@pytest.fixture
+def pool():
+    return EndpointPool(BASES, probe_interval=0)
+
+
+@pytest.fixture
+def images():
+    return [i.to_bytes(2, "big") * 32 for i in range(300)]
+
+
+def test_split_api_bases():
+    assert split_api_bases("http://a/v1/, http://b/v1,") == ["http://a/v1", "http://b/v1"]
+    assert split_api_bases(["http://a/v1"]) == ["http://a/v1"]
+    with pytest.raises(ValueError):
+        EndpointPool([], probe_interval=0)
+
+
+def test_routing_is_sticky_and_spread(pool, images):
+    first = []
+    for img in images:
+        first.append(pool.route(img))
+        pool.release(first[-1])
+    for img, base in zip(images, first):
+        assert pool.route(img) == base
+        pool.release(base)
+    counts = {b: first.count(b) for b in pool.api_bases}
+    assert min(counts.values()) > 50, counts
+
+
+def test_saturated_sticky_replica_spills_over(pool, images):
+    target = pool.route(images[0])
+    pool.release(target)
+    spilled = {pool.route(images[0]) for _ in range(STICKY_SLACK * 4)}
+    assert len(spilled) > 1 and target in spilled
+
+
+def test_failing_replica_leaves_rotation():
+    pool = EndpointPool(BASES[:2], probe_interval=0)
+    for _ in range(MAX_FAILURES):
+        pool.release("http://a/v1", failed=True)
+    assert {pool.route(bytes([i])) for i in range(20)} == {"http://b/v1"}
+    # A success in between resets the count
+    pool = EndpointPool(BASES[:2], probe_interval=0)
+    for _ in range(MAX_FAILURES - 1):
+        pool.release("http://a/v1", failed=True)
+    pool.release("http://a/v1")
+    pool.release("http://a/v1", failed=True)
+    assert all(e["healthy"] for e in pool.snapshot())
+
+
+def test_all_down_still_routes():
+    pool = EndpointPool(BASES[:2], probe_interval=0)
+    for base in BASES[:2]:
+        for _ in range(MAX_FAILURES):
+            pool.release(base, failed=True)
+    assert pool.route(b"x") in BASES[:2]
+
+
+def test_health_probe_brings_replica_back(pool, monkeypatch):
+    up = {"http://a/v1": False, "http://b/v1": True, "http://c/v1": True}
+
+    def get(url, headers=None, timeout=None):
+        base = url.rsplit("/models", 1)[0]
+        if base == "http://c/v1":
+            raise requests.ConnectionError("refused")
+        return SimpleNamespace(ok=up[base])
+
+    monkeypatch.setattr(pool._session, "get", get)
+    assert pool.check_all() == 1
+    up["http://a/v1"] = True
+    assert pool.check("http://a/v1")
+    assert [e["healthy"] for e in pool.snapshot()] == [True, True, False]
@@ -0,0 +1,153 @@
+import time
+
+import pytest
+
+from evaluation.api_client import MODEL_REGISTRY, build_client
+from evaluation.failover import BREAKER_THRESHOLD, CircuitBreaker, FailoverClient, with_fallbacks
+from evaluation.hedging import HedgePolicy
+
+
+class _Backend:
+    """Stand-in for a GeoLocalizationClient: answers, or fails every image with `status`."""
+
+    def __init__(self, name, up=True, status="failed", reasons=()):
+        self.backend, self.up, self.status, self.reasons = name, up, status, list(reasons)
+        self.calls = 0
+        self.max_tokens = 256
+
+    def predict_location_detailed(self, b64, image_path=None):
+        self.calls += 1
+        if self.up:
+            return "(1.0, 2.0)", {"status": "ok", "attempts": 1, "retry_reasons": [], "backend": self.backend}
+        return None, {"status": self.status, "attempts": 2, "retry_reasons": list(self.reasons),
+                      "backend": self.backend}
+
+    def health_check(self):
+        return self.up
+
+
+@pytest.fixture
+def chain_factory():
+    chains = []
+
+    def make(clients, **kwargs):
+        chain = FailoverClient(clients, **kwargs)
+        chains.append(chain)
+        return chain
+
+    yield make
+    for chain in chains:
+        chain.close()
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_breaker_opens_after_threshold_and_trial_closes_it():
+    breaker = CircuitBreaker(threshold=2, cooldown_s=0)
+    assert breaker.record(False) is None
+    assert breaker.record(False) == CircuitBreaker.OPEN and not breaker.allow()
+    assert breaker.probe_due()
+    breaker.half_open()
+    assert breaker.allow() and not breaker.allow()   # one trial at a time
+    assert breaker.record(True) == CircuitBreaker.CLOSED
+    assert breaker.snapshot() == {"state": "closed", "failures": 0, "trips": 1}
+
+
+def test_failed_half_open_trial_reopens():
+    breaker = CircuitBreaker(threshold=5, cooldown_s=0)
+    for _ in range(5):
+        breaker.record(False)
+    breaker.half_open()
+    assert breaker.allow()
+    assert breaker.record(False) == CircuitBreaker.OPEN
+    assert breaker.trips == 2
+
+
+def test_outage_moves_to_fallback_then_recovers(chain_factory):
+    a, b = _Backend("a", up=False), _Backend("b")
+    chain = chain_factory([a, b], probe_interval=0.02, cooldown_s=0.05)
+    served = [chain.predict_location_detailed("x")[1]["backend"] for _ in range(10)]
+    assert served == ["b"] * 10
+    assert a.calls == BREAKER_THRESHOLD
+    assert chain.breakers[0].state == CircuitBreaker.OPEN
+
+    a.up = True
+    assert _wait_for(lambda: chain.breakers[0].state == CircuitBreaker.HALF_OPEN)
+    assert chain.predict_location_detailed("x")[1]["backend"] == "a"
+    assert chain.breakers[0].state == CircuitBreaker.CLOSED
+
+
+def test_info_reports_the_whole_chain(chain_factory):
+    a, b = _Backend("a", up=False, reasons=["timeout"]), _Backend("b")
+    text, info = chain_factory([a, b], probe_interval=60).predict_location_detailed("x")
+    assert text == "(1.0, 2.0)"
+    assert info["attempts"] == 3
+    assert info["retry_reasons"] == ["timeout", "failover:a"]
+
+
+def test_throttled_backend_keeps_its_image(chain_factory):
+    a = _Backend("a", up=False, status="deferred", reasons=["http_429"])
+    b = _Backend("b")
+    text, info = chain_factory([a, b], probe_interval=60).predict_location_detailed("x")
+    assert info["status"] == "deferred" and info["backend"] == "a"
+    assert b.calls == 0
+
+
+def test_image_level_failure_does_not_fail_over(chain_factory):
+    a, b = _Backend("a", up=False, status="no_coords"), _Backend("b")
+    chain = chain_factory([a, b], probe_interval=60)
+    assert chain.predict_location_detailed("x")[1]["backend"] == "a"
+    assert b.calls == 0 and chain.breakers[0].failures == 0
+
+
+def test_all_open_stays_on_primary(chain_factory):
+    a, b = _Backend("a", up=False), _Backend("b", up=False)
+    chain = chain_factory([a, b], probe_interval=60, cooldown_s=60)
+    for _ in range(BREAKER_THRESHOLD + 2):
+        chain.predict_location_detailed("x")
+    assert all(br.state == CircuitBreaker.OPEN for br in chain.breakers)
+    calls = a.calls
+    chain.predict_location_detailed("x")
+    assert a.calls == calls + 1
+
+
+def test_attributes_fall_through_to_primary(chain_factory):
+    chain = chain_factory([_Backend("a"), _Backend("b")], probe_interval=60)
+    assert chain.max_tokens == 256
+    assert chain.backends == ["a", "b"]
+
+
+def test_fallbacks_send_requests_like_the_primary(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "sk-or-env")
+    primary = build_client("qwen3-vl-235b-sf", api_key="sk-sf", stream=True, reasoning_budget=512,
+                           structured=True, defer_retries=True, hedge=HedgePolicy(0.9, min_samples=5))
+    client = with_fallbacks(primary, "qwen3-vl-235b-sf", pool_size=4)
+    try:
+        assert isinstance(client, FailoverClient)
+        fallback = client.clients[1]
+        assert fallback.backend == "qwen3-vl-235b-or"
+        assert (fallback.stream, fallback.reasoning_budget, fallback.defer_retries) == (True, 512, True)
+        assert fallback.structured is not None
+        # Its own latency percentile, the primary's settings
+        assert fallback.hedge is not primary.hedge
+        assert (fallback.hedge.percentile, fallback.hedge.min_samples) == (0.9, 5)
+        # Another provider: not the primary's key
+        assert fallback.api_key == "sk-or-env"
+    finally:
+        client.close()
+
+
+def test_fallback_on_the_same_provider_gets_the_primary_key(monkeypatch):
+    monkeypatch.delenv("OPENROUTER_API_KEY", raising=False)
+    monkeypatch.setitem(MODEL_REGISTRY, "m-a", {"model": "a", "provider": "openrouter", "fallbacks": ["m-b"]})
+    monkeypatch.setitem(MODEL_REGISTRY, "m-b", {"model": "b", "provider": "openrouter"})
+    client = with_fallbacks(build_client("m-a", api_key="sk-explicit"), "m-a")
+    try:
+        assert client.backends == ["m-a", "m-b"] and client.clients[1].api_key == "sk-explicit"
+    finally:
+        client.close()
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from evaluation.hedging import Cancellation, HedgePolicy, once, run_async
+
+
+def test_no_hedging_before_min_samples():
+    policy = HedgePolicy(percentile=0.9, min_samples=20, min_delay_s=0.0)
+    for _ in range(19):
+        policy.observe(1.0)
+    assert policy.delay() is None
+    assert policy.snapshot()["latency_s"] is None
+    policy.observe(1.0)
+    assert policy.delay() == pytest.approx(1.0)
+
+
+def test_delay_follows_the_latency_percentile():
+    policy = HedgePolicy(percentile=0.9, min_samples=20, min_delay_s=0.0)
+    for i in range(1000):
+        policy.observe((i % 100) / 10)          # uniform over [0, 9.9]
+    assert policy.delay() == pytest.approx(8.9, abs=0.3)
+
+
+def test_delay_never_below_the_floor():
+    policy = HedgePolicy(min_samples=5, min_delay_s=1.0)
+    for _ in range(10):
+        policy.observe(0.05)
+    assert policy.delay() == 1.0
+
+
+def test_hedge_counts():
+    policy = HedgePolicy()
+    policy.record(won=True)
+    policy.record(won=False)
+    snapshot = policy.snapshot()
+    assert (snapshot["hedges"], snapshot["hedge_wins"], snapshot["samples"]) == (2, 1, 0)
+
+
+def test_run_async_result_and_exception():
+    assert run_async(lambda a, b: a + b, 1, 2).result(timeout=5) == 3
+
+    def boom():
+        raise RuntimeError("lost")
+
+    with pytest.raises(RuntimeError):
+        run_async(boom).result(timeout=5)
+
+
+def test_run_async_uses_a_daemon_thread():
+    seen = []
+    run_async(lambda: seen.append(threading.current_thread().daemon)).result(timeout=5)
+    assert seen == [True]
+
+
+def test_cancellation_runs_callbacks_once():
+    calls = []
+    cancel = Cancellation()
+    cancel.on_cancel(lambda: calls.append("release"))
+    cancel.on_cancel(lambda: 1 / 0)              # a failing cleanup doesn't stop the others
+    cancel.on_cancel(lambda: calls.append("close"))
+    cancel.cancel()
+    cancel.cancel()
+    assert cancel.cancelled and calls == ["release", "close"]
+    # Registered after the fact: runs at once
+    cancel.on_cancel(lambda: calls.append("late"))
+    assert calls[-1] == "late"
+
+
+def test_once_runs_on_the_first_call_only():
+    calls = []
+    release = once(lambda *args, **kwargs: calls.append((args, kwargs)))
+    threads = [threading.Thread(target=release, args=(i,), kwargs={"x": i}) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    release("again")
+    assert len(calls) == 1
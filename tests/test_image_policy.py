@@ -0,0 +1,70 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from evaluation.image_policy import ImagePolicy, policy_for, resize_for_policy, target_side
+from evaluation.image_store import ImageDerivativeStore
+from evaluation.image_tokens import image_tokens
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / "123.png"
+    Image.new("RGB", (2000, 1000), (10, 200, 30)).save(path)
+    return str(path)
+
+
+def _size(b64):
+    with Image.open(io.BytesIO(base64.b64decode(b64))) as img:
+        return img.size
+
+
+def test_policy_precedence():
+    provider = {"image_token_budget": 1000, "token_rule": "pixels_750"}
+    assert policy_for({}) is None
+    assert policy_for(provider) == ImagePolicy(1000, "pixels_750")
+    assert policy_for(provider, {"image_token_budget": 500}) == ImagePolicy(500, "pixels_750")
+    assert policy_for(provider, {"image_token_budget": 500}, budget=250) == ImagePolicy(250, "pixels_750")
+    assert policy_for(provider, budget=0) is None
+    assert policy_for(provider, {"image_token_budget": None}) is None
+
+
+def test_gateway_rule_by_model_prefix():
+    gateway = {"image_token_budget": 765, "token_rule_by_prefix": {"openai/": "openai_tiles"}}
+    assert policy_for(gateway, {"model": "openai/gpt-4o"}).token_rule == "openai_tiles"
+    assert policy_for(gateway, {"model": "qwen/qwen3-vl"}).token_rule == "pixels_750"
+    assert policy_for(gateway, {"model": "openai/gpt-4o", "token_rule": "pixels_750"}).token_rule == "pixels_750"
+
+
+def test_unknown_rule_is_rejected():
+    with pytest.raises(ValueError):
+        policy_for({"image_token_budget": 100, "token_rule": "per_megapixel"})
+
+
+def test_target_side():
+    assert target_side(2000, 1000, None) == (0, 1.0)
+    assert target_side(2000, 1000, None, max_side=1000) == (1000, 0.5)
+    assert target_side(200, 100, ImagePolicy(1000)) == (0, 1.0)
+    side, scale = target_side(2000, 1000, ImagePolicy(1000))
+    assert scale == side / 2000
+    assert image_tokens(side, side // 2) <= 1000
+
+
+def test_resize_for_policy(image_path):
+    b64, scale, path = resize_for_policy(image_path, None)
+    assert (scale, path) == (1.0, image_path) and _size(b64) == (2000, 1000)
+
+    b64, scale, path = resize_for_policy(image_path, ImagePolicy(1000))
+    width, height = _size(b64)
+    assert path is None and scale < 1
+    assert image_tokens(width, height) <= 1000
+
+
+def test_resize_through_the_derivative_store(image_path, tmp_path):
+    store = ImageDerivativeStore(str(tmp_path / "derivatives"))
+    b64, scale, path = resize_for_policy(image_path, ImagePolicy(1000), image_store=store)
+    with open(path, "rb") as f:
+        assert base64.b64encode(f.read()).decode("ascii") == b64
+    assert image_tokens(*_size(b64)) <= 1000
@@ -0,0 +1,63 @@
+import base64
+import io
+import os
+import shutil
+
+import pytest
+from PIL import Image
+
+from evaluation.image_store import ImageDerivativeStore, hash_file, transcode_jpeg
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i, color in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255)]):
+        path = tmp_path / "imgs" / f"{i}.png"
+        path.parent.mkdir(exist_ok=True)
+        Image.new("RGBA", (400, 200), color + (255,)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageDerivativeStore(str(tmp_path / "derivatives"))
+
+
+def _size(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.format, img.mode, img.size
+
+
+def test_transcode_jpeg(images):
+    assert _size(transcode_jpeg(images[0])) == ("JPEG", "RGB", (400, 200))
+    assert _size(transcode_jpeg(images[0], max_side=100)) == ("JPEG", "RGB", (100, 50))
+    assert _size(transcode_jpeg(images[0], max_side=1000))[2] == (400, 200)
+
+
+def test_derivatives_are_keyed_by_content(store, images, tmp_path):
+    copy = str(tmp_path / "copy.png")
+    shutil.copy(images[0], copy)
+    assert store.content_hash(copy) == store.content_hash(images[0]) == hash_file(images[0])
+    assert store.jpeg_path(copy, 100) == store.jpeg_path(images[0], 100)
+    assert store.content_hash(images[1]) != store.content_hash(images[0])
+
+
+def test_base64_matches_the_jpeg(store, images):
+    b64 = store.get_base64(images[0], 100)
+    with open(store.jpeg_path(images[0], 100), "rb") as f:
+        assert base64.b64decode(b64) == f.read()
+    assert _size(base64.b64decode(b64))[2] == (100, 50)
+
+
+def test_changed_file_is_rehashed(store, images):
+    before = store.content_hash(images[0])
+    Image.new("RGB", (400, 201), (1, 2, 3)).save(images[0])
+    os.utime(images[0], ns=(1, 1))
+    assert store.content_hash(images[0]) != before
+
+
+def test_prefill_creates_only_missing(store, images):
+    assert store.prefill(images, [0, 100], workers=1) == 6
+    assert store.prefill(images, [0, 100, 50], workers=1) == 3
@@ -0,0 +1,56 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from evaluation.image_tokens import (OUTPUT_TOKENS_EST, PROMPT_TOKENS_EST, budget_scale, estimate_image_tokens,
+                                     estimate_request_tokens, image_size_from_base64, image_tokens)
+
+
+def _png_b64(width, height):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (120, 80, 40)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def test_pixels_750_rule():
+    assert estimate_image_tokens(750, 1) == 1
+    assert estimate_image_tokens(1024, 768) == 1049
+    assert image_tokens(1024, 768) == 1049
+
+
+@pytest.mark.parametrize("size, tokens", [
+    ((512, 512), 85 + 170),
+    ((1024, 1024), 85 + 170 * 4),       # shorter side to 768: 2x2 tiles
+    ((4096, 2048), 85 + 170 * 6),       # fit 2048x1024, then 1536x768: 3x2 tiles
+])
+def test_openai_tile_rule(size, tokens):
+    assert image_tokens(*size, rule="openai_tiles") == tokens
+
+
+@pytest.mark.parametrize("rule", ["pixels_750", "openai_tiles"])
+@pytest.mark.parametrize("size", [(4032, 3024), (1920, 1080), (640, 480)])
+def test_budget_scale_fits_the_budget(rule, size):
+    budget = 500
+    scale = budget_scale(*size, budget, rule)
+    assert 0 < scale <= 1
+    assert image_tokens(max(1, int(size[0] * scale)), max(1, int(size[1] * scale)), rule) <= budget
+
+
+def test_budget_scale_keeps_small_images():
+    assert budget_scale(100, 100, 1000) == 1.0
+    assert budget_scale(512, 512, 10, "openai_tiles") == 1.0     # nothing costs less than one tile
+
+
+def test_request_estimate_from_the_header():
+    b64 = _png_b64(750, 100)
+    assert image_size_from_base64(b64) == (750, 100)
+    assert estimate_request_tokens(b64) == PROMPT_TOKENS_EST + 100 + OUTPUT_TOKENS_EST
+    assert estimate_request_tokens(b64, output_tokens=2048) == PROMPT_TOKENS_EST + 100 + 2048
+
+
+def test_request_estimate_without_a_readable_header():
+    b64 = base64.b64encode(b"\0" * 7500).decode("ascii")
+    assert image_size_from_base64(b64) is None
+    assert estimate_request_tokens(b64) == PROMPT_TOKENS_EST + 34 + OUTPUT_TOKENS_EST
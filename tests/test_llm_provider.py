@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from data_collector.llm_provider import OpenAICompatibleProvider
+
+SCHEMA = {"type": "object", "properties": {"text": {"type": "string"}}, "required": ["text"]}
+
+
+class _BadRequest(Exception):
+    status_code = 400
+
+
+class _FakeCompletions:
+    """Replays scripted responses (or raises scripted exceptions) and records the request kwargs."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        finish_reason, content = step
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(finish_reason=finish_reason, message=message)])
+
+
+def _provider(script, structured="json_schema"):
+    provider = OpenAICompatibleProvider(model_name="m", structured=structured)
+    completions = _FakeCompletions(script)
+    provider._async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return provider, completions
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "img.png"
+    path.write_bytes(b"\x89PNG\r\n\x1a\n")
+    return path
+
+
+def test_structured_request_carries_the_schema(image):
+    provider, completions = _provider([("stop", '{"text": "a"}')])
+    result = asyncio.run(provider.analyze_image_async(image, "p", json_mode=True, json_schema=SCHEMA))
+    assert result.success and result.content == '{"text": "a"}'
+    assert completions.calls[0]["response_format"]["type"] == "json_schema"
+    assert provider.stats["structured_requests"] == 1
+
+
+def test_rejected_schema_falls_back_to_json_mode(image):
+    provider, completions = _provider([_BadRequest("unsupported"), ("stop", '{"text": "a"}')])
+    result = asyncio.run(provider.analyze_image_async(image, "p", json_mode=True, json_schema=SCHEMA))
+    assert result.success
+    # Only this request went without the schema
+    assert provider.structured == "json_schema"
+    assert completions.calls[1]["response_format"] == {"type": "json_object"}
+    assert completions.calls[1]["frequency_penalty"] == 0.1
+
+
+def test_rejected_guided_decoding_drops_extra_body(image):
+    provider, completions = _provider([_BadRequest("unsupported"), ("stop", '{"text": "a"}')], structured="guided")
+    result = asyncio.run(provider.analyze_image_async(image, "p", json_mode=False, json_schema=SCHEMA))
+    assert result.success
+    assert "extra_body" in completions.calls[0]
+    assert "extra_body" not in completions.calls[1] and "response_format" not in completions.calls[1]
+
+
+def test_fallback_does_not_use_up_a_retry(image):
+    # The fallback request plus all four regular attempts (three of them retries after runaways)
+    script = [_BadRequest("unsupported")] + [("length", "")] * 3 + [("stop", '{"text": "a"}')]
+    provider, completions = _provider(script)
+    result = asyncio.run(provider.analyze_image_async(image, "p", json_mode=True, json_schema=SCHEMA))
+    assert result.success
+    assert len(completions.calls) == 5
+
+
+def test_repeated_schema_rejections_disable_structured_output(image):
+    script = [_BadRequest("response_format json_schema is not supported"), ("stop", '{"text": "a"}')] * 3
+    provider, completions = _provider(script + [("stop", '{"text": "a"}')])
+    for _ in range(3):
+        assert asyncio.run(provider.analyze_image_async(image, "p", json_mode=True, json_schema=SCHEMA)).success
+    assert provider.structured is None
+    asyncio.run(provider.analyze_image_async(image, "p", json_mode=True, json_schema=SCHEMA))
+    assert completions.calls[-1]["response_format"] == {"type": "json_object"}
+
+
+def test_rejections_about_the_image_keep_structured_output(image):
+    script = [_BadRequest("image could not be decoded"), ("stop", '{"text": "a"}')] * 4
+    provider, completions = _provider(script)
+    for _ in range(4):
+        assert asyncio.run(provider.analyze_image_async(image, "p", json_mode=True, json_schema=SCHEMA)).success
+    assert provider.structured == "json_schema"
+
+
+def test_invalid_json_is_retried_warmer(image):
+    provider, completions = _provider([("stop", "no json here"), ("stop", '{"text": "b"}')], structured=None)
+    result = asyncio.run(provider.analyze_image_async(image, "p", json_mode=True))
+    assert result.success and result.content == '{"text": "b"}'
+    assert provider.stats["parse_retries"] == 1
+    assert completions.calls[1]["temperature"] == pytest.approx(0.1)
@@ -0,0 +1,74 @@
+import pytest
+
+from evaluation.manifest import (ORIGINAL, SampleManifest, SampleRecord, default_manifest_path, iter_gt_tsv,
+                                 original_record, result_base_id, synthesized_record)
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = SampleManifest(str(tmp_path / "metadata" / "ds_manifest.sqlite"))
+    manifest.upsert([original_record("AF1QipN_0.jpg", 48.85, 2.29), original_record("123.jpg", 40.7, -74.0)])
+    manifest.upsert([synthesized_record({"filename": "AF1QipN_0_adversarial_Broadway.png",
+                                         "original_source": "AF1QipN_0.jpg", "attack_type": "adversarial",
+                                         "injected_text": "Broadway"}, manifest)])
+    yield manifest
+    manifest.close()
+
+
+def test_googlesv_ids_keep_their_underscores(manifest):
+    rec = manifest.get("AF1QipN_0_adversarial_Broadway.png")
+    assert rec.base_id == "AF1QipN_0"
+    assert rec.gt == (48.85, 2.29)
+    assert (rec.attack_type, rec.injected_text, rec.original_source) == ("adversarial", "Broadway", "AF1QipN_0.jpg")
+    assert not rec.is_original
+
+
+def test_lookup_by_stem_and_path(manifest):
+    assert manifest.get("/data/images/Original/123.png").filename == "123.jpg"
+    assert manifest.get("999.jpg") is None
+    assert manifest.base_id_of("123.jpg") == "123"
+    assert manifest.original_of("AF1QipN_0").filename == "AF1QipN_0.jpg"
+
+
+def test_iter_and_len(manifest):
+    assert len(manifest) == 3
+    assert sorted(r.filename for r in manifest.iter_records(ORIGINAL)) == ["123.jpg", "AF1QipN_0.jpg"]
+    assert [r.attack_type for r in manifest.iter_records("adversarial")] == ["adversarial"]
+
+
+def test_upsert_replaces_and_chunks(manifest):
+    manifest.upsert((original_record(f"{i}.jpg", 0.0, 0.0) for i in range(25)), chunk_size=10)
+    manifest.upsert([original_record("123.jpg", 1.0, 2.0)])
+    assert len(manifest) == 3 + 25
+    assert manifest.get("123.jpg").gt == (1.0, 2.0)
+
+
+def test_synthesized_record_without_a_known_source():
+    rec = synthesized_record({"filename": "77_random_Oslo.png", "original_source": "77.jpg"})
+    assert (rec.base_id, rec.gt, rec.attack_type) == ("77", None, "unknown")
+
+
+def test_result_base_id(manifest):
+    assert result_base_id({"filename": "x.png", "base_id": "b"}) == "b"
+    assert result_base_id({"filename": "AF1QipN_0_adversarial_Broadway.png"}, manifest) == "AF1QipN_0"
+    assert result_base_id({"filename": "AF1QipN_0_adversarial_Broadway.png"}) is None
+
+
+def test_iter_gt_tsv(tmp_path):
+    def line(sample_id, lon, lat, url):
+        parts = ["x"] * 15
+        parts[1], parts[10], parts[11], parts[14] = sample_id, lon, lat, url
+        return "\t".join(parts)
+
+    tsv = tmp_path / "ds_gt.tsv"
+    tsv.write_text("\n".join([line("1", "2.29", "48.85", "http://x/img/1.jpg?size=2"),
+                              line("2", "bad", "0", "http://x/2.jpg"),
+                              line("3", "-74.0", "40.7", "http://x/"),
+                              "short\tline"]) + "\n", encoding="utf-8")
+    records = list(iter_gt_tsv(str(tsv)))
+    assert records == [SampleRecord("1.jpg", "1", 48.85, 2.29), SampleRecord("3", "3", 40.7, -74.0)]
+
+
+def test_default_manifest_path(tmp_path, manifest):
+    assert default_manifest_path(str(tmp_path), "ds") == manifest.path
+    assert default_manifest_path(str(tmp_path), "other") is None
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+import requests
+
+from evaluation.media_server import MediaServer
+
+
+@pytest.fixture
+def roots(tmp_path):
+    images, store = tmp_path / "images", tmp_path / "store"
+    (images / "sub").mkdir(parents=True)
+    store.mkdir()
+    (images / "123 adv.png").write_bytes(b"png-bytes")
+    (images / "sub" / "7.jpg").write_bytes(b"jpg-bytes")
+    (store / "ab.jpg").write_bytes(b"derivative")
+    (tmp_path / "secret.txt").write_text("no")
+    return str(images), str(store)
+
+
+@pytest.fixture
+def server(roots):
+    server = MediaServer(list(roots), host="127.0.0.1", public_host="127.0.0.1").start()
+    yield server
+    server.close()
+
+
+def test_urls_serve_the_files(server, roots):
+    images, store = roots
+    for path, data in ((os.path.join(images, "123 adv.png"), b"png-bytes"),
+                       (os.path.join(images, "sub", "7.jpg"), b"jpg-bytes"),
+                       (os.path.join(store, "ab.jpg"), b"derivative")):
+        response = requests.get(server.url_for(path), timeout=5)
+        assert response.status_code == 200 and response.content == data
+
+
+def test_paths_outside_the_roots(server, roots, tmp_path):
+    with pytest.raises(ValueError):
+        server.url_for(str(tmp_path / "secret.txt"))
+    base = server.base_url
+    assert requests.get(f"{base}/0/../secret.txt", timeout=5).status_code == 404
+    assert requests.get(f"{base}/5/123%20adv.png", timeout=5).status_code == 404
+    assert requests.get(f"{base}/0/", timeout=5).status_code in (403, 404)
+
+
+def test_symlink_out_of_a_root_is_not_served(server, roots, tmp_path):
+    link = os.path.join(roots[0], "link.txt")
+    os.symlink(tmp_path / "secret.txt", link)
+    assert requests.get(f"{server.base_url}/0/link.txt", timeout=5).status_code == 404
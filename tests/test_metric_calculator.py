@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from evaluation.metric_calculator import MetricCalculator
+
+
+@pytest.fixture(scope="module")
+def rows():
+    """Random coordinate pairs and errors spread over all WLA bands, the exact thresholds and failures."""
+    n = 20000
+    rng = np.random.default_rng(0)
+    errors = np.concatenate([np.exp(rng.uniform(-2, 9, n - 10)), MetricCalculator.WLA_THRESHOLDS, [np.nan] * 5])
+    return {
+        "lat1": rng.uniform(-90, 90, n), "lon1": rng.uniform(-180, 180, n),
+        "lat2": rng.uniform(-90, 90, n), "lon2": rng.uniform(-180, 180, n),
+        "errors": errors, "clean": rng.permutation(errors),
+    }
+
+
+def _opt(x):
+    return None if np.isnan(x) else float(x)
+
+
+def test_scalar_metrics():
+    assert MetricCalculator.haversine_distance(0, 0, 0, 0) == 0
+    assert MetricCalculator.haversine_distance(0, 0, 0, 180) == pytest.approx(np.pi * 6371)
+    assert MetricCalculator.haversine_distance(None, 0, 0, 0) is None
+    assert MetricCalculator.calculate_wla(0.5) == pytest.approx(1.0)
+    assert MetricCalculator.calculate_wla(25) == pytest.approx(0.6)
+    assert MetricCalculator.calculate_wla(None) == 0.0
+    assert MetricCalculator.calculate_tbs(100.0, 350.0) == 250.0
+    assert MetricCalculator.calculate_tbs(None, 350.0) is None
+    assert MetricCalculator.calculate_tfr(48.85, 2.29, 48.86, 2.30)
+    assert not MetricCalculator.calculate_tfr(None, None, 48.86, 2.30)
+
+
+def test_haversine_batch_matches_scalar(rows):
+    dist = MetricCalculator.haversine_batch(rows["lat1"], rows["lon1"], rows["lat2"], rows["lon2"])
+    expected = [MetricCalculator.haversine_distance(*row)
+                for row in zip(rows["lat1"], rows["lon1"], rows["lat2"], rows["lon2"])]
+    assert np.allclose(dist, expected)
+
+
+def test_haversine_batch_propagates_nan():
+    assert np.isnan(MetricCalculator.haversine_batch([np.nan, 0.0], [0.0, 0.0], [0.0, 0.0], [0.0, 1.0])[0])
+
+
+def test_wla_batch_matches_scalar(rows):
+    wla = MetricCalculator.wla_batch(rows["errors"])
+    assert np.allclose(wla, [MetricCalculator.calculate_wla(_opt(e)) for e in rows["errors"]])
+
+
+def test_tbs_batch_matches_scalar(rows):
+    tbs = MetricCalculator.tbs_batch(rows["clean"], rows["errors"])
+    scalar = [MetricCalculator.calculate_tbs(_opt(c), _opt(e)) for c, e in zip(rows["clean"], rows["errors"])]
+    assert np.allclose(tbs, [np.nan if t is None else t for t in scalar], equal_nan=True)
+
+
+def test_trap_hit_matrix_matches_scalar(rows):
+    lat1, lon1, lat2, lon2 = (rows[k][:500] for k in ("lat1", "lon1", "lat2", "lon2"))
+    hits = MetricCalculator.trap_hit_matrix(lat1, lon1, lat2, lon2, threshold_km=2000)
+    assert hits.shape == (500, 500)
+    for i in range(0, 500, 7):
+        for j in range(0, 500, 11):
+            assert hits[i, j] == MetricCalculator.calculate_tfr(lat1[i], lon1[i], lat2[j], lon2[j], threshold_km=2000)
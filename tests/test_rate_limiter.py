@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from evaluation import rate_limiter
+from evaluation.rate_limiter import ProviderRateLimiter, get_limiter, parse_retry_after
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    """An empty process-wide limiter registry."""
+    monkeypatch.setattr(rate_limiter, "_LIMITERS", {})
+    return rate_limiter._LIMITERS
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Thu, 01 Jan 1970 00:00:00 GMT") == 0.0
+
+
+def test_aimd_window():
+    limiter = ProviderRateLimiter("p", max_in_flight=8, initial_in_flight=2)
+    for _ in range(2):
+        limiter.acquire()
+        limiter.release("ok")
+    assert limiter.limit == 3
+    limiter.acquire()
+    limiter.release("throttled", retry_after=0)
+    assert limiter.limit == 1 and limiter.throttle_count == 1
+
+
+def test_throttle_pauses_callers():
+    limiter = ProviderRateLimiter("p", max_in_flight=4)
+    limiter.acquire()
+    limiter.release("throttled", retry_after=0.2)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_token_bucket_corrected_by_actual_usage():
+    limiter = ProviderRateLimiter("p", tokens_per_min=1000, max_in_flight=4)
+    limiter.acquire(800)
+    limiter.release("ok", 800, actual_tokens=100)
+    assert limiter._tokens.level == pytest.approx(900, abs=1)
+
+
+def test_get_limiter_is_shared_per_provider(limiters):
+    a = get_limiter("p", {"max_in_flight": 8})
+    assert get_limiter("p", {"max_in_flight": 8}) is a
+    assert get_limiter("q", {"max_in_flight": 8}) is not a
+
+
+def test_larger_replica_pool_grows_the_window(limiters):
+    single = get_limiter("local", {"max_in_flight": 64})
+    assert (single.max_in_flight, single.limit) == (64, 16)
+    pooled = get_limiter("local", {"max_in_flight": 64 * 3})
+    assert pooled is single
+    assert (pooled.max_in_flight, pooled.limit) == (192, 48)
+    # A smaller pool never shrinks it
+    get_limiter("local", {"max_in_flight": 64})
+    assert single.max_in_flight == 192
@@ -0,0 +1,58 @@
+import itertools
+
+import pytest
+
+from evaluation import response_cache
+from evaluation.response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Strictly increasing access times, so the LRU order is deterministic
+    ticks = itertools.count(1)
+    monkeypatch.setattr(response_cache.time, "time", lambda: float(next(ticks)))
+    cache = ResponseCache(str(tmp_path / "cache" / "responses.sqlite"), max_size_mb=1)
+    yield cache
+    cache.close()
+
+
+def _key(image="aW1n", **overrides):
+    fields = dict(model="m", provider="local", prompt="p", base64_image=image, temperature=0.0, max_tokens=2048)
+    fields.update(overrides)
+    return ResponseCache.make_key(**fields)
+
+
+def test_key_covers_everything_that_changes_the_answer():
+    base = _key()
+    assert _key() == base
+    for change in (dict(model="n"), dict(provider="relay"), dict(prompt="q"), dict(image="b3RoZXI="),
+                   dict(temperature=0.1), dict(max_tokens=128)):
+        assert _key(**change) != base, change
+
+
+def test_get_put_and_stats(cache):
+    key = _key()
+    assert cache.get(key) is None
+    cache.put(key, "(48.8584, 2.2945)")
+    assert cache.get(key) == "(48.8584, 2.2945)"
+    assert cache.stats() == {"hits": 1, "misses": 1, "writes": 1, "hit_rate": 0.5}
+
+
+def test_shared_between_instances(cache):
+    cache.put(_key(), "(1.0, 2.0)")
+    other = ResponseCache(cache.path)
+    assert other.get(_key()) == "(1.0, 2.0)"
+    other.close()
+
+
+def test_least_recently_used_are_evicted(cache):
+    cache.max_size_bytes = 10 * 100
+    cache.EVICT_CHECK_INTERVAL = 1
+    keys = [_key(image=f"img{i}") for i in range(10)]
+    for key in keys:
+        cache.put(key, "x" * 100)
+    cache.get(keys[0])                      # touched: now the most recent
+    cache.put(_key(image="new"), "x" * 100)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(_key(image="new")) is not None
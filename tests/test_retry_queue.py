@@ -0,0 +1,81 @@
+import json
+
+import pytest
+import requests
+
+from evaluation import retry_queue
+from evaluation.api_client import build_client
+from evaluation.retry_queue import (BACKOFF_BASE_S, BACKOFF_CAP_S, RetryQueue, backoff_delay, stragglers_path,
+                                    write_stragglers)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A manual monotonic clock for the queue's deadlines."""
+    now = [1000.0]
+    monkeypatch.setattr(retry_queue.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_come_out_by_deadline(clock):
+    queue = RetryQueue()
+    queue.push("late", 0.2)
+    queue.push("soon", 0.05)
+    queue.push("now", 0.0)
+    assert queue.pop_due() == ["now"] and len(queue) == 2
+    assert queue.wait_time() == pytest.approx(0.05)
+    clock[0] += 0.05
+    assert queue.pop_due() == ["soon"]
+    clock[0] += 1
+    assert queue.wait_time() == 0.0
+    assert queue.pop_due() == ["late"] and queue.wait_time() is None
+
+
+def test_equal_deadlines_stay_fifo_without_comparing_entries(clock):
+    queue = RetryQueue()
+    entries = [{"id": i} for i in range(5)]
+    for entry in entries:
+        queue.push(entry, 1.0)
+    clock[0] += 1
+    assert queue.pop_due() == entries
+
+
+def test_backoff_is_jittered_exponential_and_capped():
+    for tries in range(1, 12):
+        full = min(BACKOFF_CAP_S, BACKOFF_BASE_S * 2 ** (tries - 1))
+        for _ in range(20):
+            assert full / 2 <= backoff_delay(tries) <= full
+
+
+def test_backoff_never_before_retry_after():
+    assert backoff_delay(1, retry_after=30) == 30
+    assert backoff_delay(1, retry_after=0.0) >= BACKOFF_BASE_S / 2
+
+
+def test_stragglers_report(tmp_path):
+    output = str(tmp_path / "results_Original_m.jsonl")
+    rows = [{"filename": "a.jpg", "status": "http_503", "deferrals": 5}]
+    assert write_stragglers(output, rows) == stragglers_path(output)
+    with open(stragglers_path(output), encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == rows
+    # A clean session removes the stale report
+    assert write_stragglers(output, []) is None
+    assert not (tmp_path / "results_Original_m.jsonl.stragglers.jsonl").exists()
+
+
+@pytest.mark.parametrize("error, status", [
+    (requests.exceptions.ConnectionError("refused"), "deferred"),
+    (ValueError("Expecting value: line 1 column 1 (char 0)"), "deferred"),
+    (TypeError("unexpected keyword"), "failed"),
+    (KeyError("choices"), "failed"),
+])
+def test_client_defers_only_transient_errors(error, status):
+    client = build_client("m", provider="local", api_base="http://127.0.0.1:9/v1", defer_retries=True)
+
+    def send(*args, **kwargs):
+        raise error
+
+    client._send = send
+    text, info = client.predict_location_detailed("aGVsbG8=")
+    assert text is None
+    assert info["status"] == status and info["attempts"] == 1
@@ -0,0 +1,88 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import evaluate
+from evaluation.running_metrics import P2Quantile, RunningMetrics, summary_path
+
+
+@pytest.fixture(scope="module")
+def errors():
+    return np.random.default_rng(0).lognormal(6, 1.5, 20000)
+
+
+def _rows(errors):
+    rng = np.random.default_rng(1)
+    for i, error in enumerate(errors):
+        if i % 10 == 0:
+            yield {"error_km": None, "wla_score": 0.0, "tbs": None}
+        else:
+            yield {"error_km": float(error), "wla_score": float(error < 750), "tbs": float(rng.normal(100, 50)),
+                   "hedged": i % 7 == 0}
+
+
+@pytest.mark.parametrize("p", [0.1, 0.5, 0.9])
+def test_p2_tracks_the_quantile(errors, p):
+    sketch = P2Quantile(p)
+    for x in errors:
+        sketch.add(float(x))
+    exact = np.quantile(errors, p)
+    assert sketch.value() == pytest.approx(exact, rel=0.05)
+
+
+def test_p2_is_exact_below_five_samples():
+    sketch = P2Quantile(0.5)
+    assert sketch.value() is None
+    for x in (4.0, 1.0, 3.0, 2.0):
+        sketch.add(x)
+        assert sketch.value() == pytest.approx(np.percentile(sketch.heights, 50))
+
+
+def test_summary(errors):
+    metrics = RunningMetrics()
+    rows = list(_rows(errors[:1000]))
+    for row in rows:
+        metrics.add(row)
+    summary = metrics.summary()
+    valid = [r for r in rows if r["error_km"] is not None]
+    assert summary["rows"] == 1000 and summary["valid"] == len(valid) == 900
+    assert summary["failure_rate"] == pytest.approx(0.1)
+    assert summary["mean_wla"] == pytest.approx(np.mean([r["wla_score"] for r in valid]))
+    assert summary["mean_tbs_km"] == pytest.approx(np.mean([r["tbs"] for r in valid]))
+    assert summary["tbs_pairs"] == 900
+    assert summary["hedged"] == sum(bool(r.get("hedged")) for r in rows)
+    assert summary["median_error_km"] == pytest.approx(np.median([r["error_km"] for r in valid]), rel=0.1)
+
+
+def test_empty_summary():
+    summary = RunningMetrics().summary()
+    assert summary["rows"] == 0
+    assert summary["failure_rate"] is None and summary["mean_wla"] is None and summary["median_error_km"] is None
+
+
+def test_sidecar_holds_the_summary(tmp_path, errors):
+    metrics = RunningMetrics()
+    for row in _rows(errors[:250]):
+        metrics.add(row)
+    path = summary_path(str(tmp_path / "results_Original_m.jsonl"))
+    metrics.save(path)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["summary"] == metrics.summary()
+
+
+class _Client:
+    model_name = "m"
+    structured = None
+
+
+def test_model_run_writes_the_sidecar_periodically_not_per_row(tmp_path, errors):
+    output = str(tmp_path / "results_Original_m.jsonl")
+    run = evaluate.ModelRun("m", _Client(), output)
+    for row in _rows(errors[:10]):
+        run.record(dict(row, attack_type="original", filename=f"{row['error_km']}.jpg"))
+    assert not os.path.exists(summary_path(output))
+    run.save_metrics()
+    with open(summary_path(output), encoding="utf-8") as f:
+        assert json.load(f)["summary"]["rows"] == 10
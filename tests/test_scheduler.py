@@ -0,0 +1,99 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import run_scheduler
+from run_scheduler import Job, Scheduler, target_images
+
+
+class _Proc:
+    def __init__(self, code):
+        self.code = code
+
+    def poll(self):
+        return self.code
+
+
+@pytest.fixture
+def cell(tmp_path):
+    img_dir = tmp_path / "Original"
+    img_dir.mkdir()
+    for name in ("a_0.jpg", "b_0.jpg", "c_0.jpg", "nogt_0.jpg", "notes.txt"):
+        (img_dir / name).write_bytes(b"")
+    gt_map = {name: (1.0, 2.0) for name in ("a_0.jpg", "b_0.jpg", "c_0.jpg")}
+    return img_dir, tmp_path / "results_m.jsonl", gt_map
+
+
+def _job(cell, images, subset_path=None):
+    img_dir, result_file, _ = cell
+    return Job("ds", "Original", "m", "local", (img_dir, result_file, None, "m", None, None, None, None),
+               images, subset_path=subset_path)
+
+
+def _write_rows(result_file, filenames):
+    with open(result_file, 'a', encoding='utf-8') as f:
+        for filename in filenames:
+            f.write(json.dumps({"filename": filename}) + "\n")
+
+
+def _scheduler(tmp_path, jobs, adaptive=False):
+    args = SimpleNamespace(max_jobs=1, provider_jobs="", default_provider_jobs=1, adaptive=adaptive,
+                           state_file=str(tmp_path / "state.jsonl"))
+    return Scheduler(jobs, args)
+
+
+def _finish(scheduler, job, code, tmp_path):
+    job.status, job.started, job.proc = "running", 0.0, _Proc(code)
+    job.log_f = open(tmp_path / "job.log", 'a', encoding='utf-8')
+    scheduler.running.append(job)
+    scheduler.reap()
+
+
+def test_targets_follow_gt_invalid_ids_and_subset(cell):
+    img_dir, _, gt_map = cell
+    assert target_images(img_dir, gt_map, {}, set()) == {"a_0.jpg", "b_0.jpg", "c_0.jpg"}
+    assert target_images(img_dir, gt_map, {}, {"b"}) == {"a_0.jpg", "c_0.jpg"}
+    assert target_images(img_dir, gt_map, {}, set(), subset={"a", "b", "nogt"}) == {"a_0.jpg", "b_0.jpg"}
+
+
+def test_remaining_counts_subset_members_only(cell):
+    img_dir, result_file, gt_map = cell
+    job = _job(cell, target_images(img_dir, gt_map, {}, set(), subset={"a", "b"}), subset_path="lite.json")
+    assert job.total_images == 2 and job.remaining_images() == 2
+    _write_rows(result_file, ["a_0.jpg", "c_0.jpg"])    # c_0 is from an earlier full run
+    assert job.remaining_images() == 1
+    assert job.plan_target()["subset"] == "lite.json"
+
+
+def test_clean_exit_with_images_left_is_not_recorded(cell, tmp_path):
+    job = _job(cell, {"a_0.jpg", "b_0.jpg"})
+    dependent = _job(cell, {"a_0.jpg"})
+    dependent.depends_on = job
+    scheduler = _scheduler(tmp_path, [job, dependent])
+    _write_rows(cell[1], ["a_0.jpg"])    # b_0 ended as a straggler
+
+    _finish(scheduler, job, 0, tmp_path)
+    assert job.status == "incomplete" and job.remaining_images() == 1
+    assert not (tmp_path / "state.jsonl").exists()
+    assert dependent.ready()
+
+
+def test_clean_exit_covering_the_targets_is_recorded(cell, tmp_path):
+    job = _job(cell, {"a_0.jpg", "b_0.jpg"})
+    scheduler = _scheduler(tmp_path, [job])
+    _write_rows(cell[1], ["a_0.jpg", "b_0.jpg"])
+
+    _finish(scheduler, job, 0, tmp_path)
+    assert job.status == "done"
+    assert run_scheduler.load_done_keys(scheduler.args.state_file) == {job.key}
+
+
+def test_converged_adaptive_run_is_complete(cell, tmp_path):
+    job = _job(cell, {"a_0.jpg", "b_0.jpg"})
+    _write_rows(cell[1], ["a_0.jpg"])
+    assert not job.complete(adaptive=True)
+    with open(str(cell[1]) + ".adaptive.json", 'w', encoding='utf-8') as f:
+        json.dump({"decision": "converged"}, f)
+    assert job.complete(adaptive=True)
+    assert not job.complete(adaptive=False)
@@ -0,0 +1,58 @@
+import re
+
+import pytest
+
+from evaluation.coord_parser import parse_coordinates
+from evaluation.structured_output import (ATTACK_SCHEMA, COORD_REGEX, COORD_SCHEMA, STRUCTURED_MODES,
+                                          complete_answer, coordinate_constraint, json_constraint,
+                                          structured_mode)
+
+
+def test_mode_from_provider_and_registry():
+    assert structured_mode({"structured": "guided"}) == "guided"
+    assert structured_mode({}) == "stop"
+    assert structured_mode({"structured": "guided"}, {"structured": None}) is None
+    assert structured_mode({"structured": "guided"}, {"structured": "json_schema"}) == "json_schema"
+
+
+def test_thinking_models_only_when_their_entry_says_so():
+    assert structured_mode({"structured": "guided"}, is_thinking=True) is None
+    assert structured_mode({}, {"structured": "json_schema"}, is_thinking=True) == "json_schema"
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        structured_mode({"structured": "grammar"})
+
+
+@pytest.mark.parametrize("answer", ["(48.8584, 2.2945)", "(-33.86, -151.2)", "(0.5, 179.999999)"])
+def test_coord_regex_accepts_answers_the_parser_reads(answer):
+    assert re.fullmatch(COORD_REGEX, answer)
+    assert parse_coordinates(answer)[0] is not None
+
+
+def test_coordinate_constraint_per_mode():
+    assert coordinate_constraint("guided") == {"guided_regex": COORD_REGEX}
+    fmt = coordinate_constraint("json_schema")["response_format"]
+    assert fmt["type"] == "json_schema" and fmt["json_schema"]["schema"] is COORD_SCHEMA
+    assert coordinate_constraint("stop") == {"stop": [")"]}
+    assert coordinate_constraint(None) == {}
+    assert all(coordinate_constraint(m) for m in STRUCTURED_MODES)
+
+
+def test_json_constraint_per_mode():
+    assert json_constraint("guided", "attack", ATTACK_SCHEMA) == {"guided_json": ATTACK_SCHEMA}
+    assert json_constraint("json_schema", "attack", ATTACK_SCHEMA)["response_format"]["json_schema"]["strict"]
+    assert json_constraint("stop", "attack", ATTACK_SCHEMA) == {}
+
+
+def test_complete_answer_restores_the_stop_sequence():
+    assert parse_coordinates(complete_answer("(48.8584, 2.2945", "stop")) == (48.8584, 2.2945)
+    assert complete_answer("(48.8584, 2.2945)", "stop") == "(48.8584, 2.2945)"
+    assert complete_answer("no idea", "stop") == "no idea"
+    assert complete_answer("(48.8584, 2.2945", "guided") == "(48.8584, 2.2945"
+    assert complete_answer(None, "stop") is None
+
+
+def test_json_schema_answer_parses():
+    assert parse_coordinates('{"latitude": 48.8584, "longitude": 2.2945}') == (48.8584, 2.2945)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import build_lite_subset as lite
+from evaluation.subset import load_subset, resolve_subset, save_subset, subset_path
+
+
+def test_manifest_round_trip_and_resolution(tmp_path):
+    dataset_dir = str(tmp_path / "im2gps3k")
+    path = subset_path(dataset_dir, "im2gps3k")
+    assert path.endswith("metadata/im2gps3k_lite.json")
+    save_subset(path, {"base_ids": ["12", "7", "12"], "seed": 0})
+    assert load_subset(path) == {"12", "7"}
+    assert resolve_subset(None, dataset_dir, "im2gps3k") is None
+    assert resolve_subset(path, "elsewhere", "x") == path
+    assert resolve_subset("lite200", dataset_dir, "im2gps3k") == subset_path(dataset_dir, "im2gps3k", "lite200")
+
+
+def test_allocate_is_proportional_and_capped():
+    alloc = lite.allocate({"a": 50, "b": 30, "c": 20}, 10)
+    assert alloc == {"a": 5, "b": 3, "c": 2}
+    alloc = lite.allocate({"a": 1, "b": 99}, 10)
+    assert sum(alloc.values()) == 10 and alloc["a"] <= 1
+    assert lite.allocate({"a": 3, "b": 2}, 10) == {"a": 3, "b": 2}
+
+
+def test_stratify_labels():
+    labels = lite.stratify(["1", "2"], [(48.8, 2.3), (-33.9, 151.2)], {"1": "landmark"})
+    assert labels == ["landmark/lat+30/lon+0", "untiered/lat-90/lon+120"]
+
+
+def test_discordance_ignores_full_set_ties():
+    assert lite.discordance(np.array([1.0, 2.0, 3.0]), np.array([1.0, 2.0, 3.0])) == 0.0
+    assert lite.discordance(np.array([1.0, 2.0, 3.0]), np.array([3.0, 2.0, 1.0])) == 1.0
+    assert np.isnan(lite.discordance(np.array([1.0, 1.0]), np.array([1.0, 2.0])))
+
+
+@pytest.fixture(scope="module")
+def errors():
+    """Errors [models, attacks, n] of three models of clearly different skill."""
+    rng = np.random.default_rng(3)
+    n = 400
+    scale = np.array([200.0, 800.0, 2500.0])[:, None, None] * np.array([1.0, 1.5, 2.0, 3.0])[None, :, None]
+    return rng.exponential(scale, size=(3, len(lite.ATTACKS), n))
+
+
+def test_core_set_keeps_metrics_and_ranking(errors):
+    labels = [f"s{i % 4}" for i in range(errors.shape[-1])]
+    picked, best = lite.select_core_set(errors, labels, 60, candidates=8, swaps=200, seed=0)
+    assert len(picked) == 60 and len(set(picked.tolist())) == 60
+    full, sub = lite.metrics_of(errors), lite.metrics_of(errors[..., picked])
+    # Picked evenly across the strata, and no worse than an arbitrary draw
+    assert sorted(np.bincount(picked % 4).tolist()) == [15, 15, 15, 15]
+    assert best <= lite.score(full, lite.metrics_of(errors[..., :60]))
+    for metric in ("WLA", "MedErr"):
+        for a in range(len(lite.ATTACKS)):
+            assert lite.discordance(full[metric][:, a], sub[metric][:, a]) == 0.0
+
+
+def test_core_set_is_seeded(errors):
+    labels = ["s"] * errors.shape[-1]
+    first = lite.select_core_set(errors, labels, 30, candidates=4, swaps=50, seed=5)[0]
+    again = lite.select_core_set(errors, labels, 30, candidates=4, swaps=50, seed=5)[0]
+    assert first.tolist() == again.tolist()
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from evaluation.telemetry import (TELEMETRY_FIELDS, RunTelemetry, format_report, load_prices, parse_retry_counts,
+                                  price_for, prom_path, row_telemetry, telemetry_path, to_prometheus)
+
+PRICES = [("qwen3vl8b", "Qwen3-VL-8B", 0.2, 0.8), ("qwen3vl8binstruct", "Qwen3-VL-8B-Instruct", 0.25, 1.0)]
+
+
+def _row(**fields):
+    row = {"status": "ok", "latency_s": 1.0, "ttfb_s": 0.5, "prompt_tokens": 1000, "completion_tokens": 10,
+           "reasoning_tokens": None, "attempts": 1, "retry_reasons": [], "temperature": 0.0, "compressed": False,
+           "backend": "qwen3-vl-8b-sf", "structured": None}
+    row.update(fields)
+    return row
+
+
+@pytest.fixture
+def telemetry():
+    telemetry = RunTelemetry("Qwen/Qwen3-VL-8B-Instruct", PRICES, timed=False)
+    for i in range(100):
+        telemetry.add(_row(latency_s=0.01 * (i + 1)))
+    telemetry.add(_row(status="cached", latency_s=0.0, prompt_tokens=None, completion_tokens=None))
+    telemetry.add(_row(status="failed", retry_reasons=["timeout", "no_coords"], temperature=0.15,
+                       prompt_tokens=None, completion_tokens=None, backend="qwen3-vl-8b-or"))
+    return telemetry
+
+
+def test_row_telemetry_fields():
+    assert list(row_telemetry(None)) == TELEMETRY_FIELDS
+    assert all(v is None for v in row_telemetry(None).values())
+    assert row_telemetry({"status": "ok", "extra": 1})["status"] == "ok"
+
+
+def test_price_lookup_prefers_the_longest_name():
+    assert price_for("Qwen/Qwen3-VL-8B-Instruct", PRICES) == ("Qwen3-VL-8B-Instruct", 0.25, 1.0)
+    assert price_for("qwen3-vl-8b", PRICES)[0] == "Qwen3-VL-8B"
+    assert price_for("gpt-4o", PRICES) is None
+
+
+def test_shipped_price_sheet_loads():
+    prices = load_prices()
+    assert prices and all(p[2] >= 0 and p[3] >= 0 for p in prices)
+    assert load_prices("/nonexistent.csv") == []
+
+
+def test_report(telemetry):
+    report = telemetry.report()
+    assert report["rows"] == 102
+    assert report["statuses"] == {"ok": 100, "cached": 1, "failed": 1}
+    assert report["backends"] == {"qwen3-vl-8b-sf": 101, "qwen3-vl-8b-or": 1}
+    assert report["latency_s"]["p50"] == pytest.approx(0.5, abs=0.05)   # cached rows excluded
+    assert report["tokens"]["prompt_tokens"] == 100 * 1000
+    assert report["rows_with_usage"] == 100
+    assert report["retries"] == 2 and report["retries_per_100"] == pytest.approx(200 / 102)
+    assert report["escalated"] == 1
+    assert report["cost_usd"] == pytest.approx((100_000 * 0.25 + 1000 * 1.0) / 1e6)
+    assert report["wall_s"] is None and report["completion_tokens_per_s"] is None
+
+
+def test_structured_retries_avoided():
+    telemetry = RunTelemetry(timed=False)
+    telemetry.set_reference(rows=100, parse_retries=20)
+    for i in range(50):
+        telemetry.add(_row(structured="guided", retry_reasons=["no_coords"] if i == 0 else []))
+    structured = telemetry.report()["structured"]
+    assert structured["modes"] == {"guided": 50}
+    assert structured["free_parse_rate"] == 0.2
+    assert structured["parse_retries_avoided"] == pytest.approx(50 * 0.2 - 1)
+    assert RunTelemetry(timed=False).report()["structured"] is None
+
+
+def test_save_writes_json_and_prometheus(telemetry, tmp_path):
+    output = str(tmp_path / "results_Original_qwen3-vl-8b-sf.jsonl")
+    report = telemetry.save(output, labels={"model": 'qwen "8b"'})
+    with open(telemetry_path(output), encoding="utf-8") as f:
+        assert json.load(f)["rows"] == report["rows"]
+    with open(prom_path(output), encoding="utf-8") as f:
+        prom = f.read()
+    assert '# TYPE signpost_requests_total counter' in prom
+    assert 'signpost_requests_total{model="qwen \\"8b\\"",status="ok"} 100' in prom
+    assert 'signpost_request_latency_seconds{model="qwen \\"8b\\"",quantile="0.99"}' in prom
+
+
+def test_prometheus_skips_unknown_values():
+    report = RunTelemetry(timed=False).report()
+    prom = to_prometheus(report, {})
+    assert "completion_tokens_per_second" not in prom and "cost_usd_total" not in prom
+
+
+def test_format_report(telemetry):
+    lines = format_report(telemetry.report())
+    assert lines[0].startswith("Latency: p50 ")
+    assert any(line.startswith("Backends: ") for line in lines)
+    assert lines[-1].startswith("Cost: $")
+
+
+def test_parse_retry_counts(tmp_path):
+    path = tmp_path / "results.jsonl"
+    rows = [_row(retry_reasons=["no_coords", "no_coords"]), _row(structured="stop", retry_reasons=["no_coords"]),
+            _row(status="cached"), {"filename": "old.jpg"}]
+    path.write_text("\n".join(json.dumps(r) for r in rows) + "\n{broken\n", encoding="utf-8")
+    assert parse_retry_counts(str(path)) == (1, 2)
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+from evaluation.token_profile import (DEFAULT_MAX_TOKENS, MAX_MAX_TOKENS, MIN_MAX_TOKENS, MIN_SAMPLES,
+                                      TokenProfileStore, _quantile, _round_up, apply_limits)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TokenProfileStore(str(tmp_path / "profile" / "token_profile.sqlite"))
+    yield store
+    store.close()
+
+
+def _row(**fields):
+    row = {"backend": "m", "status": "ok", "attempts": 1, "completion_tokens": 20, "reasoning_tokens": None,
+           "retry_reasons": [], "truncated": 0}
+    row.update(fields)
+    return row
+
+
+def test_quantile_and_rounding():
+    assert _quantile(list(range(1, 101)), 0.99) == 99
+    assert _quantile([7], 0.5) == 7
+    assert _round_up(20) == MIN_MAX_TOKENS
+    assert _round_up(300) == 512 and _round_up(512) == 512
+    assert _round_up(10 ** 6) == MAX_MAX_TOKENS
+
+
+def test_no_limits_before_min_samples(store):
+    for _ in range(MIN_SAMPLES - 1):
+        store.record("m", 20)
+    assert store.limits("m") is None
+    store.record("m", 20)
+    assert store.limits("m").max_tokens == MIN_MAX_TOKENS
+
+
+def test_limits_from_p99_with_margin(store):
+    for tokens in range(1, 101):
+        store.record("m", tokens * 4, reasoning_tokens=tokens * 10)
+    limits = store.limits("m", thinking=True)
+    # p99 = 396 completion / 990 reasoning tokens, +25%
+    assert limits.max_tokens == 512 and limits.reasoning_budget == 2048
+    assert store.limits("m").reasoning_budget is None
+    assert (limits.samples, limits.truncated) == (100, 0)
+
+
+def test_truncated_samples_keep_the_default(store):
+    for _ in range(100):
+        store.record("m", 20)
+    store.record("m", None, truncated=True)                 # 1 in 101: within the 1% tolerance
+    assert store.limits("m").max_tokens == MIN_MAX_TOKENS
+    store.record("m", None, truncated=True)
+    limits = store.limits("m")
+    assert limits.max_tokens == DEFAULT_MAX_TOKENS and limits.truncated == 2
+
+
+def test_record_row_samples_clean_single_attempts(store):
+    assert store.record_row(_row()) == 1
+    assert store.record_row(_row(attempts=2)) == 0
+    assert store.record_row(_row(status="cached")) == 0
+    assert store.record_row(_row(backend=None)) == 0
+    assert store.record_row(_row(completion_tokens=None)) == 0
+    assert store.samples("m") == [(20, None, 0)]
+
+
+def test_record_row_counts_truncated_attempts_of_any_model(store):
+    assert store.record_row(_row(truncated=2, attempts=3)) == 2
+    assert store.record_row(_row(truncated=1)) == 1
+    assert sorted(store.samples("m")) == [(None, None, 1)] * 3
+
+
+def test_record_row_reads_runaways_of_old_rows(store):
+    old = _row(retry_reasons=["runaway", "no_coords"], status="runaway", attempts=2)
+    del old["truncated"]
+    assert store.record_row(old) == 2
+
+
+def test_models_and_count(store):
+    store.record("b", 1)
+    store.record("a", 1)
+    store.record("a", 2)
+    assert store.models() == ["a", "b"]
+    assert store.count("a") == 2
+
+
+def test_apply_limits_to_every_backend(store):
+    for _ in range(MIN_SAMPLES):
+        store.record("a", 300, reasoning_tokens=1000)
+    a = SimpleNamespace(backend="a", is_thinking_model=True, max_tokens=2048, reasoning_budget=None)
+    b = SimpleNamespace(backend="b", is_thinking_model=False, max_tokens=2048, reasoning_budget=None)
+    applied = apply_limits(SimpleNamespace(clients=[a, b]), store)
+    assert len(applied) == 1 and applied[0].startswith("a: max_tokens 512")
+    assert (a.max_tokens, a.reasoning_budget) == (512, 2048)
+    assert b.max_tokens == 2048
+
+
+def test_explicit_reasoning_budget_is_kept(store):
+    for _ in range(MIN_SAMPLES):
+        store.record("a", 300, reasoning_tokens=1000)
+    a = SimpleNamespace(backend="a", is_thinking_model=True, max_tokens=2048, reasoning_budget=4096)
+    apply_limits(a, store)
+    assert (a.max_tokens, a.reasoning_budget) == (512, 4096)